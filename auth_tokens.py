@@ -0,0 +1,101 @@
+# auth_tokens.py
+# Stateless bearer tokens and an in-process user profile cache for the auth
+# service.
+#
+# A token is the user's profile (id, username, email, created_at) signed
+# with the app secret and timestamped (itsdangerous), so any instance that
+# shares the secret can answer /me from the token alone. Tokens expire after
+# `max_age` seconds. The itsdangerous timestamp has whole-second resolution,
+# so the exact issue time is signed in as well (claim 'iat').
+#
+# UserCache holds profiles looked up from the database for cookie sessions.
+# Writers call invalidate(user_id) after changing a user: the cached profile
+# is dropped, and tokens of that user issued before the change are no longer
+# trusted for their claims in this process (the profile is read again).
+
+import threading
+import time
+from collections import OrderedDict
+
+from itsdangerous import BadSignature, SignatureExpired, URLSafeTimedSerializer
+
+PROFILE_FIELDS = ('id', 'username', 'email', 'created_at')
+
+
+class TokenSigner:
+    """Issue and verify signed, expiring tokens carrying a user profile."""
+
+    def __init__(self, secret, max_age=900, salt='auth-token'):
+        self.max_age = max_age
+        self._serializer = URLSafeTimedSerializer(secret, salt=salt)
+
+    def issue(self, profile):
+        claims = {field: profile[field] for field in PROFILE_FIELDS}
+        claims['iat'] = time.time()
+        return self._serializer.dumps(claims)
+
+    def verify(self, token):
+        """(profile, issued_at) of a valid token, or (None, None) if it is forged or expired."""
+        try:
+            profile, issued = self._serializer.loads(token, max_age=self.max_age, return_timestamp=True)
+        except (SignatureExpired, BadSignature):
+            return None, None
+        # tokens without 'iat' predate it: fall back to the whole-second timestamp
+        return profile, profile.pop('iat', issued.timestamp())
+
+
+class UserCache:
+    """LRU cache of user profiles by id, with a TTL and explicit invalidation."""
+
+    def __init__(self, max_entries=10000, ttl=60.0):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._invalidated = OrderedDict()  # user id -> wall-clock time of the last update
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, user_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(user_id)
+            if entry is not None:
+                profile, expires = entry
+                if expires > now:
+                    self._data.move_to_end(user_id)
+                    self.hits += 1
+                    return profile
+                del self._data[user_id]
+            self.misses += 1
+        return None
+
+    def put(self, user_id, profile):
+        with self._lock:
+            self._data[user_id] = (profile, time.monotonic() + self.ttl)
+            self._data.move_to_end(user_id)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._data.pop(user_id, None)
+            self._invalidated[user_id] = time.time()
+            self._invalidated.move_to_end(user_id)
+            while len(self._invalidated) > self.max_entries:
+                self._invalidated.popitem(last=False)
+            self.invalidations += 1
+
+    def is_stale(self, user_id, issued_at):
+        """True if the user changed after a token issued at `issued_at` (seconds since the epoch)."""
+        with self._lock:
+            changed = self._invalidated.get(user_id)
+        # issued_at is the token's exact 'iat', so a token issued right after
+        # the update (e.g. the one PUT /me returns) is fresh
+        return changed is not None and issued_at < changed
+
+    def stats(self):
+        with self._lock:
+            return {'entries': len(self._data), 'hits': self.hits, 'misses': self.misses,
+                    'invalidations': self.invalidations}
@@ -0,0 +1,111 @@
+# bench_auth.py
+# Load test of the auth service: /register, /login and /me (cookie session
+# and bearer token) throughput and p50/p95/p99 latency at several concurrency levels, against serve.py auth
+# (gunicorn) on a throwaway database.
+#
+#   python bench_auth.py [--concurrency 1 4 16] [--duration 5] [--workers 2 --threads 8] [--json out.json]
+
+import argparse
+import http.client
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+from bench_suite import _free_port, _wait_healthy, load_test, post_json
+
+
+def register_users(port, users):
+    """Create `users` accounts and log each in once; returns their session cookies and tokens."""
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+    cookies, tokens = [], []
+    for k in range(users):
+        body = json.dumps({'username': f'user{k}', 'password': f'password{k}',
+                           'email': f'user{k}@example.com'}).encode()
+        post_json(conn, '/register', body)
+        conn.request('POST', '/login', body=body, headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        data = json.loads(response.read())
+        if response.status != 200:
+            raise SystemExit(f'login of user{k} failed with {response.status}')
+        cookies.append(response.getheader('Set-Cookie').split(';')[0])
+        tokens.append(data['token'])
+    conn.close()
+    return cookies, tokens
+
+
+def scenarios(users, cookies, tokens):
+    logins = [json.dumps({'username': f'user{k}', 'password': f'password{k}'}).encode() for k in range(users)]
+
+    def register(conn, k, i):
+        # unique accounts: concurrent writers on one database
+        body = json.dumps({'username': f'load-{os.getpid()}-{k}-{i}', 'password': 'secret'}).encode()
+        return post_json(conn, '/register', body)[0]
+
+    def login(conn, k, i):
+        return post_json(conn, '/login', logins[i % users])[0]
+
+    def get_me(conn, headers):
+        conn.request('GET', '/me', headers=headers)
+        response = conn.getresponse()
+        response.read()
+        return response.status
+
+    def me(conn, k, i):
+        return get_me(conn, {'Cookie': cookies[i % users]})
+
+    def me_token(conn, k, i):
+        return get_me(conn, {'Authorization': f'Bearer {tokens[i % users]}'})
+
+    return {'register': register, 'login': login, 'me': me, 'me_token': me_token}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the auth service')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--duration', type=float, default=5.0, help='seconds per scenario after a 1 s warm-up')
+    parser.add_argument('--users', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--scenarios', nargs='+', choices=('register', 'login', 'me', 'me_token'),
+                        default=['register', 'login', 'me', 'me_token'])
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp(prefix='bench_auth-')
+    port = _free_port()
+    env = dict(os.environ, AUTH_DB_PATH=os.path.join(tmp, 'users.db'))
+    log = open(os.path.join(tmp, 'server.log'), 'w')
+    proc = subprocess.Popen([sys.executable, 'serve.py', 'auth', '--host', '127.0.0.1', '--port', str(port),
+                             '--workers', str(args.workers), '--threads', str(args.threads)],
+                            env=env, stdout=log, stderr=subprocess.STDOUT)
+    results = {}
+    try:
+        if not _wait_healthy(port, proc):
+            raise SystemExit(f'auth server did not start, see {log.name}')
+        cookies, tokens = register_users(port, args.users)
+        sends = scenarios(args.users, cookies, tokens)
+        print(f"{'scenario':<10} {'clients':>7} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        for name in args.scenarios:
+            for concurrency in args.concurrency:
+                stats = load_test(port, sends[name], concurrency, args.duration)
+                results[f'{name}/clients={concurrency}'] = stats
+                errors = stats['connection_errors'] + sum(
+                    count for status, count in stats['statuses'].items() if not status.startswith('2'))
+                print(f"{name:<10} {concurrency:>7} {stats['throughput_rps']:>9.1f} {stats.get('p50_ms', 0):>9.2f} "
+                      f"{stats.get('p95_ms', 0):>9.2f} {stats.get('p99_ms', 0):>9.2f} {errors:>7}")
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        log.close()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'workers': args.workers, 'threads': args.threads, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
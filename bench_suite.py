@@ -0,0 +1,469 @@
+# bench_suite.py
+# End-to-end benchmarks of the prediction service:
+#   lookup    csv_yield_lookup.lookup_yield / lookup_yields at several table sizes
+#   spatial   spatial_index kNN / radius queries and inserts at several index sizes
+#   encode    encode_features for one row and ENCODER.encode for a batch
+#   models    every model's predict for 1 row and for batches
+#   flask     /predict, /predict/batch and /recommend through the Flask test client
+#   server    /predict against serve.py (gunicorn) under concurrent keep-alive load
+#
+#   python bench_suite.py [--quick] [--only lookup models] [--json bench_results.json]
+#   python bench_suite.py --update-baseline      # store this run as bench_baseline.json
+#
+# SoilGrids is replaced by a local HTTP stub (--soil-latency-ms per request),
+# and all inputs come from fixed seeds, so runs on one machine are
+# comparable. Every result is written to --json. When --baseline exists, p50
+# and p95 latencies that grew, or throughputs that fell, by more than
+# --tolerance are reported and the exit status is 1.
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from bench_tree_engine import random_features
+
+SUITES = ('lookup', 'spatial', 'encode', 'models', 'flask', 'server')
+# metric -> True when larger is better
+COMPARED = {'p50_ms': False, 'p95_ms': False, 'ops_per_s': True, 'rows_per_s': True, 'throughput_rps': True}
+LOCATION_BOX = ((15.0, 25.0), (75.0, 88.0))  # lat, lon range of generated requests
+
+
+class _SoilHandler(BaseHTTPRequestHandler):
+    latency = 0.0
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        body = json.dumps({'properties': {'ocd': {'values': [{'value': 1.2}]},
+                                          'phh2o': {'values': [{'value': 6.8}]}}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_soil_stub(latency_ms):
+    """Serve canned SoilGrids responses on a free local port; returns the server."""
+    handler = type('SoilHandler', (_SoilHandler,), {'latency': latency_ms / 1000.0})
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def summarize(latencies, rows=1):
+    """Latency percentiles (ms) and throughput of a list of per-call seconds."""
+    lat = np.asarray(latencies, dtype=np.float64)
+    total = lat.sum()
+    stats = {
+        'calls': len(lat),
+        'mean_ms': float(lat.mean() * 1e3),
+        'p50_ms': float(np.percentile(lat, 50) * 1e3),
+        'p95_ms': float(np.percentile(lat, 95) * 1e3),
+        'p99_ms': float(np.percentile(lat, 99) * 1e3),
+        'ops_per_s': float(len(lat) / total) if total else None,
+    }
+    if rows > 1:
+        stats['rows_per_s'] = float(len(lat) * rows / total) if total else None
+    return stats
+
+
+def measure(fn, calls, min_seconds, min_calls=20, rows=1):
+    """Time fn(*args) for each args in `calls` (cycling) for at least min_seconds."""
+    fn(*calls[0])  # warm-up
+    latencies = []
+    deadline = time.perf_counter() + min_seconds
+    k = 0
+    while len(latencies) < min_calls or time.perf_counter() < deadline:
+        args = calls[k % len(calls)]
+        start = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - start)
+        k += 1
+    return summarize(latencies, rows)
+
+
+def random_requests(n, seed, soils, crops, irrigations, model='csv'):
+    rng = np.random.default_rng(seed)
+    (lat0, lat1), (lon0, lon1) = LOCATION_BOX
+    return [{'soil_type': soils[rng.integers(len(soils))], 'crop_type': crops[rng.integers(len(crops))],
+             'irrigation_type': irrigations[rng.integers(len(irrigations))],
+             'acres': round(float(rng.uniform(0.5, 50)), 2),
+             'lat': round(float(rng.uniform(lat0, lat1)), 4), 'lon': round(float(rng.uniform(lon0, lon1)), 4),
+             'model': model} for _ in range(n)]
+
+
+def yield_table(rows, seed):
+    """A synthetic (soil, crop, irrigation) -> yield_per_acre table with `rows` distinct keys."""
+    side = int(np.ceil(rows ** (1 / 3)))
+    s, c, i = np.unravel_index(np.arange(rows), (side, side, side))
+    return pd.DataFrame({
+        'soil_type': pd.Series(s).map('soil{}'.format), 'crop_type': pd.Series(c).map('crop{}'.format),
+        'irrigation_type': pd.Series(i).map('irr{}'.format),
+        'yield_per_acre': np.random.default_rng(seed).uniform(0.5, 5.0, rows).round(2),
+    })
+
+
+def bench_lookup(args):
+    import csv_yield_lookup
+    results = {}
+    original = csv_yield_lookup.yield_index
+    batch = 1000 if args.quick else 10000
+    try:
+        for rows in args.table_sizes:
+            df = yield_table(rows, args.seed)
+            csv_yield_lookup.yield_index = csv_yield_lookup.YieldIndex(df)
+            pick = np.random.default_rng(args.seed).integers(0, rows, max(batch, 1000))
+            keys = df[['soil_type', 'crop_type', 'irrigation_type']].to_numpy()[pick]
+            results[f'lookup_yield/rows={rows}'] = measure(
+                csv_yield_lookup.lookup_yield, [tuple(k) for k in keys], args.min_seconds)
+            columns = tuple(list(col) for col in keys[:batch].T)
+            results[f'lookup_yields/rows={rows}/batch={batch}'] = measure(
+                csv_yield_lookup.lookup_yields, [columns], args.min_seconds, min_calls=5, rows=batch)
+    finally:
+        csv_yield_lookup.yield_index = original
+    return results
+
+
+def bench_spatial(args):
+    from spatial_index import SpatialYieldIndex
+    results = {}
+    batch = 1000 if args.quick else 10000
+    crops, irrigations = ['wheat', 'rice', 'maize', 'cotton'], ['drip', 'rainfed']
+    (lat0, lat1), (lon0, lon1) = LOCATION_BOX
+    for points in args.table_sizes:
+        rng = np.random.default_rng(args.seed)
+        index = SpatialYieldIndex()
+        index.insert(rng.choice(crops, points), rng.choice(irrigations, points), rng.uniform(lat0, lat1, points),
+                     rng.uniform(lon0, lon1, points), rng.uniform(0.5, 5.0, points))
+        index.compact()
+        lats, lons = rng.uniform(lat0, lat1, batch), rng.uniform(lon0, lon1, batch)
+        results[f'spatial_knn/points={points}'] = measure(
+            index.knn, [(a, b, 'wheat', 'drip') for a, b in zip(lats, lons)], args.min_seconds)
+        results[f'spatial_knn_many/points={points}/batch={batch}'] = measure(
+            index.knn_many, [(lats, lons, 'wheat', 'drip')], args.min_seconds, min_calls=5, rows=batch)
+        results[f'spatial_radius_many/points={points}/batch={batch}'] = measure(
+            index.radius_many, [(lats, lons, 'wheat', 'drip', 10.0)], args.min_seconds, min_calls=5, rows=batch)
+        new = [(['wheat'] * 100, ['drip'] * 100, rng.uniform(lat0, lat1, 100), rng.uniform(lon0, lon1, 100),
+                rng.uniform(0.5, 5.0, 100)) for _ in range(50)]
+        results[f'spatial_insert/points={points}/rows=100'] = measure(
+            index.insert, new, args.min_seconds, rows=100)
+    return results
+
+
+def bench_encode(args, predictor, requests):
+    from feature_encoder import ENCODER
+    results = {}
+    calls = [(r['soil_type'], r['crop_type'], r['irrigation_type'], r['acres'], r['lat'], r['lon'], (1.2, 6.8))
+             for r in requests]
+    results['encode_features'] = measure(predictor.encode_features, calls, args.min_seconds)
+    for size in args.batch_sizes:
+        if size > 1:
+            rows = [dict(r, oc=1.2, ph=6.8) for r in (requests * (size // len(requests) + 1))[:size]]
+            results[f'encode/batch={size}'] = measure(ENCODER.encode, [(rows,)], args.min_seconds,
+                                                      min_calls=5, rows=size)
+    return results
+
+
+def _num_features(model):
+    for attr in ('num_features', 'n_features_in_'):
+        value = getattr(model, attr, None)
+        if isinstance(value, (int, np.integer)):
+            return int(value)
+    if hasattr(model, 'num_feature'):  # lightgbm.Booster
+        return model.num_feature()
+    if hasattr(model, 'landmarks_'):  # kernel_approx
+        return model.landmarks_.shape[1]
+    return model.weights_.shape[0]
+
+
+def bench_models(args, predictor):
+    results = {}
+    for name in predictor.registry.names():
+        model = predictor.registry.get(name)
+        if model is None:
+            print(f"  skipping {name}: {predictor.registry.error(name)}")
+            continue
+        X = random_features(max(args.batch_sizes), _num_features(model), seed=args.seed)
+        for size in args.batch_sizes:
+            calls = [(X[k:k + 1],) for k in range(min(len(X), 1000))] if size == 1 else [(X[:size],)]
+            results[f'model/{name}/batch={size}'] = measure(model.predict, calls, args.min_seconds,
+                                                            min_calls=20 if size == 1 else 5, rows=size)
+    return results
+
+
+def bench_flask(args, predictor, requests):
+    client = predictor.app.test_client()
+    results = {}
+
+    def post(path, body):
+        response = client.post(path, json=body)
+        if response.status_code >= 500:
+            raise RuntimeError(f'{path} returned {response.status_code}: {response.get_data(as_text=True)}')
+
+    results['flask/predict'] = measure(post, [('/predict', r) for r in requests], args.min_seconds)
+    for model in ('csv', 'lgb'):
+        fields = [{'soil_type': r['soil_type'], 'acres': r['acres'], 'lat': r['lat'], 'lon': r['lon'],
+                   'model': model, 'k': 5} for r in requests]
+        results[f'flask/recommend/{model}'] = measure(post, [('/recommend', f) for f in fields], args.min_seconds)
+    size = 100
+    for model in ('csv', 'lgb', 'xgb', 'svm'):
+        if model != 'csv' and predictor.registry.get(predictor._registry_key(model, predictor.DEFAULT_ENGINE)) is None:
+            continue
+        chunks = [[dict(r, model=model) for r in requests[k:k + size]] for k in range(0, len(requests), size)]
+        results[f'flask/predict_batch/{model}/batch={size}'] = measure(
+            post, [('/predict/batch', c) for c in chunks if len(c) == size], args.min_seconds,
+            min_calls=5, rows=size)
+    return results
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_healthy(port, proc, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if proc is not None and proc.poll() is not None:
+            return False
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/health')
+            ok = conn.getresponse().status == 200
+            conn.close()
+            if ok:
+                return True
+        except OSError:
+            pass
+        time.sleep(0.2)
+    return False
+
+
+def post_json(conn, path, body, headers=None):
+    """POST pre-encoded JSON on a keep-alive connection; returns (status, response)."""
+    conn.request('POST', path, body=body, headers=dict(headers or {}, **{'Content-Type': 'application/json'}))
+    response = conn.getresponse()
+    response.read()
+    return response.status, response
+
+
+def load_test(port, send, concurrency, duration, warmup=1.0):
+    """Keep `concurrency` keep-alive clients calling send(conn, client, i) for `duration` seconds.
+
+    send issues one request and returns its HTTP status; client k makes
+    calls i = k, k + concurrency, ... Only 2xx responses count as throughput.
+    """
+    latencies, statuses, errors = [], {}, [0]
+    lock = threading.Lock()
+    start = time.perf_counter()
+    measure_from, stop_at = start + warmup, start + warmup + duration
+
+    def client(k):
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        mine, codes, failed = [], {}, 0
+        i = k
+        while True:
+            sent = time.perf_counter()
+            if sent >= stop_at:
+                break
+            try:
+                status = send(conn, k, i)
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                status = None
+            done = time.perf_counter()
+            if sent >= measure_from:
+                if status is None:
+                    failed += 1
+                else:
+                    mine.append(done - sent)
+                    codes[status] = codes.get(status, 0) + 1
+            i += concurrency
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+            for status, count in codes.items():
+                statuses[str(status)] = statuses.get(str(status), 0) + count
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(k,)) for k in range(concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stats = summarize(latencies) if latencies else {'calls': 0}
+    stats.pop('ops_per_s', None)
+    ok = sum(count for status, count in statuses.items() if status.startswith('2'))
+    stats.update(throughput_rps=ok / duration, concurrency=concurrency, duration_s=duration,
+                 statuses=statuses, connection_errors=errors[0])
+    return stats
+
+
+def bench_server(args, requests, soil_url):
+    port = _free_port()
+    env = dict(os.environ, SOILGRIDS_URL=soil_url)
+    log = tempfile.NamedTemporaryFile(prefix='bench_server-', suffix='.log', delete=False)
+    cmd = [sys.executable, 'serve.py', 'predictor', '--host', '127.0.0.1', '--port', str(port),
+           '--workers', str(args.server_workers), '--threads', str(args.server_threads)]
+    proc = subprocess.Popen(cmd, env=env, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        if not _wait_healthy(port, proc):
+            print(f"  server did not start, see {log.name}")
+            return {}
+        bodies = [json.dumps(r).encode() for r in requests]
+        stats = load_test(port, lambda conn, k, i: post_json(conn, '/predict', bodies[i % len(bodies)])[0],
+                          args.concurrency, args.duration)
+        stats.update(workers=args.server_workers, threads=args.server_threads)
+        return {'server/predict': stats}
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+        log.close()
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, tolerance):
+    """Metrics that are worse than the baseline by more than `tolerance` (a fraction)."""
+    regressions = []
+    for name, stats in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        for metric, higher_is_better in COMPARED.items():
+            old, new = base.get(metric), stats.get(metric)
+            if not old or new is None:
+                continue
+            change = new / old - 1
+            if (change < -tolerance) if higher_is_better else (change > tolerance):
+                regressions.append({'benchmark': name, 'metric': metric, 'baseline': old,
+                                    'current': new, 'change': change})
+    return regressions
+
+
+def print_results(results):
+    print(f"{'benchmark':<46} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'ops/s':>10} {'rows/s':>12}")
+    for name, s in results.items():
+        if 'p50_ms' not in s:
+            continue
+        ops = s.get('throughput_rps', s.get('ops_per_s'))
+        rows = s.get('rows_per_s')
+        print(f"{name:<46} {s['p50_ms']:>10.3f} {s['p95_ms']:>10.3f} {s['p99_ms']:>10.3f} "
+              f"{ops:>10.1f} {(f'{rows:.0f}' if rows else '-'):>12}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the yield prediction service end to end')
+    parser.add_argument('--only', nargs='+', choices=SUITES, default=list(SUITES))
+    parser.add_argument('--quick', action='store_true', help='smaller tables and shorter runs (smoke test)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--min-seconds', type=float, default=1.0, help='minimum time per benchmark')
+    parser.add_argument('--table-sizes', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100, 10000])
+    parser.add_argument('--soil-latency-ms', type=float, default=5.0, help='delay of the SoilGrids stub')
+    parser.add_argument('--server-workers', type=int, default=2)
+    parser.add_argument('--server-threads', type=int, default=4)
+    parser.add_argument('--concurrency', type=int, default=16, help='concurrent clients in the load test')
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds of load after a 1 s warm-up')
+    parser.add_argument('--json', default='bench_results.json', help='write results to this file')
+    parser.add_argument('--baseline', default='bench_baseline.json')
+    parser.add_argument('--update-baseline', action='store_true', help='store these results as the baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed relative slowdown before a result counts as a regression')
+    args = parser.parse_args()
+    if args.quick:
+        args.min_seconds = min(args.min_seconds, 0.2)
+        args.table_sizes = [n for n in args.table_sizes if n <= 100000] or [1000]
+        args.batch_sizes = [n for n in args.batch_sizes if n <= 1000] or [1, 100]
+        args.duration = min(args.duration, 2.0)
+
+    # the stub must be configured before ml_yield_predictor creates its soil client
+    soil = start_soil_stub(args.soil_latency_ms)
+    soil_url = f'http://127.0.0.1:{soil.server_address[1]}/soilgrids/v2.0/properties/query'
+    os.environ['SOILGRIDS_URL'] = soil_url
+    os.environ.setdefault('SOIL_TILE_DIR', os.path.join(tempfile.gettempdir(), 'bench-no-soil-tiles'))
+    import logging
+    import csv_yield_lookup
+    import ml_yield_predictor as predictor
+    logging.getLogger().setLevel(logging.WARNING)  # per-request INFO logs would dominate the timings
+
+    index = csv_yield_lookup.yield_index
+    requests = random_requests(2000, args.seed, list(index.soils), list(index.crops), list(index.irrigations))
+
+    results = {}
+    for suite in args.only:
+        print(f"Running {suite} benchmarks...")
+        if suite == 'lookup':
+            results.update(bench_lookup(args))
+        elif suite == 'spatial':
+            results.update(bench_spatial(args))
+        elif suite == 'encode':
+            results.update(bench_encode(args, predictor, requests))
+        elif suite == 'models':
+            results.update(bench_models(args, predictor))
+        elif suite == 'flask':
+            results.update(bench_flask(args, predictor, requests))
+        elif suite == 'server':
+            results.update(bench_server(args, requests, soil_url))
+    soil.shutdown()
+    print_results(results)
+
+    report = {
+        'meta': {'timestamp': time.time(), 'commit': _git_commit(), 'python': platform.python_version(),
+                 'numpy': np.__version__, 'platform': platform.platform(), 'cpus': os.cpu_count(),
+                 'args': vars(args)},
+        'results': results,
+    }
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline['meta'].get('cpus') != report['meta']['cpus'] or \
+            baseline['meta'].get('platform') != report['meta']['platform']:
+        print("Warning: baseline was recorded on a different machine")
+    regressions = compare(results, baseline['results'], args.tolerance)
+    for r in regressions:
+        print(f"REGRESSION {r['benchmark']} {r['metric']}: {r['baseline']:.4g} -> {r['current']:.4g} "
+              f"({r['change']:+.0%})")
+    if regressions:
+        raise SystemExit(1)
+    print(f"No regressions beyond {args.tolerance:.0%} against {args.baseline}")
+
+
+if __name__ == '__main__':
+    main()
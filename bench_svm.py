@@ -0,0 +1,71 @@
+# bench_svm.py
+# Compares the approximate-kernel SVM backend (kernel_approx) with the
+# sklearn SVR on synthetic rows shaped like the SVM's four input columns:
+# fit time, prediction time per batch size and holdout RMSE.
+#
+#   python bench_svm.py [--train-sizes 2000 10000 50000] [--svr-max-rows 20000] [--json out.json]
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+from bench_tree_engine import _time, random_features
+from feature_encoder import SVM_FEATURES
+from kernel_approx import ApproxKernelRegressor
+
+
+def synthetic_yield(X, seed=0):
+    """A smooth nonlinear target over (soil, crop, irrigation, acres) plus noise."""
+    rng = np.random.default_rng(seed)
+    return (1.5 + 0.05 * X[:, 0] + 0.3 * np.sin(X[:, 1] / 3.0) - 0.2 * X[:, 2]
+            + 0.4 * np.log1p(X[:, 3]) + rng.normal(0, 0.05, len(X)))
+
+
+def models(include_svr):
+    if include_svr:
+        from sklearn.svm import SVR
+        yield 'svr', SVR()
+    yield 'nystroem', ApproxKernelRegressor('nystroem', 500)
+    yield 'rff', ApproxKernelRegressor('rff', 500)
+
+
+def run(train_rows, batch_sizes, svr_max_rows, test_rows=10000):
+    columns = len(SVM_FEATURES)
+    X = random_features(train_rows + test_rows, columns, seed=train_rows)
+    y = synthetic_yield(X)
+    X_train, y_train, X_test, y_test = X[:train_rows], y[:train_rows], X[train_rows:], y[train_rows:]
+    report = {'train_rows': train_rows, 'models': []}
+    print(f"train rows: {train_rows}")
+    print(f"{'model':>10} {'fit s':>8} {'rmse':>8} " + ' '.join(f"{f'{n} rows ms':>13}" for n in batch_sizes))
+    for name, model in models(train_rows <= svr_max_rows):
+        start = time.perf_counter()
+        model.fit(X_train, y_train)
+        fit_s = time.perf_counter() - start
+        rmse = float(np.sqrt(np.mean((model.predict(X_test) - y_test) ** 2)))
+        predict_s = {n: _time(model.predict, X_test[:n], min_seconds=0.1) for n in batch_sizes}
+        report['models'].append({'model': name, 'fit_s': fit_s, 'rmse': rmse,
+                                 'support_vectors': len(getattr(model, 'support_', [])) or None,
+                                 'predict_s': predict_s})
+        print(f"{name:>10} {fit_s:>8.2f} {rmse:>8.4f} " + ' '.join(f"{predict_s[n] * 1e3:>13.3f}" for n in batch_sizes))
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare the approximate-kernel SVM with sklearn SVR')
+    parser.add_argument('--train-sizes', type=int, nargs='+', default=[2000, 10000, 50000])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 100, 10000])
+    parser.add_argument('--svr-max-rows', type=int, default=20000,
+                        help='skip the exact SVR above this many training rows')
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    reports = [run(n, args.batch_sizes, args.svr_max_rows) for n in args.train_sizes]
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
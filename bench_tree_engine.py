@@ -0,0 +1,94 @@
+# bench_tree_engine.py
+# Checks tree_engine against the native LightGBM / XGBoost predictors and
+# times both for batch sizes from 1 to 100k rows.
+#
+#   python bench_tree_engine.py [--sizes 1 10 100 1000 10000 100000] [--json out.json]
+
+import argparse
+import json
+import time
+
+import numpy as np
+
+import tree_engine
+from feature_encoder import CROP_MAP, IRRIGATION_MAP, SOIL_MAP
+
+
+def random_features(n, num_features, seed=0, nan_fraction=0.0):
+    """Rows shaped like ml_yield_predictor's encoded features."""
+    rng = np.random.default_rng(seed)
+    columns = [
+        rng.integers(0, max(SOIL_MAP.values()) + 1, n),
+        rng.integers(0, max(CROP_MAP.values()) + 1, n),
+        rng.integers(0, max(IRRIGATION_MAP.values()) + 1, n),
+        rng.uniform(0.5, 50, n),
+        rng.uniform(20, 35, n),
+        rng.uniform(40, 90, n),
+        rng.uniform(0, 300, n),
+        rng.uniform(0.5, 2.0, n),
+        rng.uniform(5.5, 8.0, n),
+    ]
+    X = np.column_stack(columns[:num_features]).astype(np.float64)
+    if nan_fraction:
+        X[rng.random(X.shape) < nan_fraction] = np.nan
+    return X
+
+
+def _time(fn, X, min_seconds=0.2):
+    fn(X)  # warm-up
+    runs, start = 0, time.perf_counter()
+    while True:
+        fn(X)
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return elapsed / runs
+
+
+def load_native(kind, path):
+    if kind == 'lgb':
+        import lightgbm as lgb
+        return lgb.Booster(model_file=path)
+    import xgboost as xgb
+    model = xgb.XGBRegressor()
+    model.load_model(path)
+    return model
+
+
+def run(kind, path, sizes):
+    compiled = tree_engine.load_lgb_model(path) if kind == 'lgb' else tree_engine.load_xgb_model(path)
+    native = load_native(kind, path)
+    X = random_features(max(sizes), compiled.num_features, nan_fraction=0.02)
+    max_err = float(np.abs(native.predict(X[:10000]) - compiled.predict(X[:10000])).max())
+    report = {'model': kind, 'path': path, 'trees': compiled.num_trees, 'depth': compiled.depth,
+              'max_abs_error': max_err, 'sizes': []}
+    print(f"{kind}: {compiled.num_trees} trees, depth {compiled.depth}, max |native - compiled| = {max_err:.3g}")
+    print(f"{'rows':>8} {'native ms':>11} {'compiled ms':>12} {'speedup':>8}")
+    for n in sizes:
+        t_native = _time(native.predict, X[:n])
+        t_compiled = _time(compiled.predict, X[:n])
+        report['sizes'].append({'rows': n, 'native_s': t_native, 'compiled_s': t_compiled})
+        print(f"{n:>8} {t_native * 1e3:>11.3f} {t_compiled * 1e3:>12.3f} {t_native / t_compiled:>7.1f}x")
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare tree_engine with the native boosters')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 10, 100, 1000, 10000, 100000])
+    parser.add_argument('--lgb', default='lgb_yield_model.txt')
+    parser.add_argument('--xgb', default='xgb_yield_model.json')
+    parser.add_argument('--tolerance', type=float, default=1e-5)
+    parser.add_argument('--json', help='write results to this file')
+    args = parser.parse_args()
+
+    reports = [run('lgb', args.lgb, args.sizes), run('xgb', args.xgb, args.sizes)]
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(reports, f, indent=2)
+    bad = [r['model'] for r in reports if r['max_abs_error'] > args.tolerance]
+    if bad:
+        raise SystemExit(f"compiled predictions differ from native for: {', '.join(bad)}")
+
+
+if __name__ == '__main__':
+    main()
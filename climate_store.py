@@ -0,0 +1,368 @@
+# climate_store.py
+# Offline monthly climate normals (temp, humidity, rainfall) per grid cell,
+# so the encoder gets the weather of a farm's location and season instead of
+# fixed defaults, without calling a weather API.
+#
+# Layout of a store directory:
+#   manifest.json  grid origin, resolution, shape, layer names, dtype
+#   normals.npy    array of shape (n_lat, n_lon, 12, layers), NaN = no data,
+#                  loaded memory-mapped; float16 by default (~2 bytes per value)
+#   overrides.json optional recent observed weather, see below
+#
+# A lookup is one index computation and one gather, for a single point or a
+# whole batch. Points outside the grid or cells without data give NaN, which
+# the encoder replaces with its defaults.
+#
+# Recent observed weather can be layered on top: an override replaces the
+# normals of one cell and month until it expires. put_override() adds one to
+# this process only; `climate_store.py override` writes it to overrides.json,
+# which every store on the directory (each serving worker, score_farms.py)
+# reloads within override_check seconds of a change:
+#   python climate_store.py override --lat 20.3 --lon 85.8 --temp 34.5 --rainfall 0 --ttl 86400
+#
+# Build a store from a CSV with lat, lon, month, temp, humidity, rainfall
+# columns (observations are averaged per cell and month):
+#   python climate_store.py build --csv station_monthly.csv --out climate
+# or a synthetic store for testing:
+#   python climate_store.py build --synthetic 8 34 68 97 --out climate
+
+import argparse
+import datetime
+import json
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+LAYERS = ['temp', 'humidity', 'rainfall']
+MANIFEST = 'manifest.json'
+DATA = 'normals.npy'
+OVERRIDES = 'overrides.json'
+
+
+def current_month():
+    return datetime.date.today().month
+
+
+def _month(month):
+    """A month number (1-12); missing or invalid values mean this month."""
+    try:
+        m = int(month)
+    except (TypeError, ValueError):
+        return current_month()
+    return m if 1 <= m <= 12 else current_month()
+
+
+def _months(month, n):
+    """Month numbers (1-12) as an int array of length n; missing or invalid values mean this month."""
+    if month is None or np.ndim(month) == 0:
+        return np.full(n, _month(month), dtype=np.int64)
+    m = np.asarray(month)
+    if m.dtype.kind not in 'iuf':
+        m = pd.to_numeric(pd.Series(m, dtype='object'), errors='coerce').to_numpy(np.float64)
+    valid = (m >= 1) & (m <= 12)
+    return np.where(valid, m, current_month()).astype(np.int64) if not valid.all() else m.astype(np.int64)
+
+
+class ClimateStore:
+    """Read-only monthly normals over a directory written by build_store(), plus an override cache."""
+
+    def __init__(self, path, override_size=10000, override_ttl=6 * 3600, override_check=5.0):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        self.lat0 = float(manifest['lat0'])
+        self.lon0 = float(manifest['lon0'])
+        self.resolution = float(manifest['resolution'])
+        self.layers = manifest['layers']
+        self.normals = np.load(os.path.join(path, DATA), mmap_mode='r')
+        self.n_lat, self.n_lon = self.normals.shape[:2]
+        self.override_size = override_size
+        self.override_ttl = override_ttl
+        self._overrides = OrderedDict()  # (flat cell, month) -> (values, expires)
+        self._override_cells = None  # sorted cells with an override, rebuilt after changes
+        self._lock = threading.Lock()
+        self.override_check = override_check
+        self._overrides_mtime = None
+        self._next_override_check = 0.0
+        self._refresh_overrides()
+
+    def _cells(self, lat, lon):
+        i = np.floor((lat - self.lat0) / self.resolution)
+        j = np.floor((lon - self.lon0) / self.resolution)
+        inside = (i >= 0) & (i < self.n_lat) & (j >= 0) & (j < self.n_lon)
+        return np.where(inside, i, 0).astype(np.int64), np.where(inside, j, 0).astype(np.int64), inside
+
+    def _refresh_overrides(self):
+        # reload overrides.json when it changed, stat-ing it at most every override_check seconds
+        now = time.monotonic()
+        if now < self._next_override_check:
+            return
+        self._next_override_check = now + self.override_check
+        path = os.path.join(self.path, OVERRIDES)
+        try:
+            mtime = os.path.getmtime(path)
+        except OSError:
+            return
+        if mtime == self._overrides_mtime:
+            return
+        self._overrides_mtime = mtime
+        try:
+            entries = read_overrides(path)
+        except (OSError, ValueError) as e:
+            logging.warning("Could not read climate overrides %s: %s", path, e)
+            return
+        wall = time.time()
+        for entry in entries:
+            values = {name: entry[name] for name in self.layers if entry.get(name) is not None}
+            self.put_override(entry['lat'], entry['lon'], entry.get('month'), ttl=entry['expires'] - wall, **values)
+
+    def lookup_many(self, lat, lon, month=None):
+        """(n, layers) float32 array of values at the points for the given month(s); NaN where unknown."""
+        self._refresh_overrides()
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+        months = _months(month, len(lat))
+        i, j, inside = self._cells(lat, lon)
+        out = np.asarray(self.normals[i, j, months - 1], dtype=np.float32)
+        out[~inside] = np.nan
+        if self._overrides:
+            self._apply_overrides(out, i * self.n_lon + j, months, inside)
+        return out
+
+    def lookup(self, lat, lon, month=None):
+        """{layer: value} for one point, without unknown layers (the encoder defaults them)."""
+        # scalar path of lookup_many(): avoids the array set-up cost for one point
+        lat, lon = float(lat), float(lon)
+        if not (math.isfinite(lat) and math.isfinite(lon)):
+            return {}
+        i = math.floor((lat - self.lat0) / self.resolution)
+        j = math.floor((lon - self.lon0) / self.resolution)
+        if not (0 <= i < self.n_lat and 0 <= j < self.n_lon):
+            return {}
+        self._refresh_overrides()
+        m = _month(month)
+        values = np.array(self.normals[i, j, m - 1], dtype=np.float32)
+        if self._overrides:
+            with self._lock:
+                override = self._override((i * self.n_lon + j, m), time.monotonic())
+            if override is not None:
+                given = ~np.isnan(override)
+                values[given] = override[given]
+        return {name: float(v) for name, v in zip(self.layers, values) if not np.isnan(v)}
+
+    def _override(self, key, now):
+        # caller holds self._lock
+        entry = self._overrides.get(key)
+        if entry is None:
+            return None
+        values, expires = entry
+        if expires <= now:
+            del self._overrides[key]
+            self._override_cells = None
+            return None
+        return values
+
+    def _apply_overrides(self, out, flat, months, inside):
+        now = time.monotonic()
+        with self._lock:
+            if self._override_cells is None:
+                self._override_cells = np.unique(np.fromiter((cell for cell, _ in self._overrides), np.int64))
+            # only rows in a cell with an override are looked at one by one
+            for k in np.flatnonzero(inside & np.isin(flat, self._override_cells)):
+                values = self._override((int(flat[k]), int(months[k])), now)
+                if values is not None:
+                    given = ~np.isnan(values)
+                    out[k, given] = values[given]
+
+    def put_override(self, lat, lon, month=None, ttl=None, **values):
+        """Use observed values (e.g. temp=31.2, rainfall=12.0) for a point's cell and month until `ttl` expires."""
+        ttl = self.override_ttl if ttl is None else ttl
+        if ttl <= 0:
+            return False
+        i, j, inside = self._cells(np.array([float(lat)]), np.array([float(lon)]))
+        if not inside[0]:
+            return False
+        unknown = set(values) - set(self.layers)
+        if unknown:
+            raise ValueError(f'unknown climate layers: {sorted(unknown)}')
+        row = np.array([values.get(name, np.nan) for name in self.layers], dtype=np.float32)
+        key = (int(i[0] * self.n_lon + j[0]), _month(month))
+        expires = time.monotonic() + ttl
+        with self._lock:
+            self._overrides[key] = (row, expires)
+            self._overrides.move_to_end(key)
+            while len(self._overrides) > self.override_size:
+                self._overrides.popitem(last=False)
+            self._override_cells = None
+        return True
+
+    def clear_overrides(self):
+        with self._lock:
+            self._overrides.clear()
+            self._override_cells = None
+
+    def stats(self):
+        return {'path': self.path, 'resolution': self.resolution, 'cells': [self.n_lat, self.n_lon],
+                'dtype': str(self.normals.dtype), 'overrides': len(self._overrides)}
+
+
+def build_store(lat, lon, month, values, out_dir, resolution=0.1, dtype='float16'):
+    """Average point values (layers, n) per grid cell and month into a store directory."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    month = np.asarray(month, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    ok = (month >= 1) & (month <= 12) & np.isfinite(lat) & np.isfinite(lon)
+    lat, lon, month, values = lat[ok], lon[ok], month[ok], values[:, ok]
+    lat0 = float(np.floor(lat.min() / resolution) * resolution)
+    lon0 = float(np.floor(lon.min() / resolution) * resolution)
+    # the same cell arithmetic as ClimateStore._cells
+    i = np.floor((lat - lat0) / resolution).astype(np.int64)
+    j = np.floor((lon - lon0) / resolution).astype(np.int64)
+    shape = (int(i.max()) + 1, int(j.max()) + 1, 12)
+    slot = np.ravel_multi_index((i, j, month - 1), shape)
+    size = int(np.prod(shape))
+    normals = np.full(shape + (len(LAYERS),), np.nan, dtype=dtype)
+    for k in range(len(LAYERS)):
+        given = ~np.isnan(values[k])
+        count = np.bincount(slot[given], minlength=size)
+        total = np.bincount(slot[given], weights=values[k][given], minlength=size)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            normals[..., k] = (total / count).reshape(shape)
+    os.makedirs(out_dir, exist_ok=True)
+    # running stores keep normals.npy memory-mapped: replace the file, never overwrite it in place
+    path = os.path.join(out_dir, DATA)
+    with open(path + '.tmp', 'wb') as f:
+        np.save(f, normals)
+    os.replace(path + '.tmp', path)
+    manifest = {'version': 1, 'lat0': lat0, 'lon0': lon0, 'resolution': resolution,
+                'shape': list(normals.shape), 'layers': LAYERS, 'dtype': str(normals.dtype)}
+    # write the manifest last so a half-built directory is never picked up
+    tmp = os.path.join(out_dir, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST))
+    return manifest
+
+
+def read_overrides(path):
+    """Unexpired entries of an overrides.json: dicts with lat, lon, month, expires (epoch seconds) and layers."""
+    with open(path) as f:
+        entries = json.load(f)['overrides']
+    now = time.time()
+    return [entry for entry in entries if entry['expires'] > now]
+
+
+def write_override(store_dir, lat, lon, month=None, ttl=6 * 3600, **values):
+    """Add an override to store_dir/overrides.json for every store on the directory to pick up."""
+    unknown = set(values) - set(LAYERS)
+    if unknown:
+        raise ValueError(f'unknown climate layers: {sorted(unknown)}')
+    path = os.path.join(store_dir, OVERRIDES)
+    entries = read_overrides(path) if os.path.exists(path) else []
+    entry = {'lat': float(lat), 'lon': float(lon), 'month': _month(month), 'expires': time.time() + ttl,
+             **{name: float(v) for name, v in values.items() if v is not None}}
+    entries.append(entry)
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump({'overrides': entries}, f)
+    os.replace(tmp, path)
+    return entry
+
+
+def synthetic_normals(lat_min, lat_max, lon_min, lon_max, resolution=0.1):
+    """Smooth, deterministic monthly normals at every cell centre of a bounding box (for tests and demos).
+
+    The spatial trends follow generate_synthetic_data: warmer to the south,
+    wetter to the east, with a June-September monsoon.
+    """
+    lats = np.arange(lat_min, lat_max, resolution) + resolution / 2
+    lons = np.arange(lon_min, lon_max, resolution) + resolution / 2
+    lat, lon, month = (a.ravel() for a in np.meshgrid(lats, lons, np.arange(1, 13), indexing='ij'))
+    season = np.cos((month - 5) * np.pi / 6)  # 1 in May, -1 in November
+    monsoon = np.where((month >= 6) & (month <= 9), 2.5, 0.4)
+    temp = 32.0 - 0.45 * (lat - 8.0) + 4.0 * season
+    rainfall = (60.0 + 4.0 * (lon - 68.0)) * monsoon
+    humidity = np.clip(45.0 + 0.1 * rainfall, 15, 100)
+    return lat, lon, month, np.vstack([temp, humidity, rainfall])
+
+
+_default_store = None
+_default_loaded = False
+_default_lock = threading.Lock()
+
+
+def default_store():
+    # The store is optional: CLIMATE_DIR (default ./climate) must hold a manifest
+    global _default_store, _default_loaded
+    with _default_lock:
+        if not _default_loaded:
+            path = os.environ.get('CLIMATE_DIR', 'climate')
+            if os.path.exists(os.path.join(path, MANIFEST)):
+                try:
+                    _default_store = ClimateStore(
+                        path, override_ttl=float(os.environ.get('CLIMATE_OVERRIDE_TTL', 6 * 3600)),
+                        override_check=float(os.environ.get('CLIMATE_OVERRIDE_CHECK', 5.0)))
+                except Exception as e:
+                    logging.warning("Could not open climate store %s: %s", path, e)
+            _default_loaded = True
+        return _default_store
+
+
+def climate_features(lat, lon, month=None):
+    """{temp, humidity, rainfall} for one point from the default store; {} without a store."""
+    store = default_store()
+    return {} if store is None else store.lookup(lat, lon, month)
+
+
+def climate_columns(lat, lon, month=None):
+    """(n, 3) temp/humidity/rainfall for arrays of points from the default store; None without a store."""
+    store = default_store()
+    return None if store is None else store.lookup_many(lat, lon, month)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build an offline monthly climate store')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build')
+    src = build.add_mutually_exclusive_group(required=True)
+    src.add_argument('--csv', help='CSV with lat, lon, month, temp, humidity, rainfall columns')
+    src.add_argument('--synthetic', nargs=4, type=float, metavar=('LAT_MIN', 'LAT_MAX', 'LON_MIN', 'LON_MAX'))
+    build.add_argument('--out', default='climate')
+    build.add_argument('--resolution', type=float, default=0.1)
+    build.add_argument('--dtype', choices=('float16', 'float32'), default='float16')
+    override = sub.add_parser('override', help='add recent observed weather for one point and month')
+    override.add_argument('--dir', default=os.environ.get('CLIMATE_DIR', 'climate'))
+    override.add_argument('--lat', type=float, required=True)
+    override.add_argument('--lon', type=float, required=True)
+    override.add_argument('--month', type=int, help='default: this month')
+    override.add_argument('--ttl', type=float, default=6 * 3600, help='seconds until it expires')
+    for name in LAYERS:
+        override.add_argument(f'--{name}', type=float)
+    args = parser.parse_args()
+
+    if args.command == 'override':
+        values = {name: getattr(args, name) for name in LAYERS if getattr(args, name) is not None}
+        if not values:
+            parser.error(f"give at least one of {', '.join('--' + name for name in LAYERS)}")
+        entry = write_override(args.dir, args.lat, args.lon, args.month, args.ttl, **values)
+        print(json.dumps(entry))
+        return
+
+    if args.csv:
+        df = pd.read_csv(args.csv, usecols=['lat', 'lon', 'month'] + LAYERS)
+        lat, lon, month, values = df['lat'].values, df['lon'].values, df['month'].values, df[LAYERS].values.T
+    else:
+        lat, lon, month, values = synthetic_normals(*args.synthetic, resolution=args.resolution)
+    manifest = build_store(lat, lon, month, values, args.out, args.resolution, args.dtype)
+    print(f"Wrote {manifest['shape'][0]}x{manifest['shape'][1]} cells x 12 months to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
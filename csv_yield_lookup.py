@@ -1,18 +1,177 @@
+import logging
+import os
+import threading
+import time
+
+import numpy as np
 import pandas as pd
 
+# Above this many (soil, crop, irrigation) cells the index switches from a
+# dense table to sorted keys + binary search to keep memory bounded.
+_DENSE_LIMIT = 1 << 24
+
+
+def _normalize(values):
+    # Same normalization for table columns and incoming queries
+    return pd.Series(values, dtype='object').map(str).str.strip().str.lower()
+
+
+class YieldIndex:
+    """(soil, crop, irrigation) -> yield_per_acre index built once from a yield table.
+
+    Each key column is mapped to small integer codes; the combined code indexes a
+    dense float array (NaN = no entry) or, for very large key spaces, a sorted key
+    array searched with np.searchsorted. The first row for a key wins, as before.
+    """
+
+    def __init__(self, df):
+        df = df.dropna(subset=['soil_type', 'crop_type', 'irrigation_type', 'yield_per_acre'])
+        soil = _normalize(df['soil_type'].values)
+        crop = _normalize(df['crop_type'].values)
+        irrigation = _normalize(df['irrigation_type'].values)
+        s_codes, self.soils = pd.factorize(soil)
+        c_codes, self.crops = pd.factorize(crop)
+        i_codes, self.irrigations = pd.factorize(irrigation)
+        self._soil_ids = {v: k for k, v in enumerate(self.soils)}
+        self._crop_ids = {v: k for k, v in enumerate(self.crops)}
+        self._irrigation_ids = {v: k for k, v in enumerate(self.irrigations)}
+        self.shape = (len(self.soils), len(self.crops), len(self.irrigations))
+
+        keys = self._combine(s_codes.astype(np.int64), c_codes.astype(np.int64), i_codes.astype(np.int64))
+        yields = df['yield_per_acre'].to_numpy(dtype=np.float64)
+        # keep only the first row for every key
+        keys, first = np.unique(keys, return_index=True)
+        yields = yields[first]
+
+        size = int(np.prod(self.shape, dtype=np.int64))
+        self.dense = size <= _DENSE_LIMIT
+        if self.dense:
+            self.table = np.full(size, np.nan, dtype=np.float64)
+            self.table[keys] = yields
+        else:
+            self.keys = keys
+            self.values = yields
+        self.size = len(keys)
+
+    def _combine(self, s, c, i):
+        return (s * self.shape[1] + c) * self.shape[2] + i
+
+    def lookup(self, soil_type, crop_type, irrigation_type):
+        s = self._soil_ids.get(str(soil_type).strip().lower())
+        c = self._crop_ids.get(str(crop_type).strip().lower())
+        i = self._irrigation_ids.get(str(irrigation_type).strip().lower())
+        if s is None or c is None or i is None:
+            return None
+        key = self._combine(s, c, i)
+        if self.dense:
+            value = self.table[key]
+            return None if np.isnan(value) else float(value)
+        pos = np.searchsorted(self.keys, key)
+        if pos < len(self.keys) and self.keys[pos] == key:
+            return float(self.values[pos])
+        return None
+
+    def _codes(self, values, categories):
+        codes = pd.Categorical(_normalize(values), categories=categories).codes
+        return codes.astype(np.int64)
+
+    def lookup_many(self, soil_types, crop_types, irrigation_types):
+        """Vectorized lookup; returns a float64 array with NaN where there is no entry."""
+        s = self._codes(soil_types, self.soils)
+        c = self._codes(crop_types, self.crops)
+        i = self._codes(irrigation_types, self.irrigations)
+        known = (s >= 0) & (c >= 0) & (i >= 0)
+        out = np.full(len(s), np.nan, dtype=np.float64)
+        keys = self._combine(s[known], c[known], i[known])
+        if self.dense:
+            out[known] = self.table[keys]
+        elif len(self.keys):
+            pos = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+            hit = self.keys[pos] == keys
+            found = np.full(len(keys), np.nan, dtype=np.float64)
+            found[hit] = self.values[pos[hit]]
+            out[known] = found
+        return out
+
+
 # Load the CSV once at startup for fast lookup
-yield_df = pd.read_csv('traincrop.csv')
+CSV_PATH = os.environ.get('YIELD_TABLE', 'traincrop.csv')
+yield_df = pd.read_csv(CSV_PATH)
+yield_index = YieldIndex(yield_df)
+_mtime = os.path.getmtime(CSV_PATH)
+_tried_mtime = _mtime  # mtime of the table last loaded or attempted, even if that failed
+_reloading = False
+_last_check = 0.0
+_reload_lock = threading.Lock()
+_state_lock = threading.Lock()
+_listeners = []
+
+def add_reload_listener(callback):
+    # callback() runs after the table has been reloaded
+    _listeners.append(callback)
+
+def reload(path=None):
+    """Re-read the yield table and swap in a new index; True on success.
+
+    A table that can't be read or parsed (e.g. half-written) is logged and
+    the current index keeps serving.
+    """
+    global yield_df, yield_index, _mtime, _tried_mtime, CSV_PATH
+    with _reload_lock:
+        path = path or CSV_PATH
+        try:
+            mtime = os.path.getmtime(path)
+            _tried_mtime = mtime
+            df = pd.read_csv(path)
+            index = YieldIndex(df)
+        except Exception as e:
+            logging.error("Could not reload yield table %s, keeping the current one: %s", path, e)
+            return False
+        # swap both references; in-flight lookups keep the old index
+        yield_df, yield_index, _mtime, CSV_PATH = df, index, mtime, path
+    logging.info("Reloaded yield table %s (%d keys)", path, index.size)
+    for callback in _listeners:
+        callback()
+    return True
+
+def _reload_changed():
+    global _reloading
+    try:
+        reload()
+    finally:
+        with _state_lock:
+            _reloading = False
+
+def reload_if_changed(interval=5.0, background=True):
+    """Start a reload when the CSV's mtime changed; checks the file at most every `interval` seconds.
+
+    The reload runs on its own thread, so the request that notices the
+    change isn't held up by parsing a large table. A table that failed to
+    load is retried once its mtime changes again.
+    """
+    global _last_check, _reloading
+    now = time.monotonic()
+    if now - _last_check < interval:
+        return False
+    _last_check = now
+    try:
+        mtime = os.path.getmtime(CSV_PATH)
+    except OSError:
+        return False
+    with _state_lock:
+        if mtime == _tried_mtime or _reloading:
+            return False
+        _reloading = True
+    if background:
+        threading.Thread(target=_reload_changed, name='yield-table-reload', daemon=True).start()
+    else:
+        _reload_changed()
+    return True
 
 def lookup_yield(soil_type, crop_type, irrigation_type):
-    # Normalize input for matching
-    s = str(soil_type).strip().lower()
-    c = str(crop_type).strip().lower()
-    i = str(irrigation_type).strip().lower()
-    # Try to find a matching row
-    row = yield_df[(yield_df['soil_type'].str.lower() == s) &
-                   (yield_df['crop_type'].str.lower() == c) &
-                   (yield_df['irrigation_type'].str.lower() == i)]
-    if not row.empty:
-        # Return the yield per acre from the first match
-        return float(row.iloc[0]['yield_per_acre'])
-    return None
+    # Return the yield per acre from the first matching row, or None
+    return yield_index.lookup(soil_type, crop_type, irrigation_type)
+
+def lookup_yields(soil_types, crop_types, irrigation_types):
+    # Bulk version of lookup_yield: NaN marks inputs with no matching row
+    return yield_index.lookup_many(soil_types, crop_types, irrigation_types)
@@ -0,0 +1,309 @@
+# dataset_cache.py
+# Versioned on-disk cache of encoded training data, so retraining does not
+# re-read and re-encode the whole source every run.
+#
+# Each cache lives in DATASET_CACHE_DIR/<source>-v<encoder version>-<hash>/:
+#   X.npy, y.npy       float32 features and target, loaded memory-mapped
+#   manifest.json      source, encoder schema, row count and high-water mark
+#   lgb_dataset.bin    optional binary lightgbm.Dataset built from X and y
+#
+# refresh() only fetches records past the stored high-water mark (a Mongo
+# _id or timestamp field, a SQL key/timestamp column, or the byte offset of
+# an append-only CSV) and appends them in place. Query order must follow the
+# high-water field, so it should be indexed. A timestamp field may repeat
+# within a refresh, but records added later with the same value as the
+# stored mark are not fetched.
+#
+#   cache = MongoCache(collection)           # or SQLCache / CSVCache
+#   X, y = cache.refresh()
+#   train = cache.lgb_dataset(params)
+
+import hashlib
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import time
+
+import numpy as np
+import pandas as pd
+
+import ingest
+from feature_encoder import ENCODER
+
+CACHE_DIR = os.environ.get('DATASET_CACHE_DIR', 'dataset_cache')
+
+
+def _encode_mark(value):
+    if value is None:
+        return None
+    if isinstance(value, (bool, np.bool_)):
+        return {'type': 'bool', 'value': bool(value)}
+    if isinstance(value, (int, np.integer)):
+        return {'type': 'int', 'value': int(value)}
+    if isinstance(value, (float, np.floating)):
+        return {'type': 'float', 'value': float(value)}
+    if isinstance(value, str):
+        return {'type': 'str', 'value': value}
+    if hasattr(value, 'isoformat'):
+        return {'type': 'datetime', 'value': pd.Timestamp(value).isoformat()}
+    if type(value).__name__ == 'ObjectId':
+        return {'type': 'objectid', 'value': str(value)}
+    raise TypeError(f'unsupported high-water mark type: {type(value).__name__}')
+
+
+def _decode_mark(mark):
+    if mark is None:
+        return None
+    kind, value = mark['type'], mark['value']
+    if kind == 'datetime':
+        return pd.Timestamp(value).to_pydatetime()
+    if kind == 'objectid':
+        from bson import ObjectId
+        return ObjectId(value)
+    return value
+
+
+class DatasetCache:
+    """Encoded features and target of one source, appended to incrementally."""
+
+    def __init__(self, source, encoder=ENCODER, target=ingest.TARGET, root=CACHE_DIR):
+        self.source = source
+        self.encoder = encoder
+        self.target = target
+        schema = json.dumps({'source': source, 'target': target, **encoder.schema()}, sort_keys=True)
+        digest = hashlib.sha1(schema.encode()).hexdigest()[:10]
+        slug = re.sub(r'[^A-Za-z0-9_.-]+', '_', source).strip('_')[-60:]
+        self.path = os.path.join(root, f'{slug}-v{encoder.version}-{digest}')
+        self.manifest = self._read_manifest()
+
+    def _manifest_path(self):
+        return os.path.join(self.path, 'manifest.json')
+
+    def _read_manifest(self):
+        try:
+            with open(self._manifest_path()) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'source': self.source, 'encoder_version': self.encoder.version,
+                    'features': self.encoder.features, 'target': self.target,
+                    'rows': 0, 'high_water': None}
+
+    def _write_manifest(self):
+        self.manifest['updated'] = time.time()
+        tmp = self._manifest_path() + '.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(self.manifest, f, indent=2)
+        os.replace(tmp, self._manifest_path())
+
+    @property
+    def rows(self):
+        return self.manifest['rows']
+
+    @property
+    def high_water(self):
+        return _decode_mark(self.manifest.get('high_water'))
+
+    def reset(self):
+        """Forget everything cached for this source."""
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.manifest = self._read_manifest()
+
+    def load(self):
+        """(X, y) as read-only memory maps; empty arrays before the first refresh."""
+        if not self.rows:
+            return np.empty((0, len(self.encoder.features)), dtype=np.float32), np.empty(0, dtype=np.float32)
+        return (np.load(os.path.join(self.path, 'X.npy'), mmap_mode='r'),
+                np.load(os.path.join(self.path, 'y.npy'), mmap_mode='r'))
+
+    def append(self, batches, mark_of=None, final_mark=None, expected_rows=None, on_batch=None):
+        """Encode and append batches after the cached rows, then return load().
+
+        `mark_of(batch, position)` gives the high-water field of the batch's
+        first (0) or last (-1) row; the last is checkpointed with the row count
+        after each batch so an interrupted run resumes where it stopped.
+        Without it only `final_mark` is recorded, once at the end.
+        `on_batch(batch)` sees each raw batch, as in ingest.ingest().
+        """
+        buffer = ingest.ColumnarBuffer(len(self.encoder.features), expected_rows or 1 << 16,
+                                       self.path, rows=self.rows)
+        added = 0
+        batches = iter(batches)
+        batch = next(batches, None)
+        while batch is not None:
+            following = next(batches, None)
+            if on_batch is not None:
+                on_batch(batch)
+            X, y = buffer.reserve(len(batch))
+            self.encoder.encode(batch, out=X)
+            y[:] = ingest.target_values(batch, self.target)
+            added += len(batch)
+            mark = None if mark_of is None else mark_of(batch, -1)
+            # no checkpoint between rows sharing the high-water value (equal
+            # timestamps): resuming with `> mark` would skip the rest of them
+            if mark is not None and (following is None or mark_of(following, 0) != mark):
+                buffer.flush()
+                self.manifest['rows'] = buffer.rows
+                self.manifest['high_water'] = _encode_mark(mark)
+                self._write_manifest()
+            batch = following
+        buffer.finish()
+        self.manifest['rows'] = buffer.rows
+        if final_mark is not None:
+            self.manifest['high_water'] = _encode_mark(final_mark)
+        self._write_manifest()
+        if added:
+            logging.info("Dataset cache %s: +%d rows, %d total", self.path, added, self.rows)
+        return self.load()
+
+    def lgb_dataset(self, params=None):
+        """A lightgbm.Dataset over the cached rows, reusing a saved binary when current."""
+        import lightgbm as lgb
+        binary = saved_lgb_binary(self.path, self.rows, params)
+        if binary is not None:
+            return lgb.Dataset(binary, params=params)
+        X, y = self.load()
+        dataset = _save_lgb_binary(self.path, X, y, params)
+        self.manifest['lgb_binary'] = _lgb_key(self.rows, params)
+        self._write_manifest()
+        return dataset
+
+
+def _lgb_key(rows, params):
+    return {'rows': rows, 'params': params or {}}
+
+
+def _save_lgb_binary(path, X, y, params):
+    import lightgbm as lgb
+    binary = os.path.join(path, 'lgb_dataset.bin')
+    dataset = lgb.Dataset(X, label=y, params=params, free_raw_data=False).construct()
+    tmp = binary + '.tmp'
+    if os.path.exists(tmp):
+        os.remove(tmp)
+    dataset.save_binary(tmp)
+    os.replace(tmp, binary)
+    return dataset
+
+
+def saved_lgb_binary(path, rows, params=None):
+    """The directory's lgb_dataset.bin if it was built from `rows` rows with `params`, else None."""
+    binary = os.path.join(path, 'lgb_dataset.bin')
+    try:
+        with open(os.path.join(path, 'manifest.json')) as f:
+            saved = json.load(f).get('lgb_binary')
+    except (OSError, ValueError):
+        return None
+    return binary if saved == _lgb_key(rows, params) and os.path.exists(binary) else None
+
+
+def refresh_lgb_binary(path, params=None):
+    """Rebuild an existing cache directory's lgb_dataset.bin unless it matches X/y and `params`."""
+    X, y = load_dir(path)
+    if saved_lgb_binary(path, len(y), params) is None:
+        _save_lgb_binary(path, X, y, params)
+        manifest_path = os.path.join(path, 'manifest.json')
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        manifest['lgb_binary'] = _lgb_key(len(y), params)
+        manifest['updated'] = time.time()
+        with open(manifest_path + '.tmp', 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(manifest_path + '.tmp', manifest_path)
+
+
+def load_dir(path):
+    """(X, y) of an existing cache directory, memory-mapped (e.g. in a worker process)."""
+    return (np.load(os.path.join(path, 'X.npy'), mmap_mode='r'),
+            np.load(os.path.join(path, 'y.npy'), mmap_mode='r'))
+
+
+class MongoCache(DatasetCache):
+    """Cache of a MongoDB collection, advanced by `field` (_id or a timestamp)."""
+
+    def __init__(self, collection, field='_id', source=None, **kwargs):
+        super().__init__(source or f'mongodb:{collection.full_name}', **kwargs)
+        self.collection = collection
+        self.field = field
+
+    def refresh(self, batch_size=ingest.BATCH_SIZE, on_batch=None):
+        """Append documents past the high-water mark, in `field` order."""
+        query = {} if self.high_water is None else {self.field: {'$gt': self.high_water}}
+        batches = ingest.mongo_batches(self.collection, batch_size, query,
+                                       self.encoder.features + [self.target, self.field], sort=self.field)
+        return self.append(batches, mark_of=lambda batch, position: batch[position][self.field],
+                           expected_rows=ingest.mongo_count(self.collection, query), on_batch=on_batch)
+
+
+class SQLCache(DatasetCache):
+    """Cache of a SQL table, advanced by an increasing key or timestamp column."""
+
+    def __init__(self, conn, table, field, source=None, **kwargs):
+        super().__init__(source or f'sql:{table}', **kwargs)
+        self.conn = conn
+        self.table = table
+        self.field = field
+
+    def refresh(self, batch_size=ingest.BATCH_SIZE, on_batch=None):
+        """Append rows past the high-water mark, in `field` order."""
+        where, params = None, ()
+        if self.high_water is not None:
+            where, params = f"{self.field} > {ingest.placeholder(self.conn)}", (self.high_water,)
+        columns = self.encoder.features + [self.target]
+        if self.field not in columns:
+            columns.append(self.field)
+        total = ingest.sql_count(self.conn, self.table, where, params)
+        batches = ingest.sql_batches(self.conn, self.table, batch_size, columns, where, params,
+                                     order_by=self.field)
+        return self.append(batches, mark_of=lambda batch, position: batch[self.field].iloc[position],
+                           expected_rows=total, on_batch=on_batch)
+
+
+class _BoundedReader:
+    # file-like view of f up to byte `end`, for pandas.read_csv
+    def __init__(self, f, end):
+        self.f, self.end = f, end
+
+    def read(self, size=-1):
+        remaining = self.end - self.f.tell()
+        if remaining <= 0:
+            return b''
+        return self.f.read(remaining if size is None or size < 0 else min(size, remaining))
+
+    def __iter__(self):
+        return iter(self.read().splitlines(keepends=True))
+
+
+class CSVCache(DatasetCache):
+    """Cache of an append-only CSV file, advanced by byte offset."""
+
+    def __init__(self, path, target=ingest.TARGET, source=None, **kwargs):
+        super().__init__(source or f'csv:{os.path.abspath(path)}', target=target, **kwargs)
+        self.csv_path = path
+
+    def refresh(self, batch_size=ingest.BATCH_SIZE, on_batch=None):
+        """Append the lines added since the last refresh."""
+        with open(self.csv_path, 'rb') as f:
+            header = f.readline()
+            columns = pd.read_csv(io.BytesIO(header), nrows=0).columns.tolist()
+            f.seek(0, os.SEEK_END)
+            end = f.tell()
+            # only read complete lines; a partially written last line waits for next time
+            while end > len(header):
+                f.seek(end - 1)
+                if f.read(1) == b'\n':
+                    break
+                end -= 1
+            start = self.high_water
+            header_hash = hashlib.sha1(header).hexdigest()
+            if start is not None and (start > end or self.manifest.get('csv_header') != header_hash):
+                # rewritten rather than appended to: start over
+                self.reset()
+                start = None
+            start = len(header) if start is None else start
+            self.manifest['csv_header'] = header_hash
+            f.seek(start)
+            batches = pd.read_csv(_BoundedReader(f, end), names=columns, header=None,
+                                  chunksize=batch_size) if end > start else []
+            return self.append(batches, final_mark=end, on_batch=on_batch)
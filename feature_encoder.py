@@ -0,0 +1,143 @@
+# feature_encoder.py
+# Single source of truth for the model feature schema, shared by serving
+# (ml_yield_predictor) and every training script.
+
+import json
+
+import numpy as np
+import pandas as pd
+
+# Bump whenever the feature order, the category maps or the defaults change;
+# trainers record it in feature_schema.json next to the models.
+SCHEMA_VERSION = 1
+
+FEATURES = ['soil_type', 'crop_type', 'irrigation_type', 'acres', 'temp', 'humidity', 'rainfall', 'oc', 'ph']
+# The SVM is trained on the categorical/acreage columns only
+SVM_FEATURES = FEATURES[:4]
+
+SOIL_MAP = {'loamy':0,'sandy':1,'clay':2,'silt':3,'peat':4,'chalk':5,'red':6,'laterite':7,'black':8,'alluvial':9,'saline':10,'peaty':11,'mixed':12,
+    'vertisol':13,'luvisol':14,'gleysol':15,'regosol':16,'arenosol':17,'cambisol':18,'fluvisol':19,'podzol':20,'umbrisol':21,'unknown':0}
+CROP_MAP = {
+    'wheat': 0, 'rice': 1, 'cotton': 2, 'vegetables': 3, 'pulses': 4,
+    'peanuts': 5, 'watermelon': 6, 'potatoes': 7, 'carrots': 8, 'cantaloupe': 9,
+    'soybean': 10, 'broccoli': 11, 'cabbage': 12, 'tomatoes': 13, 'onions': 14,
+    'garlic': 15, 'peppers': 16, 'lettuce': 17, 'celery': 18, 'barley': 19,
+    'beet': 20, 'spinach': 21, 'millets': 22, 'groundnut': 23, 'cashew': 24,
+    'pineapple': 25, 'tea': 26, 'coffee': 27, 'sunflower': 28, 'jute': 29,
+    'sugarcane': 30, 'sugar beet': 31
+}
+IRRIGATION_MAP = {'drip':0,'sprinkler':1,'canal':2,'none':3}
+
+# Values used when a column is absent or not numeric (the serving defaults)
+DEFAULTS = {'acres': 1.0, 'temp': 28.5, 'humidity': 65.0, 'rainfall': 150.0, 'oc': 1.0, 'ph': 7.0}
+
+
+class FeatureEncoder:
+    """Encodes raw records into the float32 feature matrix the models expect.
+
+    Accepts a single dict, a list of dicts or a DataFrame and fills a
+    preallocated (n, len(features)) matrix column by column. Categories are
+    matched case-insensitively; unknown values map to code 0, and values that
+    are already valid integer codes are passed through.
+    """
+
+    version = SCHEMA_VERSION
+
+    def __init__(self, features=FEATURES, soil_map=SOIL_MAP, crop_map=CROP_MAP,
+                 irrigation_map=IRRIGATION_MAP, defaults=DEFAULTS):
+        self.features = list(features)
+        self.maps = {'soil_type': soil_map, 'crop_type': crop_map, 'irrigation_type': irrigation_map}
+        self.defaults = dict(defaults)
+        self._index = {}
+        for column, mapping in self.maps.items():
+            self._index[column] = (pd.Index(list(mapping.keys())),
+                                   np.fromiter(mapping.values(), dtype=np.float32, count=len(mapping)),
+                                   np.unique(np.fromiter(mapping.values(), dtype=np.int64)))
+
+    def encode_category(self, column, values):
+        """Vectorized category -> code lookup for one column."""
+        keys, codes, valid = self._index[column]
+        # normalize each distinct value once, then broadcast back to the rows
+        inverse, uniques = pd.factorize(pd.Series(values, dtype='object'), use_na_sentinel=False)
+        uniques = pd.Series(uniques, dtype='object')
+        pos = keys.get_indexer(uniques.map(str).str.strip().str.lower())
+        mapped = np.where(pos >= 0, codes[pos], np.float32(0)).astype(np.float32)
+        misses = pos < 0
+        if misses.any():
+            numeric = pd.to_numeric(uniques[misses], errors='coerce').to_numpy(dtype=np.float64)
+            ok = np.isin(numeric, valid)
+            mapped[np.flatnonzero(misses)[ok]] = numeric[ok]
+        return mapped[inverse]
+
+    def unknown_categories(self, column, values):
+        """Distinct values of a column that are not in its category map."""
+        keys = self._index[column][0]
+        normalized = pd.Series(pd.unique(pd.Series(values, dtype='object')), dtype='object').map(str).str.strip().str.lower()
+        return set(normalized[keys.get_indexer(normalized) < 0])
+
+    def _columns(self, data):
+        if isinstance(data, pd.DataFrame):
+            return len(data), lambda col: data[col].to_numpy() if col in data.columns else None
+        if isinstance(data, dict):
+            data = [data]
+        rows = list(data)
+        present = set().union(*(r.keys() for r in rows)) if rows else set()
+
+        def column(col):
+            if col not in present:
+                return None
+            return [r.get(col) for r in rows]
+        return len(rows), column
+
+    def encode(self, data, out=None):
+        """Encode records into an (n, len(features)) float32 matrix.
+
+        `out` may be a preallocated (e.g. memory-mapped) float32 array of the
+        right shape; it is filled in place and returned.
+        """
+        n, column = self._columns(data)
+        if out is None:
+            out = np.empty((n, len(self.features)), dtype=np.float32)
+        for k, col in enumerate(self.features):
+            values = column(col)
+            if col in self.maps:
+                out[:, k] = 0 if values is None else self.encode_category(col, values)
+            elif values is None:
+                out[:, k] = self.defaults.get(col, 0.0)
+            elif isinstance(values, np.ndarray) and values.dtype.kind in 'iuf':
+                out[:, k] = values
+                if values.dtype.kind == 'f':
+                    missing = np.isnan(out[:, k])
+                    out[missing, k] = self.defaults.get(col, 0.0)
+            else:
+                numeric = pd.to_numeric(pd.Series(values, dtype='object'), errors='coerce')
+                out[:, k] = numeric.fillna(self.defaults.get(col, 0.0)).to_numpy(dtype=np.float32)
+        return out
+
+    def schema(self):
+        return {'version': self.version, 'features': self.features, 'maps': self.maps,
+                'defaults': self.defaults}
+
+    def save_schema(self, path='feature_schema.json'):
+        with open(path, 'w') as f:
+            json.dump(self.schema(), f, indent=2)
+
+
+def model_columns(model, X):
+    """The leading columns of an encoded matrix that `model` was trained on.
+
+    A model fit on fewer features than the encoder produces (e.g. an XGBoost
+    model on the four SVM_FEATURES) rejects the full matrix; models that
+    don't report a feature count get X unchanged.
+    """
+    if hasattr(model, 'num_feature'):
+        n = model.num_feature()  # lightgbm.Booster
+    else:
+        # sklearn-style estimators and XGBRegressor; tree_engine models
+        n = getattr(model, 'n_features_in_', None) or getattr(model, 'num_features', None)
+    return X if n is None else X[:, :int(n)]
+
+
+# Shared default instance
+ENCODER = FeatureEncoder()
+SVM_ENCODER = FeatureEncoder(features=SVM_FEATURES)
@@ -0,0 +1,270 @@
+# generate_synthetic_data.py
+# Vectorized generator of realistic yield records at production scale, for
+# benchmarking the lookup, training and serving paths.
+#
+#   python generate_synthetic_data.py --rows 10000000 --out synthetic.parquet
+#   python generate_synthetic_data.py --rows 2000000 --out synthetic.csv
+#   python generate_synthetic_data.py --rows 1000000 --sqlite yield.db
+#   python generate_synthetic_data.py --rows 1000000 --mongo mongodb://localhost:27017/
+#   python generate_synthetic_data.py --rows 1000000 --mysql localhost:3306/agri_db --user root
+#
+# Rows are produced in chunks with NumPy. Each chunk has its own seed derived
+# from --seed and its index, so the output for a given --seed and
+# --chunk-rows is identical run to run. Columns are the encoder features
+# plus lat, lon and the target 'yield' (tons per acre), which the trainers
+# and the dataset cache read:
+#
+# - Locations fall inside India's bounding box.
+# - Temperature follows latitude; rainfall and humidity rise towards the
+#   east.
+# - Organic carbon and pH depend on the soil type.
+# - Yield follows crop-specific temperature, water and pH response curves,
+#   scaled by soil and irrigation factors, with multiplicative noise.
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from feature_encoder import CROP_MAP, IRRIGATION_MAP, SOIL_MAP
+
+COLUMNS = ['soil_type', 'crop_type', 'irrigation_type', 'acres', 'lat', 'lon',
+           'temp', 'humidity', 'rainfall', 'oc', 'ph', 'yield']
+
+# crop: (base yield t/acre, optimal temp C, temp tolerance, optimal water mm, water tolerance, optimal pH)
+CROP_CURVES = {
+    'wheat': (1.4, 22, 6, 60, 50, 6.5), 'rice': (1.6, 28, 5, 220, 90, 6.0),
+    'cotton': (0.8, 28, 6, 90, 60, 7.0), 'vegetables': (8.0, 24, 7, 110, 70, 6.5),
+    'pulses': (0.5, 26, 6, 70, 50, 7.0), 'peanuts': (1.0, 28, 5, 90, 60, 6.2),
+    'watermelon': (12.0, 27, 5, 80, 50, 6.5), 'potatoes': (10.0, 18, 5, 90, 50, 5.5),
+    'carrots': (10.0, 18, 5, 80, 50, 6.3), 'cantaloupe': (8.0, 27, 5, 70, 50, 6.8),
+    'soybean': (1.1, 26, 5, 110, 60, 6.5), 'broccoli': (4.0, 18, 4, 90, 50, 6.5),
+    'cabbage': (12.0, 17, 5, 90, 50, 6.5), 'tomatoes': (12.0, 24, 5, 90, 50, 6.3),
+    'onions': (10.0, 20, 6, 70, 50, 6.5), 'garlic': (3.0, 18, 5, 60, 40, 6.5),
+    'peppers': (6.0, 25, 5, 90, 50, 6.5), 'lettuce': (8.0, 17, 4, 80, 40, 6.5),
+    'celery': (12.0, 18, 4, 100, 50, 6.5), 'barley': (1.3, 18, 6, 50, 40, 7.0),
+    'beet': (12.0, 18, 5, 80, 50, 6.8), 'spinach': (5.0, 17, 5, 80, 50, 6.8),
+    'millets': (0.8, 29, 6, 50, 50, 6.5), 'groundnut': (1.0, 28, 5, 90, 60, 6.2),
+    'cashew': (0.4, 27, 4, 150, 80, 5.5), 'pineapple': (15.0, 26, 4, 150, 70, 5.0),
+    'tea': (1.0, 23, 4, 200, 80, 5.0), 'coffee': (0.4, 22, 4, 170, 80, 5.8),
+    'sunflower': (0.7, 24, 6, 60, 50, 7.0), 'jute': (1.0, 30, 4, 200, 70, 6.8),
+    'sugarcane': (30.0, 30, 5, 160, 70, 6.8), 'sugar beet': (20.0, 18, 5, 80, 50, 7.0),
+}
+# soil: (yield factor, mean organic carbon %, mean pH)
+SOIL_PROPERTIES = {
+    'loamy': (1.10, 1.5, 6.8), 'sandy': (0.80, 0.5, 6.3), 'clay': (0.95, 1.3, 7.2),
+    'silt': (1.05, 1.2, 6.8), 'peat': (0.90, 4.0, 5.0), 'chalk': (0.85, 1.0, 8.0),
+    'red': (0.90, 0.7, 6.0), 'laterite': (0.80, 0.6, 5.5), 'black': (1.05, 0.9, 7.8),
+    'alluvial': (1.15, 1.0, 7.2), 'saline': (0.60, 0.6, 8.6), 'peaty': (0.90, 3.5, 5.2),
+    'mixed': (1.00, 1.1, 6.9), 'vertisol': (1.00, 0.9, 7.8), 'luvisol': (1.05, 1.3, 6.5),
+    'gleysol': (0.85, 2.0, 6.0), 'regosol': (0.80, 0.6, 6.8), 'arenosol': (0.70, 0.4, 6.2),
+    'cambisol': (1.00, 1.2, 6.5), 'fluvisol': (1.10, 1.1, 7.0), 'podzol': (0.75, 1.5, 4.8),
+    'umbrisol': (0.90, 2.5, 5.3),
+}
+# irrigation: (water added mm, yield factor, share of fields)
+IRRIGATION_PROPERTIES = {
+    'drip': (120, 1.15, 0.15), 'sprinkler': (100, 1.08, 0.20),
+    'canal': (80, 1.00, 0.30), 'none': (0, 0.90, 0.35),
+}
+LAT_RANGE = (8.0, 34.0)
+LON_RANGE = (68.0, 97.0)
+
+SOILS = list(SOIL_PROPERTIES)
+CROPS = list(CROP_CURVES)
+IRRIGATIONS = list(IRRIGATION_PROPERTIES)
+assert set(SOILS) <= set(SOIL_MAP) and set(CROPS) == set(CROP_MAP) and set(IRRIGATIONS) == set(IRRIGATION_MAP)
+
+_CROP = np.array([CROP_CURVES[c] for c in CROPS]).T
+_SOIL = np.array([SOIL_PROPERTIES[s] for s in SOILS]).T
+_IRRIGATION = np.array([IRRIGATION_PROPERTIES[i] for i in IRRIGATIONS]).T
+
+
+def _bell(x, center, width):
+    return np.exp(-0.5 * np.square((x - center) / width))
+
+
+def yield_curve(crop, soil, irrigation, temp, rainfall, oc, ph):
+    """Noise-free tons per acre for arrays of category codes and conditions."""
+    base, t_opt, t_tol, w_opt, w_tol, ph_opt = _CROP[:, crop]
+    water = rainfall + _IRRIGATION[0, irrigation]
+    # too much water hurts less than too little
+    w_width = np.where(water < w_opt, w_tol, 2 * w_tol)
+    climate = 0.35 + 0.65 * _bell(temp, t_opt, t_tol) * _bell(water, w_opt, w_width)
+    soil_ph = 0.6 + 0.4 * _bell(ph, ph_opt, 1.2)
+    organic = 0.85 + 0.15 * np.minimum(oc / 1.5, 1.3)
+    return base * _SOIL[0, soil] * _IRRIGATION[1, irrigation] * climate * soil_ph * organic
+
+
+def generate_chunk(n, seed, chunk=0):
+    """One DataFrame of n synthetic records; deterministic in (seed, chunk)."""
+    rng = np.random.default_rng([seed, chunk])
+    soil = rng.integers(0, len(SOILS), n)
+    crop = rng.integers(0, len(CROPS), n)
+    irrigation = rng.choice(len(IRRIGATIONS), n, p=_IRRIGATION[2] / _IRRIGATION[2].sum())
+    lat = rng.uniform(*LAT_RANGE, n)
+    lon = rng.uniform(*LON_RANGE, n)
+    temp = 32.0 - 0.45 * (lat - LAT_RANGE[0]) + rng.normal(0, 3.0, n)
+    mean_rain = 60.0 + 4.0 * (lon - LON_RANGE[0])
+    rainfall = rng.gamma(2.0, mean_rain / 2.0)
+    humidity = np.clip(45.0 + 0.1 * rainfall + rng.normal(0, 8.0, n), 15, 100)
+    oc = np.clip(rng.lognormal(np.log(_SOIL[1, soil]), 0.3), 0.05, 12)
+    ph = np.clip(_SOIL[2, soil] + rng.normal(0, 0.4, n), 3.5, 10)
+    acres = np.clip(rng.lognormal(np.log(5.0), 0.8, n), 0.25, 500)
+    yields = yield_curve(crop, soil, irrigation, temp, rainfall, oc, ph) * rng.lognormal(0, 0.08, n)
+    return pd.DataFrame({
+        'soil_type': pd.Categorical.from_codes(soil, SOILS),
+        'crop_type': pd.Categorical.from_codes(crop, CROPS),
+        'irrigation_type': pd.Categorical.from_codes(irrigation, IRRIGATIONS),
+        'acres': acres.round(2),
+        'lat': lat.round(4),
+        'lon': lon.round(4),
+        'temp': temp.round(1),
+        'humidity': humidity.round(1),
+        'rainfall': rainfall.round(1),
+        'oc': oc.round(3),
+        'ph': ph.round(2),
+        'yield': yields.round(3),
+    }, columns=COLUMNS)
+
+
+def generate(rows, seed=42, chunk_rows=500000):
+    """Yield DataFrames totalling `rows` records."""
+    for chunk, start in enumerate(range(0, rows, chunk_rows)):
+        yield generate_chunk(min(chunk_rows, rows - start), seed, chunk)
+
+
+def write_csv(chunks, path):
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        pa = None
+    if pa is None:
+        with open(path, 'w', newline='') as f:
+            for k, df in enumerate(chunks):
+                df.to_csv(f, header=(k == 0), index=False)
+                yield len(df)
+        return
+    # pyarrow's writer is several times faster than DataFrame.to_csv
+    writer = None
+    try:
+        for df in chunks:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pa_csv.CSVWriter(path, table.schema,
+                                          write_options=pa_csv.WriteOptions(quoting_style='needed'))
+            writer.write_table(table)
+            yield len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def write_parquet(chunks, path):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    writer = None
+    try:
+        for df in chunks:
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, table.schema)
+            # one row group per chunk
+            writer.write_table(table)
+            yield len(df)
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def create_table(conn, table):
+    """Create the yield table (with an increasing id for dataset_cache) if missing."""
+    import ingest
+    if ingest.placeholder(conn) == '?':
+        key = 'id INTEGER PRIMARY KEY AUTOINCREMENT'
+    else:
+        key = 'id BIGINT AUTO_INCREMENT PRIMARY KEY'
+    cursor = conn.cursor()
+    cursor.execute(f"""CREATE TABLE IF NOT EXISTS {table} ({key},
+        soil_type VARCHAR(32), crop_type VARCHAR(32), irrigation_type VARCHAR(32),
+        acres DOUBLE, lat DOUBLE, lon DOUBLE, temp DOUBLE, humidity DOUBLE,
+        rainfall DOUBLE, oc DOUBLE, ph DOUBLE, yield DOUBLE)""")
+    cursor.close()
+    conn.commit()
+
+
+def insert_sql(chunks, conn, table='yield_data', batch_rows=20000):
+    """Bulk-insert through any DB-API connection (sqlite3 stand-in or pymysql)."""
+    import ingest
+    create_table(conn, table)
+    marker = ingest.placeholder(conn)
+    query = f"INSERT INTO {table} ({', '.join(COLUMNS)}) VALUES ({', '.join([marker] * len(COLUMNS))})"
+    cursor = conn.cursor()
+    for df in chunks:
+        # plain Python values for the driver
+        rows = list(df.astype({c: str for c in ('soil_type', 'crop_type', 'irrigation_type')})
+                    .itertuples(index=False, name=None))
+        for start in range(0, len(rows), batch_rows):
+            cursor.executemany(query, rows[start:start + batch_rows])
+        conn.commit()
+        yield len(df)
+    cursor.close()
+
+
+def insert_mongo(chunks, collection, batch_rows=50000):
+    """Bulk-insert into a pymongo (or mongomock) collection."""
+    for df in chunks:
+        records = df.astype({c: str for c in ('soil_type', 'crop_type', 'irrigation_type')}).to_dict('records')
+        for start in range(0, len(records), batch_rows):
+            collection.insert_many(records[start:start + batch_rows], ordered=False)
+        yield len(df)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic yield records')
+    parser.add_argument('--rows', type=lambda v: int(float(v)), default=1000000,
+                        help='number of records, e.g. 1e7')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-rows', type=int, default=500000)
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--out', help='.csv or .parquet file')
+    target.add_argument('--sqlite', help='SQLite database file (stand-in for MySQL)')
+    target.add_argument('--mysql', help='host:port/database')
+    target.add_argument('--mongo', help='MongoDB URI')
+    parser.add_argument('--table', default='yield_data', help='table or collection name')
+    parser.add_argument('--db', default='agri_db', help='MongoDB database')
+    parser.add_argument('--user', default='root')
+    parser.add_argument('--password', default='')
+    args = parser.parse_args()
+
+    chunks = generate(args.rows, args.seed, args.chunk_rows)
+    if args.out:
+        if args.out.endswith('.parquet'):
+            written = write_parquet(chunks, args.out)
+        else:
+            written = write_csv(chunks, args.out)
+    elif args.sqlite:
+        import sqlite3
+        written = insert_sql(chunks, sqlite3.connect(args.sqlite), args.table)
+    elif args.mysql:
+        import pymysql
+        address, database = args.mysql.split('/', 1)
+        host, _, port = address.partition(':')
+        conn = pymysql.connect(host=host, port=int(port or 3306), user=args.user,
+                               password=args.password, database=database)
+        written = insert_sql(chunks, conn, args.table)
+    else:
+        import pymongo
+        written = insert_mongo(chunks, pymongo.MongoClient(args.mongo)[args.db][args.table])
+
+    start, total = time.perf_counter(), 0
+    for n in written:
+        total += n
+        elapsed = time.perf_counter() - start
+        print(f"{total:,}/{args.rows:,} rows  {total / elapsed:,.0f} rows/s", flush=True)
+    print(f"Wrote {total:,} rows in {time.perf_counter() - start:.1f}s")
+
+
+if __name__ == '__main__':
+    main()
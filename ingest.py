@@ -0,0 +1,223 @@
+# ingest.py
+# Streams yield records out of MongoDB or a SQL database in batches and
+# encodes each batch straight into preallocated float32 arrays (in memory or
+# memory-mapped .npy files), so the raw table never has to fit in RAM.
+#
+#   X, y = ingest(mongo_batches(collection), expected_rows=mongo_count(collection))
+#   X, y = ingest(sql_batches(conn, 'yield_data'), expected_rows=sql_count(conn, 'yield_data'),
+#                 directory='ingest_cache')
+#
+# Works the same against mongomock collections and sqlite3 connections.
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from feature_encoder import ENCODER
+
+TARGET = 'yield'
+# trainers historically used 2.0 for records without a yield value
+DEFAULT_TARGET = 2.0
+BATCH_SIZE = int(os.environ.get('INGEST_BATCH_SIZE', 50000))
+
+
+def mongo_count(collection, query=None):
+    return collection.count_documents(query or {})
+
+
+def mongo_batches(collection, batch_size=BATCH_SIZE, query=None, fields=None, sort=None):
+    """Yield lists of documents, fetched from the server `batch_size` at a time.
+
+    Only the encoder's feature columns and the target are transferred;
+    `sort` names a field to return documents in ascending order of.
+    """
+    fields = fields or ENCODER.features + [TARGET]
+    cursor = collection.find(query or {}, {f: 1 for f in fields}, batch_size=batch_size)
+    if sort:
+        cursor = cursor.sort(sort, 1)
+    batch = []
+    for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _streaming_cursor(conn):
+    # pymysql's default cursor buffers the whole result set client-side; the
+    # SSCursor streams rows from the server as they are fetched
+    if type(conn).__module__.startswith('pymysql'):
+        import pymysql.cursors
+        return conn.cursor(pymysql.cursors.SSCursor)
+    return conn.cursor()
+
+
+def placeholder(conn):
+    """Query parameter marker of the connection's driver: '?' for sqlite3, '%s' for pymysql."""
+    module = sys.modules.get(type(conn).__module__.split('.')[0])
+    return '?' if getattr(module, 'paramstyle', 'format') == 'qmark' else '%s'
+
+
+def sql_count(conn, table, where=None, params=()):
+    cursor = conn.cursor()
+    cursor.execute(f"SELECT COUNT(*) FROM {table}" + (f" WHERE {where}" if where else ''), params)
+    count = cursor.fetchone()[0]
+    cursor.close()
+    return count
+
+
+def sql_batches(conn, table, batch_size=BATCH_SIZE, columns=None, where=None, params=(), order_by=None):
+    """Yield DataFrames of up to `batch_size` rows from a DB-API connection."""
+    columns = columns or ENCODER.features + [TARGET]
+    query = f"SELECT {', '.join(columns)} FROM {table}"
+    if where:
+        query += f" WHERE {where}"
+    if order_by:
+        query += f" ORDER BY {order_by}"
+    cursor = _streaming_cursor(conn)
+    try:
+        cursor.execute(query, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield pd.DataFrame.from_records(rows, columns=columns)
+    finally:
+        cursor.close()
+
+
+def target_values(batch, target=TARGET, default=DEFAULT_TARGET):
+    """The target column of a batch (DataFrame or list of dicts) as float32."""
+    if isinstance(batch, pd.DataFrame):
+        values = batch[target] if target in batch.columns else pd.Series(np.nan, index=batch.index)
+    else:
+        values = pd.Series([d.get(target) for d in batch], dtype='object')
+    return pd.to_numeric(values, errors='coerce').fillna(default).to_numpy(dtype=np.float32)
+
+
+def resize_npy(path, rows):
+    """Set the row count of an .npy file in place, truncating or zero-extending it.
+
+    Only the header's shape and the file length change, so no data is copied.
+    """
+    with open(path, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(f)
+        offset = f.tell()
+        prefix = 6 + 2 + (2 if version == (1, 0) else 4)  # magic, version, header length
+        new_shape = (rows,) + tuple(shape[1:])
+        header = repr({'descr': np.lib.format.dtype_to_descr(dtype), 'fortran_order': fortran,
+                       'shape': new_shape})
+        # keep the header length (and so the data offset) unchanged; numpy
+        # leaves spare padding for exactly this kind of growth
+        if len(header) + 1 > offset - prefix:
+            raise ValueError(f'no room to grow the header of {path}')
+        header = header.ljust(offset - prefix - 1) + '\n'
+        f.seek(prefix)
+        f.write(header.encode('latin1'))
+        f.truncate(offset + rows * dtype.itemsize * int(np.prod(shape[1:], dtype=np.int64)))
+
+
+class ColumnarBuffer:
+    """Growable (rows, num_features) float32 matrix plus a float32 target.
+
+    With `directory` set the arrays are memory-mapped X.npy / y.npy files
+    there, grown in place; `rows` > 0 reopens files already holding that
+    many valid rows and appends after them (anything past them is dropped).
+    Otherwise the arrays live in memory and capacity doubles when exceeded,
+    so pass a good row-count estimate to avoid reallocating.
+    """
+
+    def __init__(self, num_features, capacity=1 << 16, directory=None, rows=0):
+        self.num_features = num_features
+        self.directory = directory
+        self.rows = rows
+        capacity = max(1, rows + capacity)
+        if not directory:
+            self.X = np.empty((capacity, num_features), dtype=np.float32)
+            self.y = np.empty(capacity, dtype=np.float32)
+            return
+        os.makedirs(directory, exist_ok=True)
+        x_path, y_path = self._paths()
+        if rows:
+            self._map(capacity)
+        else:
+            self.X = np.lib.format.open_memmap(x_path, 'w+', np.float32, (capacity, num_features))
+            self.y = np.lib.format.open_memmap(y_path, 'w+', np.float32, (capacity,))
+
+    def _paths(self):
+        return os.path.join(self.directory, 'X.npy'), os.path.join(self.directory, 'y.npy')
+
+    def _map(self, capacity, mode='r+'):
+        for path in self._paths():
+            resize_npy(path, capacity)
+        x_path, y_path = self._paths()
+        self.X = np.load(x_path, mmap_mode=mode)
+        self.y = np.load(y_path, mmap_mode=mode)
+
+    def _unmap(self):
+        self.X.flush()
+        self.y.flush()
+        del self.X, self.y
+
+    def _grow(self, needed):
+        capacity = max(needed, 2 * len(self.y))
+        if self.directory:
+            self._unmap()
+            self._map(capacity)
+            return
+        X = np.empty((capacity, self.num_features), dtype=np.float32)
+        y = np.empty(capacity, dtype=np.float32)
+        X[:self.rows] = self.X[:self.rows]
+        y[:self.rows] = self.y[:self.rows]
+        self.X, self.y = X, y
+
+    def reserve(self, n):
+        """Writable views of the next n rows of X and y."""
+        if self.rows + n > len(self.y):
+            self._grow(self.rows + n)
+        start, self.rows = self.rows, self.rows + n
+        return self.X[start:self.rows], self.y[start:self.rows]
+
+    def flush(self):
+        """Make the rows written so far durable (memory-mapped mode)."""
+        if self.directory:
+            self.X.flush()
+            self.y.flush()
+
+    def finish(self):
+        """Return (X, y) holding exactly the rows written."""
+        if not self.directory:
+            return self.X[:self.rows], self.y[:self.rows]
+        self._unmap()
+        if not self.rows:
+            # an empty file cannot be memory-mapped
+            for path in self._paths():
+                resize_npy(path, 0)
+            return np.empty((0, self.num_features), dtype=np.float32), np.empty(0, dtype=np.float32)
+        self._map(self.rows, mode='r')
+        return self.X, self.y
+
+
+def ingest(batches, encoder=ENCODER, expected_rows=None, directory=None, on_batch=None, target=TARGET):
+    """Encode a stream of batches into (X, y).
+
+    Each batch (a DataFrame or a list of dicts) is encoded directly into the
+    next rows of the output arrays; `on_batch(batch)` is called for each one,
+    e.g. to collect unmapped categories.
+    """
+    buffer = ColumnarBuffer(len(encoder.features), expected_rows or 1 << 16, directory)
+    for batch in batches:
+        if on_batch is not None:
+            on_batch(batch)
+        X, y = buffer.reserve(len(batch))
+        encoder.encode(batch, out=X)
+        y[:] = target_values(batch, target)
+    return buffer.finish()
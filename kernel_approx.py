@@ -0,0 +1,119 @@
+# kernel_approx.py
+# Approximate RBF-kernel regression: an alternative backend for the 'svm'
+# model that scales to millions of rows.
+#
+# Rows are mapped to a fixed number of random Fourier features or Nystroem
+# components, and a ridge regression is fit on that map. The solver
+# streams over mini-batches, accumulating Z'Z and Z'y, so training is one
+# pass over the data (memory-mapped arrays are fine) and costs
+# O(rows x components^2). Prediction is one (rows x components) matrix
+# product instead of a sum over every support vector.
+#
+# Objects are plain NumPy and pickle, so model_registry loads them like the
+# SVR pickle.
+
+import numpy as np
+
+BATCH_ROWS = 8192
+
+
+class ApproxKernelRegressor:
+    """RBF kernel ridge regression on random Fourier features or Nystroem components.
+
+    kernel: 'rff' or 'nystroem'. gamma: RBF width; 'scale' matches
+    sklearn SVR's default of 1 / (n_features * X.var()). alpha: ridge penalty
+    per row.
+    """
+
+    def __init__(self, kernel='nystroem', n_components=500, gamma='scale', alpha=1e-6,
+                 batch_rows=BATCH_ROWS, random_state=0):
+        if kernel not in ('rff', 'nystroem'):
+            raise ValueError(f'unknown kernel approximation: {kernel}')
+        self.kernel = kernel
+        self.n_components = n_components
+        self.gamma = gamma
+        self.alpha = alpha
+        self.batch_rows = batch_rows
+        self.random_state = random_state
+
+    def _batches(self, n):
+        for start in range(0, n, self.batch_rows):
+            yield slice(start, min(start + self.batch_rows, n))
+
+    def _init_map(self, X):
+        rng = np.random.default_rng(self.random_state)
+        n, d = X.shape
+        if self.gamma == 'scale':
+            # X.var() in one streaming pass over the batches
+            total = total_sq = 0.0
+            for s in self._batches(n):
+                block = np.asarray(X[s], dtype=np.float64)
+                total += block.sum()
+                total_sq += np.square(block).sum()
+            var = total_sq / (n * d) - (total / (n * d)) ** 2
+            self.gamma_ = 1.0 / (d * var) if var > 0 else 1.0
+        else:
+            self.gamma_ = float(self.gamma)
+        if self.kernel == 'rff':
+            self.weights_ = rng.normal(0.0, np.sqrt(2 * self.gamma_), (d, self.n_components))
+            self.offset_ = rng.uniform(0, 2 * np.pi, self.n_components)
+        else:
+            m = min(self.n_components, n)
+            self.landmarks_ = np.asarray(X[np.sort(rng.choice(n, m, replace=False))], dtype=np.float64)
+            self.landmark_sq_ = np.square(self.landmarks_).sum(axis=1)
+            # K_mm^(-1/2), dropping near-zero eigenvalues of duplicate landmarks
+            eigvals, eigvecs = np.linalg.eigh(self._rbf(self.landmarks_, self.landmarks_, self.landmark_sq_))
+            keep = eigvals > 1e-8 * eigvals.max()
+            self.normalization_ = eigvecs[:, keep] / np.sqrt(eigvals[keep])
+
+    @property
+    def n_features_in_(self):
+        # as on sklearn estimators; derived from the fitted map so older pickles have it too
+        return self.weights_.shape[0] if self.kernel == 'rff' else self.landmarks_.shape[1]
+
+    def _rbf(self, A, B, B_sq):
+        d2 = np.square(A).sum(axis=1)[:, None] + B_sq[None, :] - 2 * A @ B.T
+        return np.exp(-self.gamma_ * np.maximum(d2, 0))
+
+    def transform(self, X):
+        """Map rows of X to the approximate kernel feature space."""
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[None, :]
+        if self.kernel == 'rff':
+            return np.sqrt(2.0 / self.n_components) * np.cos(X @ self.weights_ + self.offset_)
+        return self._rbf(X, self.landmarks_, self.landmark_sq_) @ self.normalization_
+
+    def fit(self, X, y):
+        """Fit in one pass over mini-batches of `batch_rows` rows."""
+        self._init_map(X)
+        k = self.normalization_.shape[1] if self.kernel == 'nystroem' else self.n_components
+        gram = np.zeros((k, k))
+        zty = np.zeros(k)
+        zsum = np.zeros(k)
+        ysum = 0.0
+        n = len(y)
+        for s in self._batches(n):
+            Z = self.transform(X[s])
+            yb = np.asarray(y[s], dtype=np.float64)
+            gram += Z.T @ Z
+            zty += Z.T @ yb
+            zsum += Z.sum(axis=0)
+            ysum += yb.sum()
+        # centre features and target so the intercept is not penalized
+        zmean, ymean = zsum / n, ysum / n
+        gram -= n * np.outer(zmean, zmean)
+        zty -= n * zmean * ymean
+        gram[np.diag_indices_from(gram)] += self.alpha * n
+        self.coef_ = np.linalg.solve(gram, zty)
+        self.intercept_ = ymean - zmean @ self.coef_
+        return self
+
+    def predict(self, X):
+        X = np.asarray(X)
+        if X.ndim == 1:
+            X = X[None, :]
+        out = np.empty(len(X))
+        for s in self._batches(len(X)):
+            out[s] = self.transform(X[s]) @ self.coef_ + self.intercept_
+        return out
@@ -0,0 +1,190 @@
+# metrics.py
+# In-process latency histograms and counters rendered in the Prometheus text
+# format, plus an opt-in sampling profiler for slow requests.
+#
+# Metrics are per process: under serve.py every gunicorn worker exposes its
+# own numbers and the scraper aggregates them.
+
+import os
+import sys
+import threading
+import time
+from collections import Counter as _Tally
+from contextlib import contextmanager
+
+# seconds; tuned for sub-millisecond lookups up to slow SoilGrids calls
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                   0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _labels(names, values):
+    if not names:
+        return ''
+    pairs = ','.join('{}="{}"'.format(n, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+                     for n, v in zip(names, values))
+    return '{' + pairs + '}'
+
+
+class Counter:
+    def __init__(self, name, help, labelnames=()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} counter']
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.append(f'{self.name}{_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time: fn() -> {label tuple: value}."""
+
+    def __init__(self, name, help, labelnames, fn, kind='gauge'):
+        self.name, self.help, self.labelnames, self.fn, self.kind = name, help, tuple(labelnames), fn, kind
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} {self.kind}']
+        for labels, value in sorted(self.fn().items()):
+            lines.append(f'{self.name}{_labels(self.labelnames, labels)} {value}')
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for k, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][k] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            for labels, (counts, total, count) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, c in zip(self.buckets, counts):
+                    cumulative += c
+                    le = _labels(self.labelnames + ('le',), labels + (repr(bound),))
+                    lines.append(f'{self.name}_bucket{le} {cumulative}')
+                le = _labels(self.labelnames + ('le',), labels + ('+Inf',))
+                lines.append(f'{self.name}_bucket{le} {count}')
+                lines.append(f'{self.name}_sum{_labels(self.labelnames, labels)} {total}')
+                lines.append(f'{self.name}_count{_labels(self.labelnames, labels)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'yield_stage_seconds', 'Time spent per request stage', ('stage', 'model')))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    'yield_request_seconds', 'End-to-end request latency', ('endpoint', 'status')))
+ERRORS = REGISTRY.register(Counter(
+    'yield_errors_total', 'Prediction errors', ('endpoint', 'model', 'kind')))
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+@contextmanager
+def timed(stage, model=''):
+    """Record the duration of the enclosed block under yield_stage_seconds."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - start, stage, model)
+
+
+class SlowRequestProfiler:
+    """Samples the stacks of in-flight request threads every `interval` seconds.
+
+    When a request finishes after more than `threshold` seconds its samples are
+    written to `out_dir` in the folded-stack format read by flamegraph.pl and
+    speedscope. Off unless PROFILE_SLOW_MS is set.
+    """
+
+    def __init__(self, threshold, out_dir='profiles', interval=0.005):
+        self.threshold = threshold
+        self.out_dir = out_dir
+        self.interval = interval
+        self._active = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            with self._lock:
+                for ident, samples in self._active.items():
+                    frame = frames.get(ident)
+                    if frame is None:
+                        continue
+                    stack = []
+                    while frame is not None:
+                        code = frame.f_code
+                        stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}')
+                        frame = frame.f_back
+                    samples[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        ident = threading.get_ident()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='slow-request-profiler', daemon=True)
+                self._thread.start()
+            self._active[ident] = _Tally()
+        return time.perf_counter()
+
+    def stop(self, started, label):
+        with self._lock:
+            samples = self._active.pop(threading.get_ident(), None)
+        elapsed = time.perf_counter() - started
+        if samples and elapsed >= self.threshold:
+            os.makedirs(self.out_dir, exist_ok=True)
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(elapsed * 1000)}ms-{label}-{os.getpid()}.folded"
+            with open(os.path.join(self.out_dir, name), 'w') as f:
+                for stack, count in samples.items():
+                    f.write(f'{stack} {count}\n')
+        return elapsed
+
+
+def profiler_from_env():
+    threshold_ms = os.environ.get('PROFILE_SLOW_MS')
+    if not threshold_ms:
+        return None
+    return SlowRequestProfiler(float(threshold_ms) / 1000.0,
+                               out_dir=os.environ.get('PROFILE_DIR', 'profiles'),
+                               interval=float(os.environ.get('PROFILE_INTERVAL_MS', 5)) / 1000.0)
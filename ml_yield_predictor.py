@@ -1,18 +1,24 @@
 # ml_yield_predictor.py
 # Simple ML model for crop yield prediction (example)
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 
 import numpy as np
-import pickle
 from flask_cors import CORS
-import xgboost as xgb
 import os
-import lightgbm as lgb
-import requests
 import logging
+import threading
+import time
 # CSV yield lookup
+import climate_store
 import csv_yield_lookup
+import soil_client
+from spatial_index import SpatialYieldIndex
+from feature_encoder import CROP_MAP, ENCODER, IRRIGATION_MAP, SVM_ENCODER, model_columns
+from model_registry import ModelRegistry, registry_key
+from prediction_cache import PredictionCache
+from metrics import (CONTENT_TYPE, ERRORS, REGISTRY as METRICS, REQUEST_SECONDS, Gauge,
+                     profiler_from_env, timed)
 
 app = Flask(__name__)
 CORS(app)
@@ -25,116 +31,151 @@ app.logger.setLevel(logging.INFO)
 def health():
     return jsonify({
         'status': 'ok',
-        'models_loaded': {
-            'svm': svm_model is not None,
-            'lgb': lgb_model is not None,
-            'xgb': xgb_model is not None
-        },
-        'model_load_errors': model_load_errors
+        'models': registry.status(),
+        'model_load_errors': registry.errors(),
+        'feature_schema_version': ENCODER.version,
+        'soil_cache': soil_client.default_client().stats,
+        'climate': None if climate_store.default_store() is None else climate_store.default_store().stats(),
+        'prediction_cache': prediction_cache.stats(),
+        'spatial_index': None if _spatial is None else {'records': len(_spatial), 'source': SPATIAL_INDEX_CSV}
     })
 
 
 
 
 def get_soil_data(lat, lon):
-    url = f"https://rest.isric.org/soilgrids/v2.0/properties/query?lon={lon}&lat={lat}&property=ocd&property=phh2o"
-    try:
-        resp = requests.get(url)
-        data = resp.json()
-        # Extract organic carbon (ocd) and pH (phh2o) from SoilGrids v2.0 response
-        oc = 1.0
-        ph = 7.0
-        if 'properties' in data:
-            if 'ocd' in data['properties'] and 'values' in data['properties']['ocd']:
-                oc_val = data['properties']['ocd']['values'][0].get('value', 1.0)
-                oc = float(oc_val)
-            if 'phh2o' in data['properties'] and 'values' in data['properties']['phh2o']:
-                ph_val = data['properties']['phh2o']['values'][0].get('value', 7.0)
-                ph = float(ph_val)
-        return oc, ph
-    except Exception as e:
-        return 1.0, 7.0
+    # Offline soil tiles first, then the pooled/cached SoilGrids client;
+    # falls back to (1.0, 7.0) on failure
+    return soil_client.get_soil_data(lat, lon)
 
-def encode_features(soil_type, crop_type, irrigation_type, acres, lat, lon):
+def encode_features(soil_type, crop_type, irrigation_type, acres, lat, lon, soil_data=None, month=None):
     """
-    Encode features for model prediction using default environmental values
-    that match our training data.
+    Encode features for model prediction. Pass soil_data=(oc, ph) to skip the
+    lookup. temp/humidity/rainfall are the location's normals for `month`
+    (default: this month) from the climate store, or the encoder defaults
+    used in training where there is no store or no data.
     """
-    # Use default environmental values that match training
-    temp = 28.5  # Average temperature in Celsius
-    humidity = 65.0  # Average humidity percentage
-    rainfall = 150.0  # Average monthly rainfall in mm
-    # Use same encoding as training script
-    soil_map = {'loamy':0,'sandy':1,'clay':2,'silt':3,'peat':4,'chalk':5,'red':6,'laterite':7,'black':8,'alluvial':9,'saline':10,'peaty':11,'mixed':12,
-        'vertisol':13,'luvisol':14,'gleysol':15,'regosol':16,'arenosol':17,'cambisol':18,'fluvisol':19,'podzol':20,'umbrisol':21,'unknown':0}
-    crop_map = {
-        'wheat': 0, 'rice': 1, 'cotton': 2, 'vegetables': 3, 'pulses': 4,
-        'peanuts': 5, 'watermelon': 6, 'potatoes': 7, 'carrots': 8, 'cantaloupe': 9,
-        'soybean': 10, 'broccoli': 11, 'cabbage': 12, 'tomatoes': 13, 'onions': 14,
-        'garlic': 15, 'peppers': 16, 'lettuce': 17, 'celery': 18, 'barley': 19,
-        'beet': 20, 'spinach': 21, 'millets': 22, 'groundnut': 23, 'cashew': 24,
-        'pineapple': 25, 'tea': 26, 'coffee': 27, 'sunflower': 28, 'jute': 29,
-        'sugarcane': 30, 'sugar beet': 31
-    }
-    irrigation_map = {'drip':0,'sprinkler':1,'canal':2,'none':3}
-    s = soil_map.get(str(soil_type).lower(), 0)
-    c = crop_map.get(str(crop_type).lower(), 0)
-    i = irrigation_map.get(str(irrigation_type).lower(), 0)
-    try:
-        a = float(acres)
-    except:
-        a = 1.0
-    # Use provided environmental values (no mocking)
+    oc, ph = soil_data if soil_data is not None else get_soil_data(lat, lon)
+    return ENCODER.encode({'soil_type': soil_type, 'crop_type': crop_type,
+                           'irrigation_type': irrigation_type, 'acres': acres,
+                           'oc': oc, 'ph': ph, **climate_store.climate_features(lat, lon, month)})
+
+
+MODEL_TYPES = ('svm', 'lgb', 'xgb')
+# 'native' uses lightgbm/xgboost, 'compiled' the NumPy tree_engine and 'auto'
+# the compiled engine for small batches only (it has far less per-call overhead
+# but the native libraries are faster on large batches). 'tensor' serves
+# lgb/xgb/svm from the prediction_tensor.py snapshot of the model. A request
+# may override it with an 'engine' field.
+DEFAULT_ENGINE = os.environ.get('TREE_ENGINE', 'native')
+AUTO_COMPILED_MAX_ROWS = int(os.environ.get('TREE_ENGINE_AUTO_MAX_ROWS', 16))
+# 'kernel' serves the sklearn SVR, 'approx' the kernel_approx regressor
+# (same inputs, prediction cost independent of the training set size)
+SVM_BACKEND = os.environ.get('SVM_BACKEND', 'kernel')
+
+def _registry_key(model_type, engine, rows=1):
+    return registry_key(model_type, engine, rows, SVM_BACKEND, AUTO_COMPILED_MAX_ROWS)
+
+# Models are loaded lazily on first use (MODEL_PRELOAD=1 loads them in the
+# background at startup) and hot-reloaded when their files change on disk.
+registry = ModelRegistry(reload_interval=float(os.environ.get('MODEL_RELOAD_INTERVAL', 5.0)))
+if os.environ.get('MODEL_PRELOAD') == '1':
+    registry.preload([_registry_key(m, DEFAULT_ENGINE) for m in MODEL_TYPES] +
+                     ([f'{m}_compiled' for m in ('lgb', 'xgb')] if DEFAULT_ENGINE == 'auto' else []))
+
+# yield_per_acre cache; entries of a model or of the CSV table are dropped when
+# it is reloaded
+prediction_cache = PredictionCache(
+    max_entries=int(os.environ.get('PREDICTION_CACHE_SIZE', 100000)),
+    ttl=float(os.environ.get('PREDICTION_CACHE_TTL', 3600)),
+    max_bytes=int(os.environ.get('PREDICTION_CACHE_BYTES', 64 * 1024 * 1024)))
+registry.add_listener(prediction_cache.invalidate)
+csv_yield_lookup.add_reload_listener(lambda: prediction_cache.invalidate('csv'))
+
+def _csv_yield(soil_type, crop_type, irrigation_type):
+    csv_yield_lookup.reload_if_changed()
+    key = prediction_cache.key('csv', str(soil_type).strip().lower(), str(crop_type).strip().lower(),
+                               str(irrigation_type).strip().lower())
+    yield_per_acre = prediction_cache.get(key)
+    if yield_per_acre is None:
+        yield_per_acre = csv_yield_lookup.lookup_yield(soil_type, crop_type, irrigation_type)
+        if yield_per_acre is not None:
+            prediction_cache.put(key, yield_per_acre)
+    return yield_per_acre
+
+# Local evidence ('model': 'knn'): distance-weighted mean yield of the
+# SPATIAL_K nearest geotagged records of the same crop and irrigation within
+# SPATIAL_MAX_KM. Rows appended to SPATIAL_INDEX_CSV are inserted every
+# SPATIAL_REFRESH_INTERVAL seconds; no model or network call is involved.
+SPATIAL_INDEX_CSV = os.environ.get('SPATIAL_INDEX_CSV', 'training_data.csv')
+SPATIAL_TARGET = os.environ.get('SPATIAL_TARGET', 'yield_per_acre')
+SPATIAL_K = int(os.environ.get('SPATIAL_K', 8))
+SPATIAL_MAX_KM = float(os.environ.get('SPATIAL_MAX_KM', 50.0))
+SPATIAL_REFRESH_INTERVAL = float(os.environ.get('SPATIAL_REFRESH_INTERVAL', 5.0))
+_spatial = None
+_spatial_checked = 0.0
+_spatial_lock = threading.Lock()
+
+def get_spatial_index():
+    """The spatial index, built on first use and topped up with appended rows; None if unavailable."""
+    global _spatial, _spatial_checked
+    now = time.monotonic()
+    if _spatial is not None and now - _spatial_checked < SPATIAL_REFRESH_INTERVAL:
+        return _spatial
+    # one thread builds or refreshes; the others keep using the current index
+    if not _spatial_lock.acquire(blocking=_spatial is None):
+        return _spatial
     try:
-        t = float(temp)
-        h = float(humidity)
-        r = float(rainfall)
-    except Exception:
-        raise ValueError('temp, humidity and rainfall must be numeric and provided')
-    oc, ph = get_soil_data(lat, lon)
-    return np.array([[s, c, i, a, t, h, r, oc, ph]])
-
-
-# Robust model loading with error handling
-svm_model = None
-lgb_model = None
-xgb_model = None
-model_load_errors = []
-try:
-    if os.path.exists('svm_yield_model.pkl'):
-        svm_model = pickle.load(open('svm_yield_model.pkl', 'rb'))
-    else:
-        model_load_errors.append('svm_yield_model.pkl not found')
-except Exception as e:
-    model_load_errors.append(f'SVM model load error: {e}')
-try:
-    if os.path.exists('lgb_yield_model.txt'):
-        lgb_model = lgb.Booster(model_file='lgb_yield_model.txt')
-    else:
-        model_load_errors.append('lgb_yield_model.txt not found')
-except Exception as e:
-    model_load_errors.append(f'LightGBM model load error: {e}')
-try:
-    if os.path.exists('xgb_yield_model.json'):
-        xgb_model = xgb.XGBRegressor()
-        xgb_model.load_model('xgb_yield_model.json')
-    else:
-        model_load_errors.append('xgb_yield_model.json not found')
-except Exception as e:
-    model_load_errors.append(f'XGBoost model load error: {e}')
+        if _spatial is None:
+            _spatial = SpatialYieldIndex.from_csv(SPATIAL_INDEX_CSV, target=SPATIAL_TARGET,
+                                                  max_km=SPATIAL_MAX_KM)
+            logging.info("Built spatial index from %s (%d records)", SPATIAL_INDEX_CSV, len(_spatial))
+        elif now - _spatial_checked >= SPATIAL_REFRESH_INTERVAL:
+            added = _spatial.refresh()
+            if added:
+                logging.info("Added %d records to the spatial index", added)
+        _spatial_checked = now
+    except (OSError, ValueError) as e:
+        logging.error("Spatial index unavailable: %s", e)
+    finally:
+        _spatial_lock.release()
+    return _spatial
+
+def _knn_result(yield_per_acre, neighbours, max_km, acres):
+    result = _format_result(round(float(yield_per_acre), 2), acres, f'{neighbours} nearby records')
+    result['evidence'] = {'neighbours': int(neighbours), 'max_distance_km': round(float(max_km), 2)}
+    return result
+
+def _model_yields(name, model, X):
+    """model.predict over the rows of X, served from the cache where possible."""
+    keys = [prediction_cache.key(name, row.tobytes()) for row in X]
+    yields = np.array([prediction_cache.get(k) for k in keys], dtype=np.float64)
+    misses = np.flatnonzero(np.isnan(yields))
+    if len(misses):
+        preds = np.asarray(model.predict(model_columns(model, X[misses])), dtype=np.float64)
+        yields[misses] = preds
+        for k, value in zip(misses, preds):
+            prediction_cache.put(keys[k], float(value))
+    return yields
+
+def _respond(payload, model_type, status=200):
+    with timed('serialize', model_type):
+        return jsonify(payload), status
 
 @app.route('/predict', methods=['POST'])
 def predict():
-    data = request.get_json(force=True)
-    # Validate required input fields
-    required_fields = ['soil_type', 'crop_type', 'irrigation_type', 'acres', 'lat', 'lon', 'model']
-    missing = [f for f in required_fields if f not in data]
+    # Always use CSV for prediction, unless local evidence is asked for.
+    # The model is only known once the body is parsed: parsing is recorded under 'predict'
+    with timed('parse', 'predict'):
+        data = request.get_json(force=True)
+    model_type = 'knn' if isinstance(data, dict) and str(data.get('model', '')).lower() == 'knn' else 'csv'
+    with timed('validate', model_type):
+        # Validate required input fields
+        required_fields = ['soil_type', 'crop_type', 'irrigation_type', 'acres', 'lat', 'lon', 'model']
+        missing = [f for f in required_fields if f not in data]
     if missing:
-        return jsonify({'error': f'Missing required fields: {missing}'}), 400
-
-    # Check model load errors
-    if model_load_errors:
-        return jsonify({'error': 'Model load error', 'details': model_load_errors}), 500
+        ERRORS.inc('predict', model_type, 'validation')
+        return _respond({'error': f'Missing required fields: {missing}'}, model_type, 400)
 
     soil_type = data.get('soil_type', '')
     crop_type = data.get('crop_type', '')
@@ -142,96 +183,350 @@ def predict():
     acres = data.get('acres', 1)
     lat = data.get('lat', 20.3)
     lon = data.get('lon', 85.8)
-    # Always use CSV for prediction
-    model_type = 'csv'
-
+    engine = str(data.get('engine', DEFAULT_ENGINE)).lower()
 
     try:
-        logging.info(f"Prediction request: model={model_type}, soil={soil_type}, crop={crop_type}, irrigation={irrigation_type}, acres={acres}, lat={lat}, lon={lon}")
+        logging.info("Prediction request: model=%s, soil=%s, crop=%s, irrigation=%s, acres=%s, lat=%s, lon=%s",
+                     model_type, soil_type, crop_type, irrigation_type, acres, lat, lon)
         if model_type == 'csv':
             # Use CSV lookup for yield per acre
-            yield_per_acre = csv_yield_lookup.lookup_yield(soil_type, crop_type, irrigation_type)
+            with timed('inference', model_type):
+                yield_per_acre = _csv_yield(soil_type, crop_type, irrigation_type)
             if yield_per_acre is None:
-                return jsonify({'error': 'No matching entry in CSV for given inputs.'}), 404
-            total_yield = round(yield_per_acre * float(acres), 2)
-            concise = f"Predicted yield per acre: {yield_per_acre} tons, Total yield: {total_yield} tons (CSV)"
-            logging.info(f"CSV Prediction result: {concise}")
-            return jsonify({
-                'predicted_yield_per_acre': yield_per_acre,
-                'total_yield': total_yield,
-                'acres': acres,
-                'message': concise
-            })
-        elif model_type == 'svm':
-            if svm_model is None:
-                return jsonify({'error': 'SVM model not loaded.'}), 500
-            soil_map = {'loamy':0,'sandy':1,'clay':2,'silt':3,'peat':4,'chalk':5,'red':6,'laterite':7,'black':8,'alluvial':9,'saline':10,'peaty':11,'mixed':12,
-                'vertisol':13,'luvisol':14,'gleysol':15,'regosol':16,'arenosol':17,'cambisol':18,'fluvisol':19,'podzol':20,'umbrisol':21,'unknown':0}
-            crop_map = {
-                'wheat': 0, 'rice': 1, 'cotton': 2, 'vegetables': 3, 'pulses': 4,
-                'peanuts': 5, 'watermelon': 6, 'potatoes': 7, 'carrots': 8, 'cantaloupe': 9,
-                'soybean': 10, 'broccoli': 11, 'cabbage': 12, 'tomatoes': 13, 'onions': 14,
-                'garlic': 15, 'peppers': 16, 'lettuce': 17, 'celery': 18, 'barley': 19,
-                'beet': 20, 'spinach': 21, 'millets': 22, 'groundnut': 23, 'cashew': 24,
-                'pineapple': 25, 'tea': 26, 'coffee': 27, 'sunflower': 28, 'jute': 29,
-                'sugarcane': 30, 'sugar beet': 31
-            }
-            irrigation_map = {'drip':0,'sprinkler':1,'canal':2,'none':3}
-            s = soil_map.get(soil_type.lower(), 0)
-            c = crop_map.get(crop_type.lower(), 0)
-            i = irrigation_map.get(irrigation_type.lower(), 0)
+                ERRORS.inc('predict', model_type, 'not_found')
+                return _respond({'error': 'No matching entry in CSV for given inputs.'}, model_type, 404)
+            result = _format_result(yield_per_acre, acres, 'CSV')
+            logging.info("CSV Prediction result: %s", result['message'])
+            return _respond(result, model_type)
+        elif model_type == 'knn':
             try:
-                a = float(acres)
-            except:
-                a = 1.0
-            X = np.array([[s, c, i, a]])
-            pred = svm_model.predict(X)
-            yield_per_acre = round(float(pred[0]), 2)
-            total_yield = round(yield_per_acre * float(acres), 2)
-            concise = f"Predicted yield per acre: {yield_per_acre} tons, Total yield: {total_yield} tons"
-            logging.info(f"Prediction result: {concise}")
-            return jsonify({
-                'predicted_yield_per_acre': yield_per_acre,
-                'total_yield': total_yield,
-                'acres': acres,
-                'message': concise
-            })
-        elif model_type == 'lgb':
-            if lgb_model is None:
-                return jsonify({'error': 'LightGBM model not loaded.'}), 500
-            # encode using default environmental values
-            X = encode_features(soil_type, crop_type, irrigation_type, acres, lat, lon)
-            pred = lgb_model.predict(X)
-            yield_per_acre = round(float(pred[0]), 2)
-            total_yield = round(yield_per_acre * float(acres), 2)
-            concise = f"Predicted yield per acre: {yield_per_acre} tons, Total yield: {total_yield} tons"
-            logging.info(f"Prediction result: {concise}")
-            return jsonify({
-                'predicted_yield_per_acre': yield_per_acre,
-                'total_yield': total_yield,
-                'acres': acres,
-                'message': concise
-            })
-        elif model_type == 'xgb':
-            if xgb_model is None:
-                return jsonify({'error': 'XGBoost model not loaded.'}), 500
-            X = encode_features(soil_type, crop_type, irrigation_type, acres, lat, lon)
-            pred = xgb_model.predict(X)
-            yield_per_acre = round(float(pred[0]), 2)
-            total_yield = round(yield_per_acre * float(acres), 2)
-            concise = f"Predicted yield per acre: {yield_per_acre} tons, Total yield: {total_yield} tons"
-            logging.info(f"Prediction result: {concise}")
-            return jsonify({
-                'predicted_yield_per_acre': yield_per_acre,
-                'total_yield': total_yield,
-                'acres': acres,
-                'message': concise
-            })
+                lat, lon = float(lat), float(lon)
+            except (TypeError, ValueError):
+                ERRORS.inc('predict', model_type, 'validation')
+                return _respond({'error': 'lat and lon must be numeric'}, model_type, 400)
+            index = get_spatial_index()
+            if index is None:
+                ERRORS.inc('predict', model_type, 'model_unavailable')
+                return _respond({'error': 'Spatial index not available.'}, model_type, 500)
+            with timed('inference', model_type):
+                yield_per_acre, neighbours, max_km = index.knn(lat, lon, crop_type, irrigation_type, SPATIAL_K)
+            if yield_per_acre is None:
+                ERRORS.inc('predict', model_type, 'not_found')
+                return _respond({'error': f'No {crop_type} / {irrigation_type} records within '
+                                          f'{SPATIAL_MAX_KM:g} km.'}, model_type, 404)
+            result = _knn_result(yield_per_acre, neighbours, max_km, acres)
+            logging.info("Local evidence prediction result: %s", result['message'])
+            return _respond(result, model_type)
+        elif model_type in MODEL_TYPES:
+            key = _registry_key(model_type, engine)
+            model = registry.get(key)
+            if model is None:
+                ERRORS.inc('predict', model_type, 'model_unavailable')
+                return _respond({'error': f'{registry.label(key)} model not loaded.',
+                                 'details': registry.error(key)}, model_type, 500)
+            if model_type == 'svm':
+                with timed('encode', model_type):
+                    X = SVM_ENCODER.encode({'soil_type': soil_type, 'crop_type': crop_type,
+                                            'irrigation_type': irrigation_type, 'acres': acres})
+            else:
+                with timed('soil_lookup', model_type):
+                    soil = get_soil_data(lat, lon)
+                # encode using default environmental values
+                with timed('encode', model_type):
+                    X = encode_features(soil_type, crop_type, irrigation_type, acres, lat, lon, soil,
+                                        data.get('month'))
+            with timed('inference', model_type):
+                pred = _model_yields(key, model, X)
+            result = _format_result(round(float(pred[0]), 2), acres)
+            logging.info("Prediction result: %s", result['message'])
+            return _respond(result, model_type)
         else:
-            return jsonify({'error': f'Unknown model type: {model_type}'}), 400
+            ERRORS.inc('predict', model_type, 'validation')
+            return _respond({'error': f'Unknown model type: {model_type}'}, model_type, 400)
     except Exception as e:
-        return jsonify({'error': f'Prediction failed: {str(e)}'}), 500
+        ERRORS.inc('predict', model_type, 'exception')
+        return _respond({'error': f'Prediction failed: {str(e)}'}, model_type, 500)
+
+def _format_result(yield_per_acre, acres, source=''):
+    total_yield = round(yield_per_acre * float(acres), 2)
+    suffix = f" ({source})" if source else ''
+    return {
+        'predicted_yield_per_acre': yield_per_acre,
+        'total_yield': total_yield,
+        'acres': acres,
+        'message': f"Predicted yield per acre: {yield_per_acre} tons, Total yield: {total_yield} tons{suffix}"
+    }
+
+def _coords(d):
+    """(lat, lon) of a batch item as floats (defaults when absent); None if not valid coordinates."""
+    try:
+        lat, lon = float(d.get('lat', 20.3)), float(d.get('lon', 85.8))
+    except (TypeError, ValueError):
+        return None
+    if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):  # also rejects NaN
+        return None
+    return lat, lon
+
+def _predict_group(model_type, items, engine=DEFAULT_ENGINE):
+    """Run one model over a group of batch items; returns a result dict per item."""
+    if model_type == 'csv':
+        csv_yield_lookup.reload_if_changed()
+        with timed('inference', model_type):
+            yields = csv_yield_lookup.lookup_yields(
+                [d['soil_type'] for d in items],
+                [d['crop_type'] for d in items],
+                [d['irrigation_type'] for d in items])
+        return [_format_result(float(y), d['acres'], 'CSV') if not np.isnan(y)
+                else {'error': 'No matching entry in CSV for given inputs.'}
+                for d, y in zip(items, yields)]
+    if model_type == 'knn':
+        return _knn_group(items)
+    if model_type not in MODEL_TYPES:
+        return [{'error': f'Unknown model type: {model_type}'} for _ in items]
+    key = _registry_key(model_type, engine, len(items))
+    model = registry.get(key)
+    if model is None:
+        return [{'error': f'{registry.label(key)} model not loaded.'} for _ in items]
+    if model_type == 'svm':
+        # SVM was trained on the four categorical/acreage columns only
+        with timed('encode', model_type):
+            X = SVM_ENCODER.encode(items)
+    else:
+        # one soil lookup per distinct location
+        locs = [_coords(d) for d in items]
+        unique = list(set(locs))
+        with timed('soil_lookup', model_type):
+            soil = dict(zip(unique, soil_client.get_soil_data_many(unique)))
+        with timed('climate_lookup', model_type):
+            lats, lons = zip(*locs)
+            climate = climate_store.climate_columns(lats, lons, [d.get('month') for d in items])
+        with timed('encode', model_type):
+            rows = [{'soil_type': d['soil_type'], 'crop_type': d['crop_type'],
+                     'irrigation_type': d['irrigation_type'], 'acres': d['acres'],
+                     'oc': soil[loc][0], 'ph': soil[loc][1]} for d, loc in zip(items, locs)]
+            if climate is not None:
+                # NaN (no data) is replaced by the encoder defaults
+                for row, values in zip(rows, climate.tolist()):
+                    row.update(zip(climate_store.LAYERS, values))
+            X = ENCODER.encode(rows)
+    with timed('inference', model_type):
+        preds = _model_yields(key, model, X)
+    return [_format_result(round(float(p), 2), d['acres']) for d, p in zip(items, preds)]
+
+def _knn_group(items):
+    """Local evidence for batch items: one vectorized query per crop / irrigation."""
+    index = get_spatial_index()
+    if index is None:
+        return [{'error': 'Spatial index not available.'} for _ in items]
+    results = [None] * len(items)
+    partitions = {}
+    for pos, d in enumerate(items):
+        try:
+            loc = (float(d['lat']), float(d['lon']))
+        except (KeyError, TypeError, ValueError):
+            results[pos] = {'error': 'lat and lon must be numeric'}
+            continue
+        key = (str(d['crop_type']).strip().lower(), str(d['irrigation_type']).strip().lower())
+        partitions.setdefault(key, []).append((pos, loc))
+    with timed('inference', 'knn'):
+        for (crop, irrigation), members in partitions.items():
+            lats, lons = zip(*(loc for _, loc in members))
+            yields, neighbours, max_km = index.knn_many(lats, lons, crop, irrigation, SPATIAL_K)
+            for (pos, _), y, n, dist in zip(members, yields, neighbours, max_km):
+                results[pos] = (_knn_result(y, n, dist, items[pos]['acres']) if not np.isnan(y) else
+                                {'error': f'No matching records within {SPATIAL_MAX_KM:g} km.'})
+    return results
+
+@app.route('/predict/batch', methods=['POST'])
+def predict_batch():
+    # stages that cover the whole batch are recorded under model 'batch'
+    with timed('parse', 'batch'):
+        data = request.get_json(force=True)
+    items = data.get('requests') if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        ERRORS.inc('predict_batch', 'batch', 'validation')
+        return _respond({'error': 'Expected a JSON array of prediction requests'}, 'batch', 400)
+
+    results = [None] * len(items)
+    groups = {}
+    required_fields = ['soil_type', 'crop_type', 'irrigation_type', 'acres']
+    with timed('validate', 'batch'):
+        for idx, item in enumerate(items):
+            if not isinstance(item, dict):
+                results[idx] = {'error': 'Each request must be a JSON object'}
+                continue
+            missing = [f for f in required_fields if f not in item]
+            if missing:
+                results[idx] = {'error': f'Missing required fields: {missing}'}
+                continue
+            try:
+                float(item['acres'])
+            except (TypeError, ValueError):
+                results[idx] = {'error': 'acres must be numeric'}
+                continue
+            if _coords(item) is None:
+                results[idx] = {'error': 'lat and lon must be numeric coordinates'}
+                continue
+            model_type = str(item.get('model', 'csv')).lower()
+            engine = str(item.get('engine', DEFAULT_ENGINE)).lower()
+            groups.setdefault((model_type, engine), []).append(idx)
+    invalid = sum(r is not None for r in results)
+    if invalid:
+        ERRORS.inc('predict_batch', 'batch', 'validation', amount=invalid)
+
+    for (model_type, engine), indices in groups.items():
+        group = [items[idx] for idx in indices]
+        try:
+            group_results = _predict_group(model_type, group, engine)
+        except Exception as e:
+            group_results = [{'error': f'Prediction failed: {str(e)}'} for _ in group]
+        failed = sum('error' in r for r in group_results)
+        if failed:
+            ERRORS.inc('predict_batch', model_type, 'prediction', amount=failed)
+        for idx, result in zip(indices, group_results):
+            result['model'] = model_type
+            results[idx] = result
+
+    logging.info("Batch prediction: %d requests in %d model groups", len(items), len(groups))
+    return _respond({'results': results}, 'batch')
+
+RECOMMEND_DEFAULT_K = 5
+
+def _choices(data, field, mapping):
+    """Normalized names from a list field (default: every key of mapping) and the unknown ones."""
+    values = data.get(field) or list(mapping)
+    if isinstance(values, str):
+        values = [values]
+    names = list(dict.fromkeys(str(v).strip().lower() for v in values))
+    return [v for v in names if v in mapping], [v for v in names if v not in mapping]
+
+def _top_k(scores, k):
+    """Indices of the k largest non-NaN scores, best first: a partial sort, then k log k."""
+    valid = np.flatnonzero(~np.isnan(scores))
+    if k < len(valid):
+        valid = valid[np.argpartition(-scores[valid], k - 1)[:k]]
+    return valid[np.argsort(-scores[valid], kind='stable')]
+
+def _score_grid(model_type, engine, soil_type, crops, irrigations, acres, lat, lon, month=None):
+    """yield_per_acre of every (crop, irrigation) pair, crop-major, in one vectorized pass."""
+    crop_grid = np.repeat(np.array(crops, dtype=object), len(irrigations))
+    irrigation_grid = np.tile(np.array(irrigations, dtype=object), len(crops))
+    if model_type == 'csv':
+        csv_yield_lookup.reload_if_changed()
+        with timed('inference', model_type):
+            return csv_yield_lookup.lookup_yields([soil_type] * len(crop_grid), crop_grid, irrigation_grid)
+    key = _registry_key(model_type, engine, len(crop_grid))
+    model = registry.get(key)
+    if model is None:
+        return None
+    encoder = SVM_ENCODER if model_type == 'svm' else ENCODER
+    row = {'soil_type': soil_type, 'crop_type': crops[0], 'irrigation_type': irrigations[0], 'acres': acres}
+    if model_type != 'svm':
+        with timed('soil_lookup', model_type):
+            row['oc'], row['ph'] = get_soil_data(lat, lon)
+        with timed('climate_lookup', model_type):
+            row.update(climate_store.climate_features(lat, lon, month))
+    with timed('encode', model_type):
+        # one encoded row broadcast to the grid; only crop and irrigation vary
+        X = np.repeat(encoder.encode(row), len(crop_grid), axis=0)
+        X[:, encoder.features.index('crop_type')] = encoder.encode_category('crop_type', crop_grid)
+        X[:, encoder.features.index('irrigation_type')] = encoder.encode_category('irrigation_type', irrigation_grid)
+    with timed('inference', model_type):
+        return _model_yields(key, model, X)
+
+@app.route('/recommend', methods=['POST'])
+def recommend():
+    """Top-k (crop, irrigation) pairs by total yield for one field."""
+    with timed('parse', 'recommend'):
+        data = request.get_json(force=True)
+    if not isinstance(data, dict) or 'soil_type' not in data:
+        ERRORS.inc('recommend', 'recommend', 'validation')
+        return _respond({'error': 'Missing required field: soil_type'}, 'recommend', 400)
+    model_type = str(data.get('model', 'csv')).lower()
+    engine = str(data.get('engine', DEFAULT_ENGINE)).lower()
+    crops, unknown_crops = _choices(data, 'crops', CROP_MAP)
+    irrigations, unknown_irrigations = _choices(
+        data, 'irrigation_types' if 'irrigation_types' in data else 'irrigation_type', IRRIGATION_MAP)
+    try:
+        acres = float(data.get('acres', 1))
+        k = int(data.get('k', RECOMMEND_DEFAULT_K))
+    except (TypeError, ValueError):
+        ERRORS.inc('recommend', model_type, 'validation')
+        return _respond({'error': 'acres and k must be numeric'}, model_type, 400)
+    if unknown_crops or unknown_irrigations or not crops or not irrigations or k < 1:
+        ERRORS.inc('recommend', model_type, 'validation')
+        return _respond({'error': 'Invalid crops, irrigation types or k',
+                         'unknown_crops': unknown_crops, 'unknown_irrigation_types': unknown_irrigations},
+                        model_type, 400)
+    if model_type != 'csv' and model_type not in MODEL_TYPES:
+        ERRORS.inc('recommend', model_type, 'validation')
+        return _respond({'error': f'Unknown model type: {model_type}'}, model_type, 400)
+
+    try:
+        yields = _score_grid(model_type, engine, data['soil_type'], crops, irrigations, acres,
+                             data.get('lat', 20.3), data.get('lon', 85.8), data.get('month'))
+        if yields is None:
+            key = _registry_key(model_type, engine)
+            ERRORS.inc('recommend', model_type, 'model_unavailable')
+            return _respond({'error': f'{registry.label(key)} model not loaded.',
+                             'details': registry.error(key)}, model_type, 500)
+        with timed('rank', model_type):
+            best = _top_k(np.asarray(yields, dtype=np.float64) * acres, k)
+    except Exception as e:
+        ERRORS.inc('recommend', model_type, 'exception')
+        return _respond({'error': f'Recommendation failed: {str(e)}'}, model_type, 500)
+
+    source = 'CSV' if model_type == 'csv' else ''
+    n_irrigations = len(irrigations)
+    recommendations = [dict(_format_result(round(float(yields[i]), 2), acres, source),
+                            crop_type=crops[i // n_irrigations], irrigation_type=irrigations[i % n_irrigations])
+                       for i in best]
+    logging.info("Recommendation: soil=%s, %d candidates, top %d", data['soil_type'], len(yields), len(best))
+    return _respond({'model': model_type, 'candidates': len(yields), 'recommendations': recommendations},
+                    model_type)
+
+def _cache_events():
+    pc = prediction_cache.stats()
+    soil = soil_client.default_client().stats
+    return {
+        ('prediction', 'hit'): pc['hits'],
+        ('prediction', 'miss'): pc['misses'],
+        ('prediction', 'eviction'): pc['evictions'],
+        ('soil', 'hit'): soil['hits'],
+        ('soil', 'disk_hit'): soil['disk_hits'],
+        ('soil', 'miss'): soil['misses'],
+        ('soil', 'coalesced'): soil['coalesced'],
+        ('soil', 'error'): soil['errors'],
+    }
+
+METRICS.register(Gauge('yield_cache_events_total', 'Prediction and soil cache events',
+                        ('cache', 'event'), _cache_events, kind='counter'))
+
+# PROFILE_SLOW_MS=250 writes a folded-stack flamegraph to PROFILE_DIR for every
+# request slower than 250 ms
+profiler = profiler_from_env()
+
+@app.before_request
+def _start_timer():
+    g.request_started = profiler.start() if profiler else time.perf_counter()
+
+@app.after_request
+def _record_request(response):
+    started = getattr(g, 'request_started', None)
+    if started is not None:
+        endpoint = request.endpoint or 'unknown'
+        if profiler:
+            elapsed = profiler.stop(started, endpoint)
+        else:
+            elapsed = time.perf_counter() - started
+        REQUEST_SECONDS.observe(elapsed, endpoint, str(response.status_code))
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(METRICS.render(), content_type=CONTENT_TYPE)
 
 if __name__ == '__main__':
-    # Expose on all interfaces to ease local testing, debug on
+    # Expose on all interfaces to ease local testing, debug on.
+    # For production use the worker pool: python serve.py predictor
     app.run(host='0.0.0.0', port=5001, debug=True)
@@ -0,0 +1,274 @@
+# model_registry.py
+# Lazy, thread-safe model loading with optional parallel preload and hot reload.
+# Heavy libraries (xgboost, lightgbm, sklearn via pickle) are only imported by
+# the loader of the model that needs them.
+
+import logging
+import os
+import pickle
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+def load_svm(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+def load_lgb(path):
+    import lightgbm as lgb
+    return lgb.Booster(model_file=path)
+
+def load_xgb(path):
+    import xgboost as xgb
+    model = xgb.XGBRegressor()
+    model.load_model(path)
+    return model
+
+def load_lgb_compiled(path):
+    import tree_engine
+    return tree_engine.load_lgb_model(path)
+
+def load_xgb_compiled(path):
+    import tree_engine
+    return tree_engine.load_xgb_model(path)
+
+def load_tensor(path):
+    import prediction_tensor
+    return prediction_tensor.load_tensor(path)
+
+# name -> (file, loader, display name)
+DEFAULT_MODELS = {
+    'svm': ('svm_yield_model.pkl', load_svm, 'SVM'),
+    # kernel_approx.ApproxKernelRegressor, pickled like the SVR
+    'svm_approx': ('svm_approx_model.pkl', load_svm, 'SVM (approximate kernel)'),
+    'lgb': ('lgb_yield_model.txt', load_lgb, 'LightGBM'),
+    'xgb': ('xgb_yield_model.json', load_xgb, 'XGBoost'),
+    # the same boosters evaluated by tree_engine, without lightgbm/xgboost
+    'lgb_compiled': ('lgb_yield_model.txt', load_lgb_compiled, 'LightGBM (compiled)'),
+    'xgb_compiled': ('xgb_yield_model.json', load_xgb_compiled, 'XGBoost (compiled)'),
+    # prediction_tensor.PredictionTensor snapshots written by prediction_tensor.py
+    'lgb_tensor': ('lgb_yield_model.tensor.json', load_tensor, 'LightGBM (tensor)'),
+    'xgb_tensor': ('xgb_yield_model.tensor.json', load_tensor, 'XGBoost (tensor)'),
+    'svm_tensor': ('svm_yield_model.tensor.json', load_tensor, 'SVM (tensor)'),
+    'svm_approx_tensor': ('svm_approx_model.tensor.json', load_tensor, 'SVM (approximate kernel, tensor)'),
+}
+
+
+def registry_key(model_type, engine='native', rows=1, svm_backend='kernel', auto_max_rows=16):
+    """Name of the model that serves `model_type` ('svm', 'lgb' or 'xgb') with an engine.
+
+    engine is 'native', 'compiled' (tree_engine, lgb/xgb only), 'tensor'
+    (prediction_tensor snapshots) or 'auto': compiled for batches of up to
+    `auto_max_rows` rows, native above. svm_backend 'approx' picks the
+    kernel_approx regressor over the SVR.
+    """
+    if model_type == 'svm':
+        key = 'svm_approx' if svm_backend == 'approx' else 'svm'
+        return f'{key}_tensor' if engine == 'tensor' else key
+    if engine == 'tensor':
+        return f'{model_type}_tensor'
+    if engine == 'auto':
+        engine = 'compiled' if rows <= auto_max_rows else 'native'
+    if engine == 'compiled' and model_type in ('lgb', 'xgb'):
+        return f'{model_type}_compiled'
+    return model_type
+
+
+def _rss_bytes():
+    # Resident set size of this process; best effort, Linux first
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        try:
+            import resource
+            return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        except Exception:
+            return None
+
+
+class _Entry:
+    def __init__(self, name, path, loader, label):
+        self.name = name
+        self.path = path
+        self.loader = loader
+        self.label = label
+        self.model = None
+        self.mtime = None
+        self.tried_mtime = None  # mtime of the file last loaded or attempted, even if that failed
+        self.error = None
+        self.load_seconds = None
+        self.rss_delta_bytes = None  # None when another load ran at the same time
+        self.loaded_at = None
+        self.reloads = 0
+        self.lock = threading.Lock()
+        self.reloading = False
+
+
+class ModelRegistry:
+    """Holds the prediction models and loads each one on first use.
+
+    get() returns the current model object (or None if it could not be
+    loaded). Callers keep the reference they got for the whole request, so a
+    hot reload that swaps in a new object never affects in-flight work. When
+    `reload_interval` is set, the file's mtime is checked at most that often
+    on access and a changed file is reloaded in the background while the old
+    model keeps serving; a model whose file was missing or failed to load is
+    retried the same way once the file appears or changes.
+    """
+
+    def __init__(self, models=DEFAULT_MODELS, base_dir='.', reload_interval=None):
+        self._entries = {name: _Entry(name, os.path.join(base_dir, path), loader, label)
+                         for name, (path, loader, label) in models.items()}
+        self.reload_interval = reload_interval
+        self._last_check = {}
+        self._listeners = []
+        self._state_lock = threading.Lock()  # guards the counters below and each entry's `reloading`
+        self._active_loads = 0
+        self._loads_started = 0
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self._entries)),
+                                            thread_name_prefix='model-load')
+
+    def after_fork(self):
+        """Give a forked worker its own loader pool; the parent's threads don't exist there."""
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self._entries)),
+                                            thread_name_prefix='model-load')
+        self._state_lock = threading.Lock()
+        self._active_loads = 0
+        for entry in self._entries.values():
+            entry.lock = threading.Lock()
+            entry.reloading = False
+
+    def names(self):
+        return list(self._entries)
+
+    def label(self, name):
+        return self._entries[name].label
+
+    def add_listener(self, callback):
+        """Register callback(name) to run after a loaded model is replaced from disk."""
+        self._listeners.append(callback)
+
+    def _load(self, entry):
+        if not os.path.exists(entry.path):
+            entry.error = f'{os.path.basename(entry.path)} not found'
+            entry.tried_mtime = None
+            return None
+        mtime = os.path.getmtime(entry.path)
+        entry.tried_mtime = mtime
+        with self._state_lock:
+            self._active_loads += 1
+            self._loads_started += 1
+            alone, started = self._active_loads == 1, self._loads_started
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        try:
+            model = entry.loader(entry.path)
+        except Exception as e:
+            entry.error = f'{entry.label} model load error: {e}'
+            logging.warning(entry.error)
+            return None
+        finally:
+            with self._state_lock:
+                self._active_loads -= 1
+                # RSS is process-wide: the delta is only this model's if no other load overlapped
+                alone = alone and self._loads_started == started
+        entry.load_seconds = round(time.perf_counter() - start, 4)
+        rss_after = _rss_bytes()
+        entry.rss_delta_bytes = None
+        if alone and rss_before is not None and rss_after is not None:
+            entry.rss_delta_bytes = max(0, rss_after - rss_before)
+        # a single reference assignment: readers see either the old or the new model
+        replaced = entry.model is not None
+        entry.model = model
+        entry.mtime = mtime
+        entry.error = None
+        entry.loaded_at = time.time()
+        if replaced:
+            entry.reloads += 1
+        logging.info("Loaded %s model from %s in %.3fs", entry.label, entry.path, entry.load_seconds)
+        for callback in (self._listeners if replaced else []):
+            try:
+                callback(entry.name)
+            except Exception as e:
+                logging.warning("Model reload listener failed: %s", e)
+        return model
+
+    def _ensure_loaded(self, entry):
+        if entry.model is None and entry.error is None:
+            with entry.lock:
+                if entry.model is None and entry.error is None:
+                    self._load(entry)
+        return entry.model
+
+    def _reload_async(self, entry):
+        # the caller has set entry.reloading under _state_lock
+        def run():
+            try:
+                with entry.lock:
+                    self._load(entry)
+            finally:
+                with self._state_lock:
+                    entry.reloading = False
+        self._executor.submit(run)
+
+    def _check_for_update(self, entry):
+        now = time.monotonic()
+        if now - self._last_check.get(entry.name, 0.0) < self.reload_interval:
+            return
+        self._last_check[entry.name] = now
+        try:
+            mtime = os.path.getmtime(entry.path)
+        except OSError:
+            return
+        # also picks up a model file that was missing or unloadable on the last attempt
+        with self._state_lock:
+            if mtime == entry.tried_mtime or entry.reloading:
+                return
+            entry.reloading = True
+        self._reload_async(entry)
+
+    def get(self, name):
+        entry = self._entries[name]
+        model = self._ensure_loaded(entry)
+        if self.reload_interval is not None:
+            self._check_for_update(entry)
+        return model
+
+    def error(self, name):
+        return self._entries[name].error
+
+    def reload(self, name):
+        """Synchronously reload one model from disk."""
+        entry = self._entries[name]
+        with entry.lock:
+            entry.error = None
+            return self._load(entry)
+
+    def preload(self, names=None, background=True):
+        """Load models in parallel; returns immediately when background is True."""
+        futures = [self._executor.submit(self._ensure_loaded, self._entries[n])
+                   for n in (names or self.names())]
+        if not background:
+            for f in futures:
+                f.result()
+        return futures
+
+    def status(self):
+        status = {name: {
+            'loaded': e.model is not None,
+            'error': e.error,
+            'load_seconds': e.load_seconds,
+            'rss_delta_bytes': e.rss_delta_bytes,
+            'file_bytes': os.path.getsize(e.path) if os.path.exists(e.path) else None,
+            'reloads': e.reloads,
+        } for name, e in self._entries.items()}
+        for name, e in self._entries.items():
+            if hasattr(e.model, 'max_abs_error'):
+                # materialized tensors: error against the model they were built from
+                status[name]['max_abs_error'] = e.model.max_abs_error
+        return status
+
+    def errors(self):
+        return [e.error for e in self._entries.values() if e.error]
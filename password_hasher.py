@@ -0,0 +1,124 @@
+# password_hasher.py
+# Password hashing policy for the auth service, with hashing and
+# verification run on a bounded worker pool.
+#
+# The key derivation functions are deliberately slow. hashlib's scrypt and
+# pbkdf2_hmac release the GIL, so a thread pool of one worker per core runs
+# them in parallel while request threads only wait on a future; requests
+# that don't hash (/me) are never queued behind them. At most `max_queue`
+# jobs wait for a worker: beyond that, or after `timeout` seconds, callers
+# get HasherBusy (answered with 503) instead of piling up.
+#
+# Stored hashes carry their parameters (werkzeug's "method$salt$hash"), so a
+# successful login with a hash made under an older policy is rehashed with
+# the current one.
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# werkzeug's defaults: scrypt N (CPU/memory cost) and pbkdf2 iterations
+DEFAULT_ITERATIONS = {'scrypt': 32768, 'pbkdf2': 1000000}
+
+
+class HasherBusy(Exception):
+    """The hashing queue is full or a job waited too long."""
+
+
+def policy_method(algorithm='scrypt', iterations=None):
+    """werkzeug method string for an algorithm and its cost parameter."""
+    iterations = int(iterations or DEFAULT_ITERATIONS[algorithm])
+    if algorithm == 'scrypt':
+        return f'scrypt:{iterations}:8:1'
+    if algorithm == 'pbkdf2':
+        return f'pbkdf2:sha256:{iterations}'
+    raise ValueError(f'unsupported password hash algorithm: {algorithm}')
+
+
+class PasswordHasher:
+    """Hash and verify passwords under one policy on a bounded thread pool."""
+
+    def __init__(self, method=None, workers=None, max_queue=None, timeout=5.0):
+        self.method = method or policy_method()
+        self.workers = workers or os.cpu_count() or 1
+        self.max_queue = self.workers * 4 if max_queue is None else max_queue
+        self.timeout = timeout
+        self.rejected = 0
+        self.rehashed = 0
+        self._dummy = None
+        self._start()
+
+    def _start(self):
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        # running + queued jobs
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+        self._lock = threading.Lock()
+
+    def after_fork(self):
+        """Give a forked worker its own pool; the parent's threads don't exist there."""
+        self._start()
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy('password hashing queue is full')
+        try:
+            future = self._executor.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            future.cancel()
+            with self._lock:
+                self.rejected += 1
+            raise HasherBusy('password hashing timed out')
+
+    def needs_rehash(self, pw_hash):
+        return pw_hash.split('$', 1)[0] != self.method
+
+    def hash(self, password):
+        return self._run(generate_password_hash, password, self.method)
+
+    def _verify(self, pw_hash, password):
+        if pw_hash is None:
+            # unknown user: spend the same time as a real check
+            if self._dummy is None:
+                self._dummy = generate_password_hash('', self.method)
+            check_password_hash(self._dummy, password)
+            return False, None
+        if not check_password_hash(pw_hash, password):
+            return False, None
+        if self.needs_rehash(pw_hash):
+            return True, generate_password_hash(password, self.method)
+        return True, None
+
+    def verify(self, pw_hash, password):
+        """(ok, new_hash): new_hash is set when a correct password's hash uses an old policy.
+
+        Pass pw_hash=None for an unknown user; the result is then (False, None).
+        """
+        ok, new_hash = self._run(self._verify, pw_hash, password)
+        if new_hash is not None:
+            with self._lock:
+                self.rehashed += 1
+        return ok, new_hash
+
+    def stats(self):
+        return {'method': self.method, 'workers': self.workers, 'max_queue': self.max_queue,
+                'rejected': self.rejected, 'rehashed': self.rehashed}
+
+
+def hasher_from_env():
+    return PasswordHasher(
+        method=policy_method(os.environ.get('AUTH_HASH_ALGORITHM', 'scrypt'),
+                             os.environ.get('AUTH_HASH_ITERATIONS') or None),
+        workers=int(os.environ.get('AUTH_HASH_WORKERS', 0)) or None,
+        max_queue=int(os.environ['AUTH_HASH_MAX_QUEUE']) if os.environ.get('AUTH_HASH_MAX_QUEUE') else None,
+        timeout=float(os.environ.get('AUTH_HASH_TIMEOUT', 5.0)))
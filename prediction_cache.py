@@ -0,0 +1,91 @@
+# prediction_cache.py
+# Bounded cache of yield_per_acre predictions (never totals: acres is applied
+# per request). Keys are (namespace, normalized input); each namespace ('csv',
+# 'lgb', 'xgb_compiled', ...) carries a generation number that is bumped when
+# its data or model is reloaded, which invalidates all of its entries at once.
+
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+_ENTRY_OVERHEAD = 200  # OrderedDict node, tuple and float objects, roughly
+
+
+def _key_size(key):
+    return sys.getsizeof(key) + sum(sys.getsizeof(part) for part in key)
+
+
+class PredictionCache:
+    """LRU cache with a TTL, an entry limit and an approximate byte limit."""
+
+    def __init__(self, max_entries=100000, ttl=3600.0, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def key(self, namespace, *parts):
+        return (namespace, self._generations.get(namespace, 0)) + parts
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, expires, size = entry
+                if expires > now:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._data[key]
+                self.bytes -= size
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        size = _key_size(key) + _ENTRY_OVERHEAD
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self._data[key] = (value, time.monotonic() + self.ttl, size)
+            self.bytes += size
+            while self._data and (len(self._data) > self.max_entries or self.bytes > self.max_bytes):
+                _, (_, _, evicted) = self._data.popitem(last=False)
+                self.bytes -= evicted
+                self.evictions += 1
+
+    def invalidate(self, namespace):
+        """Drop every entry of a namespace (e.g. after a model or table reload)."""
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+            self.invalidations += 1
+            stale = [k for k in self._data if k[0] == namespace]
+            for k in stale:
+                self.bytes -= self._data.pop(k)[2]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                'entries': len(self._data),
+                'bytes': self.bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 4) if total else None,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,252 @@
+# prediction_tensor.py
+# Materializes a model into a dense tensor of its predictions over every
+# category combination (soil x crop x irrigation) crossed with a grid of the
+# continuous features, so serving is array indexing instead of model
+# evaluation.
+#
+#   python prediction_tensor.py lgb                  # -> lgb_yield_model.tensor.{json,npy}
+#   python prediction_tensor.py svm --points 48 --dtype float32
+#
+# Axes follow the model's input columns (ENCODER.features, or its prefix for
+# models trained on fewer columns):
+#   category  one slot per code of the encoder's map
+#   step      bins between split thresholds, for LightGBM / XGBoost. A tree
+#             ensemble is constant inside each bin, so an axis with every
+#             threshold (up to --max-bins bins) is exact; features the trees
+#             never split on collapse to a single slot.
+#   linear    --points grid values over RANGES (acres log-spaced), linearly
+#             interpolated between neighbours, for the SVM; values outside
+#             the range are clamped.
+#
+# The tensor is written with np.lib.format.open_memmap chunk by chunk and
+# served memory-mapped. The manifest (written last) records the axes and the
+# error against the live model on --samples random inputs; the served
+# model's /health status shows the maximum absolute error.
+#
+# A tensor is a snapshot: rebuild it after retraining (the loader warns when
+# the model file is newer).
+
+import argparse
+import json
+import logging
+import os
+
+import numpy as np
+
+from feature_encoder import ENCODER
+
+# value range of each continuous feature covered by linear axes and error sampling
+RANGES = {'acres': (0.25, 500.0), 'temp': (5.0, 45.0), 'humidity': (10.0, 100.0),
+          'rainfall': (0.0, 1500.0), 'oc': (0.05, 12.0), 'ph': (3.5, 10.0)}
+LOG_SCALE = ('acres',)
+CHUNK_ROWS = 1 << 20
+MAX_CELLS = 200_000_000
+
+
+def tensor_paths(model_path):
+    base = os.path.splitext(model_path)[0]
+    return base + '.tensor.json', base + '.tensor.npy'
+
+
+def _num_features(model):
+    if hasattr(model, 'num_feature'):
+        return int(model.num_feature())
+    return int(model.n_features_in_)
+
+
+def split_thresholds(model):
+    """({feature index: sorted thresholds}, side) of a LightGBM Booster or XGBRegressor; (None, None) otherwise.
+
+    side is the np.searchsorted side that puts a value in the bin the trees send it to.
+    """
+    if hasattr(model, 'trees_to_dataframe') and hasattr(model, 'feature_name'):
+        trees = model.trees_to_dataframe()
+        names = model.feature_name()
+        splits = trees.dropna(subset=['split_feature'])
+        # LightGBM: left when value <= threshold
+        return ({names.index(f): np.unique(g['threshold'].to_numpy(np.float64))
+                 for f, g in splits.groupby('split_feature')}, 'left')
+    if hasattr(model, 'get_booster'):
+        trees = model.get_booster().trees_to_dataframe()
+        splits = trees[trees['Feature'] != 'Leaf']
+        names = model.get_booster().feature_names
+        index = (lambda f: names.index(f)) if names else (lambda f: int(f[1:]))
+        # XGBoost: left when value < threshold
+        return ({index(f): np.unique(g['Split'].to_numpy(np.float64)) for f, g in splits.groupby('Feature')},
+                'right')
+    return None, None
+
+
+def _step_points(edges):
+    # one representative value inside each bin
+    if not len(edges):
+        return np.zeros(1)
+    inner = (edges[:-1] + edges[1:]) / 2
+    return np.concatenate([[edges[0] - 1.0], inner, [edges[-1] + 1.0]])
+
+
+def plan_axes(model, features, points=16, max_bins=1024):
+    """Axis descriptions for a model over `features`."""
+    thresholds, side = split_thresholds(model)
+    axes = []
+    for k, name in enumerate(features):
+        if name in ENCODER.maps:
+            codes = sorted(set(int(c) for c in ENCODER.maps[name].values()))
+            axes.append({'feature': name, 'kind': 'category', 'codes': codes})
+        elif thresholds is not None:
+            edges = thresholds.get(k, np.empty(0))
+            if len(edges) > max_bins - 1:
+                # keep an evenly spaced subset of the thresholds; the error report shows the cost
+                edges = edges[np.unique(np.linspace(0, len(edges) - 1, max_bins - 1).round().astype(int))]
+            axes.append({'feature': name, 'kind': 'step', 'edges': edges.tolist(), 'side': side,
+                         'points': _step_points(edges).tolist()})
+        else:
+            lo, hi = RANGES.get(name, (0.0, 1.0))
+            grid = np.geomspace(lo, hi, points) if name in LOG_SCALE else np.linspace(lo, hi, points)
+            axes.append({'feature': name, 'kind': 'linear', 'points': grid.tolist()})
+    return axes
+
+
+def _axis_values(axis):
+    return np.asarray(axis['codes'] if axis['kind'] == 'category' else axis['points'], dtype=np.float64)
+
+
+def random_inputs(features, n, seed=0):
+    """n random encoded rows: uniform category codes, continuous features uniform over RANGES."""
+    rng = np.random.default_rng(seed)
+    X = np.empty((n, len(features)), dtype=np.float32)
+    for k, name in enumerate(features):
+        if name in ENCODER.maps:
+            X[:, k] = rng.choice(sorted(set(ENCODER.maps[name].values())), n)
+        else:
+            lo, hi = RANGES.get(name, (0.0, 1.0))
+            X[:, k] = np.exp(rng.uniform(np.log(lo), np.log(hi), n)) if name in LOG_SCALE else rng.uniform(lo, hi, n)
+    return X
+
+
+class PredictionTensor:
+    """Serves predict(X) for encoded rows from a materialized tensor."""
+
+    def __init__(self, manifest_path):
+        with open(manifest_path) as f:
+            self.manifest = json.load(f)
+        self.features = self.manifest['features']
+        self.axes = self.manifest['axes']
+        self.values = np.load(os.path.join(os.path.dirname(manifest_path), self.manifest['data']), mmap_mode='r')
+        self.flat = self.values.reshape(-1)
+        self.strides = np.cumprod([1] + [len(_axis_values(a)) for a in self.axes[:0:-1]])[::-1]
+        self.max_abs_error = self.manifest.get('error', {}).get('max_abs')
+        # per axis (kind, lookup array, searchsorted side), built once
+        self._lookups = []
+        for axis in self.axes:
+            if axis['kind'] == 'category':
+                self._lookups.append(('category', np.asarray(axis['codes'], dtype=np.float64), 'left'))
+            elif axis['kind'] == 'step':
+                self._lookups.append(('step', np.asarray(axis['edges'], dtype=np.float64), axis['side']))
+            else:
+                self._lookups.append(('linear', np.asarray(axis['points'], dtype=np.float64), None))
+
+    def predict(self, X):
+        # encoded rows may carry more columns than the model used (e.g. the 9-column ENCODER output)
+        X = np.asarray(X, dtype=np.float32)[:, :len(self.features)].astype(np.float64)
+        base = np.zeros(len(X), dtype=np.int64)
+        linear = []  # (stride, weight of the upper neighbour)
+        for k, (kind, values, side) in enumerate(self._lookups):
+            x = X[:, k]
+            if kind == 'category':
+                pos = np.minimum(np.searchsorted(values, x), len(values) - 1)
+            elif kind == 'step':
+                pos = np.searchsorted(values, x, side)
+            else:
+                f = np.interp(x, values, np.arange(len(values), dtype=np.float64))
+                pos = np.minimum(np.floor(f).astype(np.int64), len(values) - 2)
+                linear.append((self.strides[k], f - pos))
+            base += pos * self.strides[k]
+        if not linear:
+            return self.flat[base].astype(np.float64)
+        # multilinear interpolation over the 2^L corners of the linear axes
+        out = np.zeros(len(X))
+        for corner in range(1 << len(linear)):
+            offset, weight = 0, np.ones(len(X))
+            for bit, (stride, w) in enumerate(linear):
+                if corner >> bit & 1:
+                    offset += stride
+                    weight = weight * w
+                else:
+                    weight = weight * (1 - w)
+            out += weight * self.flat[base + offset]
+        return out
+
+
+def materialize(model, model_path, name, points=16, dtype='float16', samples=100000, max_bins=1024,
+                chunk_rows=CHUNK_ROWS, max_cells=MAX_CELLS, seed=0):
+    """Evaluate `model` over its grid, write the tensor next to model_path and return the manifest."""
+    features = ENCODER.features[:_num_features(model)]
+    axes = plan_axes(model, features, points, max_bins)
+    grids = [_axis_values(a) for a in axes]
+    shape = tuple(len(g) for g in grids)
+    cells = int(np.prod(shape))
+    if cells > max_cells:
+        raise ValueError(f'{cells} cells (shape {shape}) exceed max_cells={max_cells}; lower --points/--max-bins')
+    manifest_path, data_path = tensor_paths(model_path)
+    tmp = data_path + '.tmp.npy'
+    values = np.lib.format.open_memmap(tmp, mode='w+', dtype=dtype, shape=shape)
+    flat = values.reshape(-1)
+    for start in range(0, cells, chunk_rows):
+        idx = np.unravel_index(np.arange(start, min(start + chunk_rows, cells)), shape)
+        X = np.column_stack([g[i] for g, i in zip(grids, idx)]).astype(np.float32)
+        flat[start:start + len(X)] = model.predict(X)
+    values.flush()
+    del values, flat
+    os.replace(tmp, data_path)
+
+    manifest = {'version': 1, 'model': name, 'model_file': os.path.basename(model_path),
+                'model_mtime': os.path.getmtime(model_path), 'features': features, 'axes': axes,
+                'shape': list(shape), 'dtype': dtype, 'data': os.path.basename(data_path)}
+    # error against the live model, on inputs that are not grid points
+    X = random_inputs(features, samples, seed)
+    tmp_manifest = manifest_path + '.tmp'
+    with open(tmp_manifest, 'w') as f:
+        json.dump(manifest, f)
+    err = np.abs(PredictionTensor(tmp_manifest).predict(X) - np.asarray(model.predict(X), dtype=np.float64))
+    manifest['error'] = {'samples': samples, 'max_abs': float(err.max()), 'p99_abs': float(np.quantile(err, 0.99)),
+                         'mean_abs': float(err.mean())}
+    # write the manifest last so a half-built tensor is never picked up
+    with open(tmp_manifest, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_manifest, manifest_path)
+    return manifest
+
+
+def load_tensor(manifest_path):
+    tensor = PredictionTensor(manifest_path)
+    model_path = os.path.join(os.path.dirname(manifest_path), tensor.manifest['model_file'])
+    if os.path.exists(model_path) and os.path.getmtime(model_path) > tensor.manifest['model_mtime']:
+        logging.warning("%s is older than %s; rerun prediction_tensor.py", manifest_path, model_path)
+    return tensor
+
+
+def main():
+    from model_registry import DEFAULT_MODELS, ModelRegistry
+    parser = argparse.ArgumentParser(description='Materialize a model into a dense prediction tensor')
+    parser.add_argument('model', choices=('lgb', 'xgb', 'svm', 'svm_approx'))
+    parser.add_argument('--points', type=int, default=16, help='grid values per continuous feature (SVM)')
+    parser.add_argument('--max-bins', type=int, default=1024, help='bins per continuous feature (tree models)')
+    parser.add_argument('--dtype', choices=('float16', 'float32'), default='float16')
+    parser.add_argument('--samples', type=int, default=100000, help='random inputs for the error report')
+    parser.add_argument('--max-cells', type=int, default=MAX_CELLS)
+    args = parser.parse_args()
+
+    registry = ModelRegistry()
+    model = registry.get(args.model)
+    if model is None:
+        parser.error(registry.error(args.model))
+    manifest = materialize(model, DEFAULT_MODELS[args.model][0], args.model, args.points, args.dtype,
+                           args.samples, args.max_bins, max_cells=args.max_cells)
+    size = int(np.prod(manifest['shape'])) * np.dtype(args.dtype).itemsize
+    print(f"Wrote {manifest['data']}: shape {manifest['shape']} ({size / 1e6:.1f} MB)")
+    print(json.dumps({'error_vs_live_model': manifest['error']}))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,320 @@
+# score_farms.py
+# Offline scoring of farm registries: reads a CSV or Parquet file of farms
+# in chunks and writes it back as CSV with predicted_yield_per_acre and
+# total_yield columns (the layout of training_data_with_predictions.csv).
+#
+#   python score_farms.py farms.csv scored.csv --model lgb --workers 4
+#   python score_farms.py farms.parquet scored.csv --model csv --resume
+#
+# Each chunk is encoded in one vectorized pass. Soil is looked up once per
+# distinct location in the chunk, and only for rows without oc/ph columns;
+# temp/humidity/rainfall missing from the input come from the climate store
+# (for the row's 'month' column if there is one, else this month).
+# Chunks are scored on a process pool started for the run. Results are
+# written in input order as they come back, with at most 2 chunks per worker
+# in flight, so memory stays flat on multi-million-row files.
+#
+# Output goes to <output>.partial, which is renamed to <output> when the run
+# completes. After every chunk it is flushed and <output>.progress records
+# how far input and output got. --resume truncates the partial output to the
+# last checkpoint and carries on from there. A run that fails before its
+# first checkpoint leaves nothing behind.
+#
+# CSV input is split on line boundaries, so quoted fields must not contain
+# newlines.
+
+import argparse
+import collections
+import contextlib
+import io
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from model_registry import registry_key
+
+CHUNK_ROWS = 100000
+MODELS = ('csv', 'svm', 'lgb', 'xgb')
+
+_worker = {}  # per-process model state, set by _init_worker
+
+
+def _numeric(df, column, default=np.nan):
+    if column not in df:
+        return np.full(len(df), default)
+    return pd.to_numeric(df[column], errors='coerce').to_numpy(np.float64, copy=True)
+
+
+def _soil_columns(df):
+    """(oc, ph) arrays for a chunk: given columns where present, else one lookup per distinct location."""
+    import soil_client
+    oc, ph = _numeric(df, 'oc'), _numeric(df, 'ph')
+    need = np.flatnonzero(np.isnan(oc) | np.isnan(ph))
+    if len(need):
+        # the service's default location where a farm has none
+        lat = np.nan_to_num(_numeric(df, 'lat', 20.3)[need], nan=20.3)
+        lon = np.nan_to_num(_numeric(df, 'lon', 85.8)[need], nan=85.8)
+        points, inverse = np.unique(np.column_stack([lat, lon]), axis=0, return_inverse=True)
+        soil = np.array(soil_client.get_soil_data_many([tuple(p) for p in points]), dtype=np.float64)
+        oc[need] = np.where(np.isnan(oc[need]), soil[inverse.ravel(), 0], oc[need])
+        ph[need] = np.where(np.isnan(ph[need]), soil[inverse.ravel(), 1], ph[need])
+    return oc, ph
+
+
+def _climate_columns(df):
+    """temp/humidity/rainfall for a chunk: given columns where present, else the climate store normals."""
+    import climate_store
+    given = {name: _numeric(df, name) for name in climate_store.LAYERS}
+    need = np.flatnonzero(np.isnan(np.column_stack(list(given.values()))).any(axis=1))
+    if len(need):
+        month = df['month'].to_numpy()[need] if 'month' in df else None
+        normals = climate_store.climate_columns(_numeric(df, 'lat', 20.3)[need], _numeric(df, 'lon', 85.8)[need],
+                                                month)
+        if normals is not None:
+            for k, name in enumerate(climate_store.LAYERS):
+                column = given[name]
+                column[need] = np.where(np.isnan(column[need]), normals[:, k], column[need])
+    # NaN left (no store or no data) is replaced by the encoder defaults
+    return given
+
+
+def score_frame(df, model_type, model=None):
+    """Yield per acre for each row of a DataFrame of farms; NaN where it can't be predicted."""
+    if model_type == 'csv':
+        import csv_yield_lookup
+        return np.asarray(csv_yield_lookup.lookup_yields(
+            df['soil_type'].to_numpy(), df['crop_type'].to_numpy(), df['irrigation_type'].to_numpy()),
+            dtype=np.float64)
+    from feature_encoder import ENCODER, SVM_ENCODER, model_columns
+    if model_type == 'svm':
+        X = SVM_ENCODER.encode(df)
+    else:
+        oc, ph = _soil_columns(df)
+        X = ENCODER.encode(df.assign(oc=oc, ph=ph, **_climate_columns(df)))
+    return np.asarray(model.predict(model_columns(model, X)), dtype=np.float64)
+
+
+def _init_worker(model_type, key):
+    _worker['model_type'] = model_type
+    _worker['model'] = None
+    if model_type != 'csv':
+        from model_registry import ModelRegistry
+        registry = ModelRegistry()
+        model = registry.get(key)
+        if model is None:
+            raise RuntimeError(f'{registry.label(key)} model not loaded: {registry.error(key)}')
+        _worker['model'] = model
+    else:
+        import csv_yield_lookup  # noqa: F401 - loads the yield table once per process
+
+
+def scoring_pool(model_type, key, workers):
+    """Context manager giving a process pool of `workers` scorers, or None to score in this process."""
+    if not workers:
+        _init_worker(model_type, key)
+        return contextlib.nullcontext()
+    # spawned: forking a process that may hold native library threads is unsafe
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                               initializer=_init_worker, initargs=(model_type, key))
+
+
+def _csv_bytes(df, header):
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pa_csv
+    except ImportError:
+        return df.to_csv(index=False, header=header, lineterminator='\n').encode()
+    # pyarrow's writer is several times faster than DataFrame.to_csv
+    sink = pa.BufferOutputStream()
+    pa_csv.write_csv(pa.Table.from_pandas(df, preserve_index=False), sink,
+                     pa_csv.WriteOptions(include_header=header, quoting_style='needed'))
+    return sink.getvalue().to_pybytes()
+
+
+def _score_chunk(df, header):
+    """Score a chunk and render it as CSV (the work done in pool processes)."""
+    if isinstance(df, bytes):
+        # CSV chunks are parsed here rather than pickled as DataFrames
+        df = pd.read_csv(io.BytesIO(df))
+    yields = score_frame(df, _worker['model_type'], _worker['model']).round(2)
+    out = df.assign(predicted_yield_per_acre=yields, total_yield=(yields * _numeric(df, 'acres', 1.0)).round(2))
+    return _csv_bytes(out, header)
+
+
+def read_chunks(path, chunk_rows=CHUNK_ROWS, skip_rows=0, offset=None, parse=True):
+    """Yield (DataFrame, rows, input position) per chunk of a CSV or Parquet file.
+
+    The position is the byte offset after the chunk for CSV and None for
+    Parquet; resume with skip_rows (Parquet) or offset (CSV). With
+    parse=False CSV chunks are yielded as the raw bytes (with the header).
+    """
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        pf = pq.ParquetFile(path)
+        # whole row groups before the resume point are not read at all
+        first, skip = 0, skip_rows
+        while first < pf.num_row_groups and skip >= pf.metadata.row_group(first).num_rows:
+            skip -= pf.metadata.row_group(first).num_rows
+            first += 1
+        groups = list(range(first, pf.num_row_groups))
+        pending = None
+        for batch in pf.iter_batches(batch_size=chunk_rows, row_groups=groups):
+            df = batch.to_pandas()
+            if skip:
+                df, skip = df.iloc[skip:].reset_index(drop=True), max(0, skip - len(df))
+            pending = df if pending is None else pd.concat([pending, df], ignore_index=True)
+            if len(pending) >= chunk_rows:
+                yield pending, len(pending), None
+                pending = None
+        if pending is not None and len(pending):
+            yield pending, len(pending), None
+        return
+    with open(path, 'rb') as f:
+        header = f.readline()
+        if offset:
+            f.seek(offset)
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if not lines:
+                return
+            data = header + b''.join(lines)
+            yield (pd.read_csv(io.BytesIO(data)) if parse else data), len(lines), f.tell()
+
+
+def _count_rows(path):
+    if path.endswith('.parquet'):
+        import pyarrow.parquet as pq
+        return pq.ParquetFile(path).metadata.num_rows
+    return None
+
+
+def _save_progress(path, state):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def score_file(input_path, output_path, model_type='csv', engine='native', svm_backend='kernel',
+               workers=None, chunk_rows=CHUNK_ROWS, resume=False, on_progress=None):
+    """Score input_path into output_path (CSV); returns counts and timings.
+
+    workers=0 scores in this process. on_progress(stats) runs after every
+    written chunk.
+    """
+    if model_type not in MODELS:
+        raise ValueError(f'Unknown model type: {model_type}')
+    key = registry_key(model_type, engine, chunk_rows, svm_backend)
+    progress_path = output_path + '.progress'
+    source = os.stat(input_path)
+    state = {'input': os.path.abspath(input_path), 'input_size': source.st_size, 'input_mtime': source.st_mtime,
+             'model': key, 'rows': 0, 'offset': None, 'output_bytes': 0}
+    if resume and os.path.exists(progress_path):
+        with open(progress_path) as f:
+            saved = json.load(f)
+        changed = [k for k in ('input', 'input_size', 'input_mtime', 'model') if saved.get(k) != state[k]]
+        if changed:
+            raise ValueError(f'cannot resume: {", ".join(changed)} changed since the interrupted run')
+        state = saved
+    partial_path = output_path + '.partial'
+    out = open(partial_path, 'r+b' if state['rows'] else 'wb')
+    # drop anything written after the last checkpoint
+    out.truncate(state['output_bytes'])
+    out.seek(state['output_bytes'])
+
+    stats = {'rows': state['rows'], 'total_rows': _count_rows(input_path), 'resumed_at': state['rows'],
+             'input_bytes': source.st_size, 'input_offset': state['offset'], 'seconds': 0.0, 'rows_per_s': 0.0}
+    chunks = read_chunks(input_path, chunk_rows, skip_rows=state['rows'], offset=state['offset'], parse=False)
+    workers = os.cpu_count() if workers is None else workers
+    start = time.perf_counter()
+
+    def write(data, rows, offset):
+        out.write(data)
+        out.flush()
+        os.fsync(out.fileno())
+        state['rows'] += rows
+        state['offset'] = offset
+        state['output_bytes'] = out.tell()
+        _save_progress(progress_path, state)
+        elapsed = time.perf_counter() - start
+        stats.update(rows=state['rows'], input_offset=offset, seconds=round(elapsed, 2),
+                     rows_per_s=round((state['rows'] - stats['resumed_at']) / elapsed, 1) if elapsed else 0.0)
+        if on_progress is not None:
+            on_progress(stats)
+
+    try:
+        with out, scoring_pool(model_type, key, workers) as pool:
+            try:
+                inflight = collections.deque()
+                header = state['rows'] == 0
+                for chunk, rows, offset in chunks:
+                    if pool is None:
+                        write(_score_chunk(chunk, header), rows, offset)
+                    else:
+                        inflight.append((pool.submit(_score_chunk, chunk, header), rows, offset))
+                        # results are written in submission order, which is input order
+                        while len(inflight) >= 2 * workers or (inflight and inflight[0][0].done()):
+                            future, n, end = inflight.popleft()
+                            write(future.result(), n, end)
+                    header = False
+                while inflight:
+                    future, n, end = inflight.popleft()
+                    write(future.result(), n, end)
+            except BaseException:
+                if pool is not None:
+                    # don't wait for the chunks still queued
+                    pool.shutdown(cancel_futures=True)
+                raise
+    except BaseException:
+        # keep a resumable partial output; without a checkpoint there is nothing to resume
+        if not os.path.exists(progress_path):
+            os.remove(partial_path)
+        raise
+    # a crash between these two leaves a partial output that --resume won't pick up, never a wrong one
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    os.replace(partial_path, output_path)
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score a CSV or Parquet file of farms offline')
+    parser.add_argument('input', help='.csv or .parquet with soil_type, crop_type, irrigation_type, acres, lat, lon')
+    parser.add_argument('output', help='CSV file to write')
+    parser.add_argument('--model', choices=MODELS, default='csv')
+    parser.add_argument('--engine', choices=('native', 'compiled', 'tensor'), default='native',
+                        help="model implementation: 'compiled' for lgb/xgb, 'tensor' from prediction_tensor.py")
+    parser.add_argument('--svm-backend', choices=('kernel', 'approx'), default=os.environ.get('SVM_BACKEND', 'kernel'))
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='scoring processes (0: in this process)')
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--resume', action='store_true', help='continue an interrupted run into the same output')
+    args = parser.parse_args()
+
+    def on_progress(stats):
+        if stats['total_rows']:
+            done = f"{stats['rows']}/{stats['total_rows']} rows ({100 * stats['rows'] / stats['total_rows']:.1f}%)"
+        else:
+            done = f"{stats['rows']} rows ({100 * stats['input_offset'] / max(stats['input_bytes'], 1):.1f}%)"
+        print(f"{done}, {stats['rows_per_s']:.0f} rows/s", file=sys.stderr)
+
+    try:
+        stats = score_file(args.input, args.output, args.model, args.engine, args.svm_backend, args.workers,
+                           args.chunk_rows, args.resume, on_progress)
+    except KeyboardInterrupt:
+        print("Interrupted; rerun with --resume to continue", file=sys.stderr)
+        sys.exit(130)
+    except (ValueError, RuntimeError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(stats))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,195 @@
+# serve.py
+# Production entry point for the Flask services (instead of app.run(debug=True)).
+#
+#   python serve.py predictor --workers 4 --threads 8 --port 5001
+#   python serve.py auth --workers 2 --port 5002
+#
+# Runs the app under gunicorn with gthread workers. The app module is
+# imported and warmed up (CSV yield index, models, soil tiles) in the master
+# process before forking, so workers share that memory copy-on-write. Each
+# worker runs --threads requests at a time and lets at most --max-queue more
+# wait; beyond that requests get an immediate 503 instead of queueing
+# without bound.
+
+import argparse
+import importlib
+import logging
+import multiprocessing
+import os
+import threading
+
+APPS = {
+    'predictor': ('ml_yield_predictor', 5001),
+    'auth': ('user_auth_backend', 5002),
+}
+
+
+class BoundedConcurrency:
+    """WSGI middleware: at most `concurrency` requests run, at most `max_queue` wait.
+
+    gunicorn is given concurrency + max_queue handler threads, so every request
+    a worker has picked up is visible here. Requests beyond the queue bound,
+    or that wait longer than `queue_timeout` seconds, are answered with 503.
+    """
+
+    def __init__(self, app, concurrency, max_queue, queue_timeout=1.0, retry_after=1):
+        self.app = app
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.retry_after = str(retry_after)
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.rejected = 0
+
+    def _busy(self, start_response):
+        with self._lock:
+            self.rejected += 1
+        body = b'{"error": "Server busy, retry later"}'
+        start_response('503 Service Unavailable', [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(body))),
+            ('Retry-After', self.retry_after),
+        ])
+        return [body]
+
+    def __call__(self, environ, start_response):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self.waiting >= self.max_queue:
+                    full = True
+                else:
+                    full = False
+                    self.waiting += 1
+            if full:
+                return self._busy(start_response)
+            try:
+                acquired = self._slots.acquire(timeout=self.queue_timeout)
+            finally:
+                with self._lock:
+                    self.waiting -= 1
+            if not acquired:
+                return self._busy(start_response)
+        try:
+            result = self.app(environ, start_response)
+        except BaseException:
+            self._slots.release()
+            raise
+        # hold the slot until the server has sent the (possibly streamed) body
+        return _ReleaseOnClose(result, self._slots.release)
+
+
+class _ReleaseOnClose:
+    def __init__(self, iterable, release):
+        self._iterable = iterable
+        self._release = release
+
+    def __iter__(self):
+        return iter(self._iterable)
+
+    def close(self):
+        try:
+            if hasattr(self._iterable, 'close'):
+                self._iterable.close()
+        finally:
+            release, self._release = self._release, None
+            if release is not None:
+                release()
+
+
+def warm_up(name, module):
+    """Load everything a worker would otherwise load on its first request."""
+    if name == 'predictor':
+        import climate_store
+        import soil_client
+        soil_client.default_tile_store()
+        # read-only mmaps, shared by the forked workers
+        climate_store.default_store()
+        names = [module._registry_key(m, module.DEFAULT_ENGINE) for m in module.MODEL_TYPES]
+        if module.DEFAULT_ENGINE == 'auto':
+            names += ['lgb_compiled', 'xgb_compiled']
+        # load in the main thread: thread pools don't survive fork
+        for model in names:
+            module.registry.get(model)
+        # built before forking, so workers share its arrays
+        module.get_spatial_index()
+    elif name == 'auth' and hasattr(module, 'init_db'):
+        module.init_db()
+
+
+def after_fork(name, module):
+    if name == 'predictor':
+        import soil_client
+        soil_client.reset_after_fork()
+        module.registry.after_fork()
+    elif name == 'auth' and hasattr(module, 'pool'):
+        module.pool.after_fork()
+        module.hasher.after_fork()
+
+
+def build_app(name, threads, max_queue, queue_timeout, preload=True):
+    module_name, _ = APPS[name]
+    module = importlib.import_module(module_name)
+    if preload:
+        warm_up(name, module)
+    return module, BoundedConcurrency(module.app, threads, max_queue, queue_timeout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run an AgriPredict service with a worker pool')
+    parser.add_argument('app', choices=sorted(APPS))
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('WEB_WORKERS', multiprocessing.cpu_count())))
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('WEB_THREADS', 4)),
+                        help='requests processed concurrently per worker')
+    parser.add_argument('--max-queue', type=int, default=int(os.environ.get('WEB_MAX_QUEUE', 0)),
+                        help='requests allowed to wait per worker before answering 503 (default: 2 x threads)')
+    parser.add_argument('--queue-timeout', type=float, default=float(os.environ.get('WEB_QUEUE_TIMEOUT', 1.0)),
+                        help='seconds a queued request may wait for a thread before 503')
+    parser.add_argument('--backlog', type=int, default=2048)
+    parser.add_argument('--keepalive', type=int, default=5)
+    parser.add_argument('--timeout', type=int, default=30)
+    parser.add_argument('--graceful-timeout', type=int, default=30)
+    parser.add_argument('--no-preload', action='store_true')
+    args = parser.parse_args()
+
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        raise SystemExit('serve.py needs gunicorn: pip install gunicorn')
+
+    logging.basicConfig(level=logging.INFO)
+    max_queue = args.max_queue or 2 * args.threads
+    module, wsgi_app = build_app(args.app, args.threads, max_queue, args.queue_timeout,
+                                 preload=not args.no_preload)
+    port = args.port or APPS[args.app][1]
+
+    class Server(BaseApplication):
+        def load_config(self):
+            options = {
+                'bind': f'{args.host}:{port}',
+                'workers': args.workers,
+                # queued requests wait on a handler thread inside BoundedConcurrency
+                'threads': args.threads + max_queue,
+                'worker_class': 'gthread',
+                'backlog': args.backlog,
+                'keepalive': args.keepalive,
+                'timeout': args.timeout,
+                'graceful_timeout': args.graceful_timeout,
+                'preload_app': True,
+                'post_fork': lambda server, worker: after_fork(args.app, module),
+            }
+            for key, value in options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            return wsgi_app
+
+    logging.info("Serving %s on %s:%d with %d workers x %d threads (queue of %d per worker)",
+                 args.app, args.host, port, args.workers, args.threads, max_queue)
+    Server().run()
+
+
+if __name__ == '__main__':
+    main()
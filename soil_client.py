@@ -0,0 +1,274 @@
+# soil_client.py
+# Cached, time-bounded SoilGrids client used by ml_yield_predictor.get_soil_data
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+
+from soil_tiles import MANIFEST, SoilTileStore
+
+SOILGRIDS_URL = 'https://rest.isric.org/soilgrids/v2.0/properties/query'
+DEFAULT_SOIL = (1.0, 7.0)  # (organic carbon, pH) used when the service can't answer
+
+
+def _point(lat, lon):
+    """(lat, lon) as floats, or None (logged) when they are not valid coordinates."""
+    try:
+        point = float(lat), float(lon)
+    except (TypeError, ValueError):
+        point = float('nan'), float('nan')
+    if not (-90.0 <= point[0] <= 90.0 and -180.0 <= point[1] <= 180.0):  # also rejects NaN
+        logging.warning("Invalid soil lookup coordinates (%r, %r); using defaults", lat, lon)
+        return None
+    return point
+
+
+def parse_soilgrids(data):
+    """Extract (oc, ph) from a SoilGrids v2.0 properties response."""
+    oc, ph = DEFAULT_SOIL
+    props = data.get('properties') if isinstance(data, dict) else None
+    if props:
+        if 'ocd' in props and 'values' in props['ocd']:
+            oc = float(props['ocd']['values'][0].get('value', oc))
+        if 'phh2o' in props and 'values' in props['phh2o']:
+            ph = float(props['phh2o']['values'][0].get('value', ph))
+    return oc, ph
+
+
+class SoilClient:
+    """SoilGrids lookups with connection pooling, timeouts and caching.
+
+    Points are snapped to a grid of `resolution` degrees, so nearby farms share a
+    cache entry. Results live in an in-memory LRU with a TTL and optionally in a
+    SQLite file that survives restarts. Concurrent lookups of the same cell wait
+    on a single upstream request. Failed lookups and invalid coordinates return
+    DEFAULT_SOIL (logged), which is not cached.
+    """
+
+    def __init__(self, base_url=SOILGRIDS_URL, resolution=0.01, timeout=(2.0, 5.0),
+                 cache_size=10000, ttl=7 * 24 * 3600, disk_cache=None, pool_size=16,
+                 max_workers=8):
+        self.base_url = base_url
+        self.resolution = resolution
+        self.timeout = timeout
+        self.cache_size = cache_size
+        self.ttl = ttl
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._cache = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='soil')
+        self.stats = {'hits': 0, 'disk_hits': 0, 'misses': 0, 'coalesced': 0, 'errors': 0}
+        self._db = None
+        if disk_cache:
+            self._db = sqlite3.connect(disk_cache, check_same_thread=False)
+            self._db.execute('CREATE TABLE IF NOT EXISTS soil (lat REAL, lon REAL, value TEXT, '
+                             'fetched_at REAL, PRIMARY KEY (lat, lon))')
+            self._db.commit()
+
+    def cell(self, lat, lon):
+        r = self.resolution
+        return round(round(float(lat) / r) * r, 6), round(round(float(lon) / r) * r, 6)
+
+    def _cache_get(self, key, now):
+        entry = self._cache.get(key)
+        if entry is not None:
+            value, expires = entry
+            if expires > now:
+                self._cache.move_to_end(key)
+                return value
+            del self._cache[key]
+        return None
+
+    def _cache_put(self, key, value, expires):
+        self._cache[key] = (value, expires)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _disk_get(self, key, now):
+        with self._db_lock:
+            row = self._db.execute('SELECT value, fetched_at FROM soil WHERE lat = ? AND lon = ?', key).fetchone()
+        if row and row[1] + self.ttl > now:
+            return tuple(json.loads(row[0])), row[1] + self.ttl
+        return None
+
+    def _disk_put(self, key, value, now):
+        with self._db_lock:
+            self._db.execute('INSERT OR REPLACE INTO soil (lat, lon, value, fetched_at) VALUES (?, ?, ?, ?)',
+                             (key[0], key[1], json.dumps(value), now))
+            self._db.commit()
+
+    def fetch(self, lat, lon):
+        """Query the SoilGrids API directly; raises on network or HTTP errors."""
+        params = [('lon', lon), ('lat', lat), ('property', 'ocd'), ('property', 'phh2o')]
+        resp = self.session.get(self.base_url, params=params, timeout=self.timeout)
+        resp.raise_for_status()
+        return parse_soilgrids(resp.json())
+
+    def get(self, lat, lon):
+        """Return (oc, ph) for a point, from cache when possible."""
+        point = _point(lat, lon)
+        if point is None:
+            with self._lock:
+                self.stats['errors'] += 1
+            return DEFAULT_SOIL
+        key = self.cell(*point)
+        now = time.time()
+        with self._lock:
+            value = self._cache_get(key, now)
+            if value is not None:
+                self.stats['hits'] += 1
+                return value
+            waiter = self._inflight.get(key)
+            if waiter is None:
+                waiter = self._inflight[key] = Future()
+                owner = True
+            else:
+                self.stats['coalesced'] += 1
+                owner = False
+        if not owner:
+            return waiter.result()
+
+        value = DEFAULT_SOIL
+        try:
+            disk = self._disk_get(key, now) if self._db is not None else None
+            if disk is not None:
+                value, expires = disk
+                with self._lock:
+                    self.stats['disk_hits'] += 1
+                    self._cache_put(key, value, expires)
+            else:
+                with self._lock:
+                    self.stats['misses'] += 1
+                try:
+                    value = self.fetch(*key)
+                except Exception as e:
+                    logging.warning("SoilGrids lookup failed for %s: %s", key, e)
+                    with self._lock:
+                        self.stats['errors'] += 1
+                else:
+                    with self._lock:
+                        self._cache_put(key, value, now + self.ttl)
+                    if self._db is not None:
+                        self._disk_put(key, value, now)
+        except Exception as e:
+            # e.g. the disk cache failing: owner and waiters all get `value`
+            logging.warning("Soil lookup failed for %s: %s", key, e)
+            with self._lock:
+                self.stats['errors'] += 1
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            waiter.set_result(value)
+        return value
+
+    def get_async(self, lat, lon):
+        """Non-blocking variant of get(); returns a concurrent.futures.Future."""
+        return self._executor.submit(self.get, lat, lon)
+
+    def get_many(self, points):
+        """Look up many (lat, lon) points concurrently, one request per distinct cell."""
+        keys = []
+        for lat, lon in points:
+            point = _point(lat, lon)
+            keys.append(None if point is None else self.cell(*point))
+        cells = {key: self.get_async(*key) for key in dict.fromkeys(keys) if key is not None}
+        invalid = keys.count(None)
+        if invalid:
+            with self._lock:
+                self.stats['errors'] += invalid
+        return [DEFAULT_SOIL if key is None else cells[key].result() for key in keys]
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+_default_client = None
+_default_lock = threading.Lock()
+
+def default_client():
+    # Configured from the environment so deployments can tune it without code changes
+    global _default_client
+    with _default_lock:
+        if _default_client is None:
+            _default_client = SoilClient(
+                base_url=os.environ.get('SOILGRIDS_URL', SOILGRIDS_URL),
+                resolution=float(os.environ.get('SOIL_GRID_RESOLUTION', 0.01)),
+                timeout=(float(os.environ.get('SOIL_CONNECT_TIMEOUT', 2.0)),
+                         float(os.environ.get('SOIL_READ_TIMEOUT', 5.0))),
+                cache_size=int(os.environ.get('SOIL_CACHE_SIZE', 10000)),
+                ttl=float(os.environ.get('SOIL_CACHE_TTL', 7 * 24 * 3600)),
+                disk_cache=os.environ.get('SOIL_DISK_CACHE') or None,
+            )
+        return _default_client
+
+_tile_store = None
+_tile_store_loaded = False
+
+def default_tile_store():
+    # Offline tiles are optional: SOIL_TILE_DIR (default ./soil_tiles) must hold a manifest
+    global _tile_store, _tile_store_loaded
+    with _default_lock:
+        if not _tile_store_loaded:
+            path = os.environ.get('SOIL_TILE_DIR', 'soil_tiles')
+            if os.path.exists(os.path.join(path, MANIFEST)):
+                try:
+                    _tile_store = SoilTileStore(path)
+                except Exception as e:
+                    logging.warning("Could not open soil tile store %s: %s", path, e)
+            _tile_store_loaded = True
+        return _tile_store
+
+def reset_after_fork():
+    # Forked workers must not share the parent's pooled sockets or thread pool;
+    # the tile store is a read-only mmap and stays shared.
+    global _default_client, _default_lock
+    _default_lock = threading.Lock()
+    _default_client = None
+
+def get_soil_data(lat, lon):
+    # Local tiles first; only points outside them go to SoilGrids
+    point = _point(lat, lon)
+    if point is None:
+        return DEFAULT_SOIL
+    lat, lon = point
+    tiles = default_tile_store()
+    if tiles is not None:
+        value = tiles.lookup(lat, lon)
+        if value is not None:
+            return value
+    return default_client().get(lat, lon)
+
+def get_soil_data_many(points):
+    """(oc, ph) for a list of (lat, lon) points, sampling the tiles in one vectorized pass."""
+    points = [_point(lat, lon) for lat, lon in points]
+    results = [DEFAULT_SOIL if p is None else None for p in points]
+    valid = [k for k, p in enumerate(points) if p is not None]
+    tiles = default_tile_store()
+    if tiles is not None and valid:
+        lat, lon = np.array([points[k] for k in valid], dtype=np.float64).T
+        sampled = tiles.sample(lat, lon)
+        inside = ~np.isnan(sampled).any(axis=0)
+        for i in np.flatnonzero(inside):
+            results[valid[i]] = (float(sampled[0, i]), float(sampled[1, i]))
+    remote = [k for k, r in enumerate(results) if r is None]
+    if remote:
+        fetched = default_client().get_many([points[k] for k in remote])
+        for k, value in zip(remote, fetched):
+            results[k] = value
+    return results
@@ -0,0 +1,187 @@
+# soil_tiles.py
+# Offline soil raster store: organic carbon (ocd) and pH (phh2o) kept as
+# memory-mapped NumPy tiles so soil lookups are plain array indexing.
+#
+# Layout of a tile directory:
+#   manifest.json         grid origin, resolution, tile size, layer names, tile list
+#   tile_<row>_<col>.npy  float32 array of shape (layers, tile_size, tile_size), NaN = no data
+#
+# Build a store from a CSV with lat, lon, ocd, phh2o columns:
+#   python soil_tiles.py build --csv region_soil.csv --out soil_tiles
+# or a synthetic grid for testing:
+#   python soil_tiles.py build --synthetic 19.5 22.5 84.0 87.5 --out soil_tiles
+
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+LAYERS = ['ocd', 'phh2o']
+MANIFEST = 'manifest.json'
+
+
+class SoilTileStore:
+    """Read-only sampler over a tile directory written by build_tiles()."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, MANIFEST)) as f:
+            manifest = json.load(f)
+        self.lat0 = float(manifest['lat0'])
+        self.lon0 = float(manifest['lon0'])
+        self.resolution = float(manifest['resolution'])
+        self.tile_size = int(manifest['tile_size'])
+        self.layers = manifest['layers']
+        self.tiles = {}
+        for row, col in manifest['tiles']:
+            fname = os.path.join(path, f'tile_{row}_{col}.npy')
+            self.tiles[(row, col)] = np.load(fname, mmap_mode='r')
+
+    def _gather(self, gi, gj):
+        """Values at integer grid indices; returns (layers, n) with NaN outside the tiles."""
+        t = self.tile_size
+        out = np.full((len(self.layers), len(gi)), np.nan, dtype=np.float32)
+        tr, tc = np.floor_divide(gi, t), np.floor_divide(gj, t)
+        li, lj = gi - tr * t, gj - tc * t
+        if len(gi) == 0:
+            return out
+        if (tr == tr[0]).all() and (tc == tc[0]).all():
+            # common case: every point falls in the same tile
+            groups = [((int(tr[0]), int(tc[0])), slice(None))]
+        else:
+            keys = np.stack([tr, tc], axis=1)
+            uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+            inverse = inverse.ravel()
+            groups = [((int(r), int(c)), inverse == k) for k, (r, c) in enumerate(uniq)]
+        for key, sel in groups:
+            tile = self.tiles.get(key)
+            if tile is not None:
+                out[:, sel] = tile[:, li[sel], lj[sel]]
+        return out
+
+    def sample(self, lat, lon, method='bilinear'):
+        """Sample every layer at the given points.
+
+        Returns a float32 array of shape (layers, n). Bilinear sampling falls back
+        to the nearest grid point where a neighbour is missing; points outside the
+        store are NaN.
+        """
+        lat = np.atleast_1d(np.asarray(lat, dtype=np.float64))
+        lon = np.atleast_1d(np.asarray(lon, dtype=np.float64))
+        fi = (lat - self.lat0) / self.resolution
+        fj = (lon - self.lon0) / self.resolution
+        nearest = self._gather(np.rint(fi).astype(np.int64), np.rint(fj).astype(np.int64))
+        if method == 'nearest':
+            return nearest
+        i0, j0 = np.floor(fi).astype(np.int64), np.floor(fj).astype(np.int64)
+        di, dj = (fi - i0).astype(np.float32), (fj - j0).astype(np.float32)
+        v00 = self._gather(i0, j0)
+        v01 = self._gather(i0, j0 + 1)
+        v10 = self._gather(i0 + 1, j0)
+        v11 = self._gather(i0 + 1, j0 + 1)
+        out = (v00 * (1 - di) * (1 - dj) + v01 * (1 - di) * dj +
+               v10 * di * (1 - dj) + v11 * di * dj)
+        missing = np.isnan(out)
+        out[missing] = nearest[missing]
+        return out
+
+    def _at(self, i, j):
+        t = self.tile_size
+        tile = self.tiles.get((i // t, j // t))
+        if tile is None:
+            return None
+        v = tile[:, i % t, j % t]
+        return None if np.isnan(v).any() else v
+
+    def lookup(self, lat, lon, method='bilinear'):
+        """(oc, ph) for a single point, or None when the point is outside the tiles."""
+        # scalar path of sample(): avoids the array set-up cost for one point
+        fi = (float(lat) - self.lat0) / self.resolution
+        fj = (float(lon) - self.lon0) / self.resolution
+        v = None
+        if method == 'bilinear':
+            i0, j0 = int(np.floor(fi)), int(np.floor(fj))
+            corners = [self._at(i0, j0), self._at(i0, j0 + 1), self._at(i0 + 1, j0), self._at(i0 + 1, j0 + 1)]
+            if all(c is not None for c in corners):
+                di, dj = fi - i0, fj - j0
+                v = (corners[0] * (1 - di) * (1 - dj) + corners[1] * (1 - di) * dj +
+                     corners[2] * di * (1 - dj) + corners[3] * di * dj)
+        if v is None:
+            v = self._at(int(round(fi)), int(round(fj)))
+            if v is None:
+                return None
+        return float(v[0]), float(v[1])
+
+
+def build_tiles(lat, lon, values, out_dir, resolution=0.01, tile_size=256):
+    """Write point values (layers, n) snapped to a regular grid into a tile directory."""
+    lat = np.asarray(lat, dtype=np.float64)
+    lon = np.asarray(lon, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float32)
+    lat0 = float(np.floor(lat.min() / resolution) * resolution)
+    lon0 = float(np.floor(lon.min() / resolution) * resolution)
+    gi = np.rint((lat - lat0) / resolution).astype(np.int64)
+    gj = np.rint((lon - lon0) / resolution).astype(np.int64)
+    tr, tc = gi // tile_size, gj // tile_size
+    os.makedirs(out_dir, exist_ok=True)
+    keys = np.stack([tr, tc], axis=1)
+    uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    tiles = []
+    for k, (r, c) in enumerate(uniq):
+        sel = inverse == k
+        tile = np.full((len(LAYERS), tile_size, tile_size), np.nan, dtype=np.float32)
+        tile[:, gi[sel] - r * tile_size, gj[sel] - c * tile_size] = values[:, sel]
+        # running stores keep tiles memory-mapped: replace the file, never overwrite it in place
+        path = os.path.join(out_dir, f'tile_{r}_{c}.npy')
+        with open(path + '.tmp', 'wb') as f:
+            np.save(f, tile)
+        os.replace(path + '.tmp', path)
+        tiles.append([int(r), int(c)])
+    manifest = {'version': 1, 'lat0': lat0, 'lon0': lon0, 'resolution': resolution,
+                'tile_size': tile_size, 'layers': LAYERS, 'tiles': tiles}
+    # write the manifest last so a half-built directory is never picked up
+    tmp = os.path.join(out_dir, MANIFEST + '.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST))
+    return manifest
+
+
+def synthetic_grid(lat_min, lat_max, lon_min, lon_max, resolution=0.01, seed=42):
+    """Smooth, deterministic ocd/phh2o fields over a bounding box (for tests and demos)."""
+    rng = np.random.default_rng(seed)
+    lats = np.arange(lat_min, lat_max + resolution / 2, resolution)
+    lons = np.arange(lon_min, lon_max + resolution / 2, resolution)
+    lat, lon = np.meshgrid(lats, lons, indexing='ij')
+    lat, lon = lat.ravel(), lon.ravel()
+    ocd = 1.0 + 0.2 * np.sin(lat * 3.0) * np.cos(lon * 2.0) + rng.normal(0, 0.01, lat.size)
+    ph = 7.0 + 0.5 * np.cos(lat * 1.5 + lon) + rng.normal(0, 0.02, lat.size)
+    return lat, lon, np.vstack([ocd, ph])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build an offline soil tile store')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build')
+    src = build.add_mutually_exclusive_group(required=True)
+    src.add_argument('--csv', help='CSV with lat, lon, ocd, phh2o columns')
+    src.add_argument('--synthetic', nargs=4, type=float, metavar=('LAT_MIN', 'LAT_MAX', 'LON_MIN', 'LON_MAX'))
+    build.add_argument('--out', default='soil_tiles')
+    build.add_argument('--resolution', type=float, default=0.01)
+    build.add_argument('--tile-size', type=int, default=256)
+    args = parser.parse_args()
+
+    if args.csv:
+        df = pd.read_csv(args.csv, usecols=['lat', 'lon'] + LAYERS)
+        lat, lon, values = df['lat'].values, df['lon'].values, df[LAYERS].values.T
+    else:
+        lat, lon, values = synthetic_grid(*args.synthetic, resolution=args.resolution)
+    manifest = build_tiles(lat, lon, values, args.out, args.resolution, args.tile_size)
+    print(f"Wrote {len(manifest['tiles'])} tiles for {len(lat)} grid points to {args.out}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,266 @@
+# spatial_index.py
+# Location-aware yields from geotagged records (training_data.csv lat/lon),
+# without a model: distance-weighted k nearest neighbours and radius
+# statistics per (crop, irrigation).
+#
+# Each (crop, irrigation) partition keeps its points sorted by grid cell
+# (cell_deg x cell_deg degrees), so the points of any set of cells are
+# contiguous ranges found with np.searchsorted. A query scans the square of
+# cells around it, growing the square until its k nearest points are
+# provably inside (or max_km is reached). Everything is vectorized over
+# query batches.
+#
+# Inserts go to a small sorted delta level per partition, which is merged
+# into the main level once it outgrows a fraction of it, so adding records
+# never re-sorts millions of points at a time. Readers work on immutable
+# snapshots and need no lock.
+#
+# Distances use the equirectangular approximation, which is accurate well
+# within the search radius; longitudes do not wrap at +-180.
+
+import io
+import math
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+KM_PER_DEG_LAT = 110.574
+KM_PER_DEG_LON = 111.320  # at the equator; scaled by cos(lat)
+QUERY_CHUNK = 4096  # queries per vectorized pass, bounds the candidate arrays
+
+
+def _normalize(values):
+    return pd.Series(values, dtype='object').map(str).str.strip().str.lower().to_numpy()
+
+
+class _Points:
+    """Points of one partition level, sorted by cell id."""
+
+    __slots__ = ('cell', 'lat', 'lon', 'y')
+
+    def __init__(self, cell, lat, lon, y):
+        order = np.argsort(cell, kind='stable')
+        self.cell = cell[order]
+        self.lat = lat[order]
+        self.lon = lon[order]
+        self.y = y[order]
+
+    def __len__(self):
+        return len(self.cell)
+
+    def merge(self, other):
+        return _Points(np.concatenate([self.cell, other.cell]), np.concatenate([self.lat, other.lat]),
+                       np.concatenate([self.lon, other.lon]), np.concatenate([self.y, other.y]))
+
+
+_EMPTY = _Points(np.empty(0, np.int64), np.empty(0), np.empty(0), np.empty(0, np.float32))
+
+
+class SpatialYieldIndex:
+    """Grid-bucketed points per (crop, irrigation) with kNN and radius queries."""
+
+    def __init__(self, cell_deg=0.1, max_km=50.0, power=2.0, min_km=0.5, merge_fraction=0.05,
+                 merge_min=4096):
+        self.cell_deg = cell_deg
+        self.max_km = max_km
+        self.power = power
+        self.min_km = min_km  # distances below this weigh the same (co-located records)
+        self.merge_fraction = merge_fraction
+        self.merge_min = merge_min
+        self._cols = int(math.ceil(360.0 / cell_deg))
+        self._parts = {}
+        self._lock = threading.Lock()
+        self.source = None
+
+    def __len__(self):
+        return sum(len(main) + len(delta) for main, delta in self._parts.values())
+
+    def partitions(self):
+        return {key: len(main) + len(delta) for key, (main, delta) in self._parts.items()}
+
+    def _rows_cols(self, lat, lon):
+        rows = np.floor((np.asarray(lat, dtype=np.float64) + 90.0) / self.cell_deg).astype(np.int64)
+        cols = np.floor((np.asarray(lon, dtype=np.float64) + 180.0) / self.cell_deg).astype(np.int64)
+        return rows, cols
+
+    def insert(self, crops, irrigations, lats, lons, yields):
+        """Add records; rows with a missing location or yield are skipped."""
+        lats = np.asarray(lats, dtype=np.float64)
+        lons = np.asarray(lons, dtype=np.float64)
+        yields = np.asarray(yields, dtype=np.float32)
+        ok = np.isfinite(lats) & np.isfinite(lons) & np.isfinite(yields)
+        if not ok.all():
+            crops, irrigations = np.asarray(crops, dtype=object)[ok], np.asarray(irrigations, dtype=object)[ok]
+            lats, lons, yields = lats[ok], lons[ok], yields[ok]
+        if not len(lats):
+            return 0
+        rows, cols = self._rows_cols(lats, lons)
+        cells = rows * self._cols + cols % self._cols
+        codes, keys = pd.factorize(pd.Series(_normalize(crops)) + '\0' + _normalize(irrigations))
+        for code, key in enumerate(keys):
+            sel = np.flatnonzero(codes == code)
+            new = _Points(cells[sel], lats[sel], lons[sel], yields[sel])
+            key = tuple(key.split('\0', 1))
+            with self._lock:
+                main, delta = self._parts.get(key, (_EMPTY, _EMPTY))
+                delta = delta.merge(new)
+                if len(delta) > max(self.merge_min, self.merge_fraction * len(main)):
+                    main, delta = main.merge(delta), _EMPTY
+                self._parts[key] = (main, delta)
+        return len(lats)
+
+    def compact(self):
+        """Merge every delta level into its main level."""
+        with self._lock:
+            for key, (main, delta) in self._parts.items():
+                if len(delta):
+                    self._parts[key] = (main.merge(delta), _EMPTY)
+
+    def _km_per_cell(self, lats):
+        # the shorter side of a cell, in km, at each latitude
+        return self.cell_deg * np.minimum(KM_PER_DEG_LAT, KM_PER_DEG_LON * np.cos(np.radians(lats)))
+
+    def _pairs(self, levels, lats, lons, rings):
+        """(query index, distance km, yield) of every point in the cell square of radius `rings`."""
+        rows, cols = self._rows_cols(lats, lons)
+        offsets = np.arange(-rings, rings + 1)
+        dr, dc = np.meshgrid(offsets, offsets, indexing='ij')
+        cell_ids = (rows[:, None] + dr.ravel()) * self._cols + (cols[:, None] + dc.ravel()) % self._cols
+        qs, ds, ys = [], [], []
+        for pts in levels:
+            if not len(pts):
+                continue
+            lo = np.searchsorted(pts.cell, cell_ids.ravel(), 'left')
+            hi = np.searchsorted(pts.cell, cell_ids.ravel(), 'right')
+            counts = hi - lo
+            total = int(counts.sum())
+            if not total:
+                continue
+            # expand the [lo, hi) ranges into point indices
+            starts = np.repeat(lo - np.cumsum(counts) + counts, counts)
+            p = np.arange(total) + starts
+            q = np.repeat(np.repeat(np.arange(len(lats)), cell_ids.shape[1]), counts)
+            dy = (pts.lat[p] - lats[q]) * KM_PER_DEG_LAT
+            dx = (pts.lon[p] - lons[q]) * KM_PER_DEG_LON * np.cos(np.radians(lats[q]))
+            qs.append(q)
+            ds.append(np.sqrt(dx * dx + dy * dy))
+            ys.append(pts.y[p])
+        if not qs:
+            return np.empty(0, np.int64), np.empty(0), np.empty(0, np.float32)
+        return np.concatenate(qs), np.concatenate(ds), np.concatenate(ys)
+
+    def _weights(self, d):
+        return 1.0 / np.maximum(d, self.min_km) ** self.power
+
+    def knn_many(self, lats, lons, crop, irrigation, k=8):
+        """Distance-weighted mean yield of the k nearest records within max_km of each point.
+
+        Returns (yields, neighbours, max_distance_km); yield is NaN where no record is in range.
+        """
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        n = len(lats)
+        out_y = np.full(n, np.nan)
+        out_n = np.zeros(n, dtype=np.int64)
+        out_d = np.full(n, np.nan)
+        levels = self._parts.get((str(crop).strip().lower(), str(irrigation).strip().lower()))
+        if levels is None:
+            return out_y, out_n, out_d
+        for start in range(0, n, QUERY_CHUNK):
+            todo = np.arange(start, min(start + QUERY_CHUNK, n))
+            rings = 1
+            while len(todo):
+                q, d, y = self._pairs(levels, lats[todo], lons[todo], rings)
+                near = d <= self.max_km
+                q, d, y = q[near], d[near], y[near]
+                # k smallest distances per query: one sort by (query, distance)
+                order = np.argsort(q + d / (2.0 * self.max_km))
+                q, d, y = q[order], d[order], y[order]
+                first = np.searchsorted(q, q, 'left')
+                keep = np.arange(len(q)) - first < k
+                q, d, y = q[keep], d[keep], y[keep]
+                found = np.bincount(q, minlength=len(todo))
+                kth = np.zeros(len(todo))
+                last = np.flatnonzero(np.append(q[1:] != q[:-1], True)) if len(q) else q
+                kth[q[last]] = d[last]
+                reach = rings * self._km_per_cell(lats[todo])
+                done = ((found >= k) & (kth <= reach)) | (reach >= self.max_km)
+                idx = todo[done]
+                w = self._weights(d)
+                wsum = np.bincount(q, weights=w, minlength=len(todo))[done]
+                wysum = np.bincount(q, weights=w * y, minlength=len(todo))[done]
+                with np.errstate(invalid='ignore', divide='ignore'):
+                    out_y[idx] = wysum / wsum
+                out_n[idx] = found[done]
+                out_d[idx] = np.where(found[done] > 0, kth[done], np.nan)
+                todo = todo[~done]
+                rings *= 2
+        return out_y, out_n, out_d
+
+    def knn(self, lat, lon, crop, irrigation, k=8):
+        """(yield or None, neighbours, max_distance_km) for one point."""
+        y, n, d = self.knn_many([lat], [lon], crop, irrigation, k)
+        return (None if np.isnan(y[0]) else float(y[0])), int(n[0]), (None if np.isnan(d[0]) else float(d[0]))
+
+    def radius_many(self, lats, lons, crop, irrigation, radius_km):
+        """Per point: record count, mean and distance-weighted mean yield within radius_km."""
+        lats = np.atleast_1d(np.asarray(lats, dtype=np.float64))
+        lons = np.atleast_1d(np.asarray(lons, dtype=np.float64))
+        n = len(lats)
+        count = np.zeros(n, dtype=np.int64)
+        total = np.zeros(n)
+        wsum = np.zeros(n)
+        wysum = np.zeros(n)
+        levels = self._parts.get((str(crop).strip().lower(), str(irrigation).strip().lower()))
+        if levels is not None:
+            for start in range(0, n, QUERY_CHUNK):
+                sl = slice(start, min(start + QUERY_CHUNK, n))
+                rings = int(math.ceil(radius_km / self._km_per_cell(lats[sl]).min()))
+                q, d, y = self._pairs(levels, lats[sl], lons[sl], rings)
+                inside = d <= radius_km
+                q, d, y = q[inside], d[inside], y[inside]
+                m = sl.stop - sl.start
+                w = self._weights(d)
+                count[sl] = np.bincount(q, minlength=m)
+                total[sl] = np.bincount(q, weights=y, minlength=m)
+                wsum[sl] = np.bincount(q, weights=w, minlength=m)
+                wysum[sl] = np.bincount(q, weights=w * y, minlength=m)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return count, total / count, wysum / wsum
+
+    @classmethod
+    def from_csv(cls, path, target='yield_per_acre', chunksize=500000, **kwargs):
+        """Build from a CSV with crop_type, irrigation_type, lat, lon and `target` columns."""
+        index = cls(**kwargs)
+        index.source = {'path': path, 'target': target, 'offset': 0, 'header': None}
+        index.refresh(chunksize)
+        index.compact()
+        return index
+
+    def refresh(self, chunksize=500000):
+        """Insert the complete lines appended to the source CSV since the last call; returns rows added."""
+        src = self.source
+        with open(src['path'], 'rb') as f:
+            header = f.readline()
+            if src['header'] != header or os.fstat(f.fileno()).st_size < src['offset']:
+                if src['header'] is not None:
+                    # rewritten rather than appended to: start over
+                    self._parts = {}
+                src['header'], src['offset'] = header, len(header)
+            f.seek(src['offset'])
+            data = f.read()
+        end = data.rfind(b'\n') + 1  # a partially written last line waits
+        if not end:
+            return 0
+        src['offset'] += end
+        columns = pd.read_csv(io.BytesIO(header), nrows=0).columns
+        added = 0
+        for chunk in pd.read_csv(io.BytesIO(data[:end]), names=columns, header=None, chunksize=chunksize,
+                                 usecols=['crop_type', 'irrigation_type', 'lat', 'lon', src['target']]):
+            added += self.insert(chunk['crop_type'].to_numpy(), chunk['irrigation_type'].to_numpy(),
+                                 pd.to_numeric(chunk['lat'], errors='coerce').to_numpy(),
+                                 pd.to_numeric(chunk['lon'], errors='coerce').to_numpy(),
+                                 pd.to_numeric(chunk[src['target']], errors='coerce').to_numpy())
+        return added
@@ -0,0 +1,94 @@
+# sqlite_pool.py
+# Per-thread SQLite connections for the Flask services.
+#
+# Opening a connection costs a file open, schema parse and pragma setup, and
+# its statement cache starts empty, so each thread keeps one connection for
+# its lifetime instead. The database runs in WAL mode: readers never block
+# the writer or each other, and commits only append to the log. Statements
+# are compiled once per connection and reused from sqlite3's statement cache
+# (keyed by the SQL text, so queries should be module constants with ?
+# parameters). A busy timeout makes concurrent writers wait for the write
+# lock instead of failing with "database is locked".
+
+import os
+import sqlite3
+import threading
+import weakref
+
+# applied to every new connection; synchronous=NORMAL is durable against
+# application crashes in WAL mode and only risks the last commits on power loss
+DEFAULT_PRAGMAS = {
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'cache_size': -int(os.environ.get('SQLITE_CACHE_KB', 8192)),
+    'temp_store': 'MEMORY',
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_BYTES', 64 * 1024 * 1024)),
+    'foreign_keys': 'ON',
+}
+
+
+class _Connection(sqlite3.Connection):
+    # plain sqlite3.Connection objects can't be weakly referenced
+    pass
+
+
+class SQLitePool:
+    """One connection per thread (and per process) to a WAL-mode SQLite database."""
+
+    def __init__(self, path, busy_timeout=5.0, pragmas=None, cached_statements=256):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # weak, so the connection of a finished thread is closed with its thread-local
+        self._connections = weakref.WeakSet()
+        self._wal = False
+        self.opened = 0
+
+    def _connect(self):
+        # each connection is only used by the thread that opened it; the check
+        # is off so close_all() can close them from another thread
+        conn = sqlite3.connect(self.path, timeout=self.busy_timeout, check_same_thread=False,
+                               cached_statements=self.cached_statements, factory=_Connection)
+        conn.row_factory = sqlite3.Row
+        if not self._wal:
+            # persistent in the database file; only needs to succeed once
+            mode = conn.execute('PRAGMA journal_mode=WAL').fetchone()[0]
+            self._wal = mode.lower() == 'wal'
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name}={value}')
+        with self._lock:
+            self._connections.add(conn)
+            self.opened += 1
+        return conn
+
+    def connection(self):
+        """This thread's connection, opened on first use."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def after_fork(self):
+        """Forget the parent's connections; a forked worker must open its own."""
+        # never close an inherited connection in the child: closing its file
+        # descriptor drops every POSIX lock this process holds on the database,
+        # including those of its own connections, so keep them referenced
+        self._inherited = list(self._connections)
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._connections = weakref.WeakSet()
+
+    def close_all(self):
+        # only safe once no thread is using its connection any more
+        with self._lock:
+            connections, self._connections = list(self._connections), weakref.WeakSet()
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    def stats(self):
+        with self._lock:
+            return {'path': self.path, 'open_connections': len(self._connections),
+                    'opened': self.opened, 'wal': self._wal}
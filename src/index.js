@@ -108,17 +108,33 @@ function FarmPage({ onBack, language, setSelectedCrop, setUserLocation }) {
 
     if (!selectedSoilType) {
       setSuggestions(['Please select a soil type first']);
-    } else {
-      const soilTypeLower = selectedSoilType.toLowerCase();
-      const crops = soilCrops[soilTypeLower] || ['Please select a valid soil type'];
+      setIsAnalyzing(false);
+      return;
+    }
+    const soilTypeLower = selectedSoilType.toLowerCase();
+    const applyCrops = (crops) => {
       setSuggestions(crops);
-      
       if (crops.length > 0 && !crops[0].includes('Please select')) {
         setCropType('');
       }
-    }
-    setIsAnalyzing(false);
-  }, [setCropType]); // Only depend on setCropType since setSuggestions and setIsAnalyzing are stable
+    };
+    // One /recommend call ranks every crop x irrigation pair for this soil;
+    // the static table is only used when the backend is unreachable
+    fetch('http://localhost:5001/recommend', {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ soil_type: soilTypeLower, acres: 1, k: 20, lat: lat || 20.3, lon: lon || 85.8 })
+    })
+      .then((response) => (response.ok ? response.json() : Promise.reject(response.status)))
+      .then((result) => {
+        const crops = [...new Set(result.recommendations.map((r) => r.crop_type))]
+          .slice(0, 5)
+          .map((c) => c.charAt(0).toUpperCase() + c.slice(1));
+        applyCrops(crops.length > 0 ? crops : (soilCrops[soilTypeLower] || ['Please select a valid soil type']));
+      })
+      .catch(() => applyCrops(soilCrops[soilTypeLower] || ['Please select a valid soil type']))
+      .finally(() => setIsAnalyzing(false));
+  }, [setCropType, lat, lon]); // setSuggestions and setIsAnalyzing are stable
 
   // Define handleAnalyse before it's used in handleGps
   const handleAnalyse = React.useCallback(async () => {
@@ -0,0 +1,100 @@
+# test_climate_store.py
+# ClimateStore lookups and overrides on a small synthetic store.
+#
+#   python -m pytest -q test_climate_store.py
+
+import math
+import time
+
+import numpy as np
+import pytest
+
+import climate_store
+from climate_store import LAYERS, ClimateStore, build_store, synthetic_normals, write_override
+
+BOX = (19.0, 21.0, 85.0, 86.0)
+
+
+@pytest.fixture
+def store_dir(tmp_path):
+    build_store(*synthetic_normals(*BOX, resolution=0.5), str(tmp_path), resolution=0.5, dtype='float32')
+    return str(tmp_path)
+
+
+def expected(lat, lon, month):
+    # synthetic_normals at the centre of the point's 0.5 degree cell
+    lat_c = math.floor(lat / 0.5) * 0.5 + 0.25
+    lon_c = math.floor(lon / 0.5) * 0.5 + 0.25
+    _, _, _, values = synthetic_normals(lat_c - 0.25, lat_c + 0.25, lon_c - 0.25, lon_c + 0.25, 0.5)
+    return dict(zip(LAYERS, values[:, month - 1]))
+
+
+def test_lookup_matches_the_synthetic_normals(store_dir):
+    store = ClimateStore(store_dir)
+    for lat, lon, month in [(19.1, 85.1, 1), (20.3, 85.8, 7), (20.99, 85.51, 12)]:
+        got = store.lookup(lat, lon, month)
+        assert got == pytest.approx(expected(lat, lon, month), rel=1e-5)
+        np.testing.assert_allclose(store.lookup_many([lat], [lon], month)[0],
+                                   [got[name] for name in LAYERS], rtol=1e-6)
+
+
+def test_lookup_many_with_per_row_months(store_dir):
+    store = ClimateStore(store_dir)
+    lat, lon, month = [19.1, 20.3, 20.3], [85.1, 85.8, 85.8], [1, 7, 'x']
+    out = store.lookup_many(lat, lon, month)
+    assert out.shape == (3, len(LAYERS))
+    # an invalid month means this month
+    month[2] = climate_store.current_month()
+    for k in range(3):
+        assert list(out[k]) == pytest.approx([expected(lat[k], lon[k], month[k])[n] for n in LAYERS], rel=1e-5)
+
+
+@pytest.mark.parametrize('lat, lon', [(18.9, 85.5), (21.0, 85.5), (20.0, 84.9), (20.0, 86.2), (float('nan'), 85.5)])
+def test_out_of_range_coordinates(store_dir, lat, lon):
+    store = ClimateStore(store_dir)
+    assert store.lookup(lat, lon, 6) == {}
+    assert np.isnan(store.lookup_many([lat, 20.3], [lon, 85.8], 6)[0]).all()
+    assert not np.isnan(store.lookup_many([lat, 20.3], [lon, 85.8], 6)[1]).any()
+    assert store.put_override(lat, lon, 6, temp=40.0) is False
+
+
+def test_override_replaces_given_layers_until_it_expires(store_dir):
+    store = ClimateStore(store_dir)
+    normal = store.lookup(20.3, 85.8, 6)
+    assert store.put_override(20.3, 85.8, 6, ttl=0.3, temp=40.0, rainfall=0.0)
+    # same cell and month: overridden; other months and cells are not
+    got = store.lookup(20.4, 85.9, 6)
+    assert got['temp'] == 40.0 and got['rainfall'] == 0.0 and got['humidity'] == normal['humidity']
+    assert list(store.lookup_many([20.3, 20.3, 19.1], [85.8, 85.8, 85.1], [6, 7, 6])[:, 0]) == \
+        pytest.approx([40.0, expected(20.3, 85.8, 7)['temp'], expected(19.1, 85.1, 6)['temp']], rel=1e-5)
+    time.sleep(0.4)
+    assert store.lookup(20.3, 85.8, 6) == normal
+    assert store.stats()['overrides'] == 0
+
+
+def test_override_rejects_unknown_layers(store_dir):
+    store = ClimateStore(store_dir)
+    with pytest.raises(ValueError):
+        store.put_override(20.3, 85.8, 6, wind=3.0)
+    with pytest.raises(ValueError):
+        write_override(store_dir, 20.3, 85.8, 6, wind=3.0)
+
+
+def test_written_overrides_reach_every_store(store_dir):
+    first, second = ClimateStore(store_dir, override_check=0), ClimateStore(store_dir, override_check=0)
+    write_override(store_dir, 20.3, 85.8, 6, ttl=60, temp=41.0)
+    write_override(store_dir, 19.1, 85.1, 6, ttl=-1, temp=42.0)  # already expired
+    for store in (first, second):
+        assert store.lookup(20.3, 85.8, 6)['temp'] == 41.0
+        assert store.lookup(19.1, 85.1, 6)['temp'] == pytest.approx(expected(19.1, 85.1, 6)['temp'], rel=1e-5)
+    # a store opened later starts with them too
+    assert ClimateStore(store_dir).lookup_many([20.3], [85.8], 6)[0, 0] == 41.0
+
+
+def test_rebuild_leaves_an_open_store_intact(store_dir):
+    store = ClimateStore(store_dir)
+    before = store.lookup(20.3, 85.8, 6)
+    lat, lon, month, values = synthetic_normals(*BOX, resolution=0.5)
+    build_store(lat, lon, month, values + 1.0, store_dir, resolution=0.5, dtype='float32')
+    assert store.lookup(20.3, 85.8, 6) == before
+    assert ClimateStore(store_dir).lookup(20.3, 85.8, 6)['temp'] == pytest.approx(before['temp'] + 1, rel=1e-5)
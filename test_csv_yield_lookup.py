@@ -0,0 +1,71 @@
+# test_csv_yield_lookup.py
+# Yield table lookups and hot reload of the table file.
+#
+#   python -m pytest -q test_csv_yield_lookup.py
+
+import os
+import time
+
+import numpy as np
+import pytest
+
+import csv_yield_lookup
+
+
+def write_table(path, rows, mtime):
+    with open(path, 'w') as f:
+        f.write('soil_type,crop_type,irrigation_type,yield_per_acre\n')
+        f.writelines(f'{s},{c},{i},{y}\n' for s, c, i, y in rows)
+    # distinct mtimes, however fast the test runs
+    os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def table(tmp_path):
+    original = csv_yield_lookup.CSV_PATH
+    path = str(tmp_path / 'yields.csv')
+    write_table(path, [('loamy', 'rice', 'drip', 3.0), ('Clay ', 'wheat', 'canal', 1.5),
+                       ('loamy', 'rice', 'drip', 9.9)], 1000)
+    assert csv_yield_lookup.reload(path)
+    yield path
+    csv_yield_lookup.reload(original)
+
+
+def test_lookup_normalizes_and_keeps_the_first_row(table):
+    assert csv_yield_lookup.lookup_yield(' LOAMY', 'rice', 'Drip') == 3.0
+    assert csv_yield_lookup.lookup_yield('clay', 'wheat', 'canal') == 1.5
+    assert csv_yield_lookup.lookup_yield('clay', 'rice', 'canal') is None
+    np.testing.assert_array_equal(
+        csv_yield_lookup.lookup_yields(['loamy', 'clay', 'peat'], ['rice', 'wheat', 'rice'], ['drip'] * 3),
+        [3.0, np.nan, np.nan])
+
+
+def test_changed_table_is_reloaded(table):
+    write_table(table, [('loamy', 'rice', 'drip', 4.0)], 2000)
+    assert csv_yield_lookup.reload_if_changed(interval=0, background=False)
+    assert csv_yield_lookup.lookup_yield('loamy', 'rice', 'drip') == 4.0
+    # unchanged since: nothing to do
+    assert not csv_yield_lookup.reload_if_changed(interval=0, background=False)
+
+
+def test_corrupt_table_keeps_the_current_index(table, caplog):
+    with open(table, 'w') as f:
+        f.write('soil_type,crop_type,irrigation\nloamy,rice')  # half-written, missing a column
+    os.utime(table, (2000, 2000))
+    assert csv_yield_lookup.reload_if_changed(interval=0, background=False)
+    assert 'Could not reload yield table' in caplog.text
+    assert csv_yield_lookup.lookup_yield('loamy', 'rice', 'drip') == 3.0
+    # not retried until the file changes again
+    assert not csv_yield_lookup.reload_if_changed(interval=0, background=False)
+    write_table(table, [('loamy', 'rice', 'drip', 5.0)], 3000)
+    assert csv_yield_lookup.reload_if_changed(interval=0, background=False)
+    assert csv_yield_lookup.lookup_yield('loamy', 'rice', 'drip') == 5.0
+
+
+def test_reload_runs_off_the_calling_thread(table):
+    write_table(table, [('loamy', 'rice', 'drip', 6.0)], 2000)
+    assert csv_yield_lookup.reload_if_changed(interval=0)
+    deadline = time.monotonic() + 5
+    while csv_yield_lookup.lookup_yield('loamy', 'rice', 'drip') != 6.0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert csv_yield_lookup.lookup_yield('loamy', 'rice', 'drip') == 6.0
@@ -0,0 +1,149 @@
+# test_dataset_cache.py
+# Incremental refresh of the dataset caches (ingest.py + dataset_cache.py)
+# against sqlite3, mongomock and CSV files.
+#
+#   python -m pytest -q test_dataset_cache.py
+
+import sqlite3
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import ingest
+from dataset_cache import CSVCache, MongoCache, SQLCache
+from feature_encoder import ENCODER
+
+SOILS = ['loamy', 'sandy', 'clay']
+CROPS = ['wheat', 'rice', 'cotton']
+IRRIGATIONS = ['drip', 'sprinkler', 'canal']
+
+
+def make_records(n, start=0, ts=None):
+    """n distinct records; `yield` is the record number so skips and duplicates show up."""
+    records = []
+    for k in range(start, start + n):
+        records.append({'soil_type': SOILS[k % 3], 'crop_type': CROPS[k // 3 % 3],
+                        'irrigation_type': IRRIGATIONS[k // 9 % 3], 'acres': 1.0 + k,
+                        'temp': 25.0, 'humidity': 60.0, 'rainfall': 100.0, 'oc': 1.0, 'ph': 7.0,
+                        'yield': float(k), 'ts': k if ts is None else ts[k - start]})
+    return records
+
+
+def sqlite_table(records):
+    conn = sqlite3.connect(':memory:')
+    columns = ENCODER.features + ['yield', 'ts']
+    conn.execute(f"CREATE TABLE yield_data ({', '.join(columns)})")
+    insert_records(conn, records)
+    return conn
+
+
+def insert_records(conn, records):
+    columns = ENCODER.features + ['yield', 'ts']
+    conn.executemany(f"INSERT INTO yield_data VALUES ({', '.join('?' * len(columns))})",
+                     [[r[c] for c in columns] for r in records])
+    conn.commit()
+
+
+def mongo_collection(records):
+    mongomock = pytest.importorskip('mongomock')
+    collection = mongomock.MongoClient().agri.yield_data
+    collection.insert_many([dict(r) for r in records])
+    return collection
+
+
+class _Interrupted(Exception):
+    pass
+
+
+def interrupt_at(batch_number):
+    seen = []
+
+    def on_batch(batch):
+        seen.append(batch)
+        if len(seen) == batch_number:
+            raise _Interrupted
+    return on_batch
+
+
+# timestamps with a run of equal values that straddles the 3-row batch boundaries
+TIED = [1, 2, 3, 4, 4, 4, 4, 4, 5, 6, 7]
+
+
+def test_ingest_matches_encoder(tmp_path):
+    records = make_records(20)
+    conn = sqlite_table(records)
+    X, y = ingest.ingest(ingest.sql_batches(conn, 'yield_data', batch_size=7), expected_rows=4,
+                         directory=str(tmp_path))
+    np.testing.assert_array_equal(X, ENCODER.encode(records))
+    np.testing.assert_array_equal(y, np.arange(20, dtype=np.float32))
+
+
+def test_sql_refresh_appends_new_rows_only(tmp_path):
+    conn = sqlite_table(make_records(10))
+    cache = SQLCache(conn, 'yield_data', 'ts', root=str(tmp_path))
+    X, y = cache.refresh(batch_size=4)
+    assert len(y) == 10 and cache.high_water == 9
+    insert_records(conn, make_records(5, start=10))
+    X, y = SQLCache(conn, 'yield_data', 'ts', root=str(tmp_path)).refresh(batch_size=4)
+    np.testing.assert_array_equal(y, np.arange(15, dtype=np.float32))
+    np.testing.assert_array_equal(X, ENCODER.encode(make_records(15)))
+
+
+def test_sql_resume_with_equal_timestamps_on_a_batch_boundary(tmp_path):
+    conn = sqlite_table(make_records(len(TIED), ts=TIED))
+    cache = SQLCache(conn, 'yield_data', 'ts', root=str(tmp_path))
+    with pytest.raises(_Interrupted):
+        cache.refresh(batch_size=3, on_batch=interrupt_at(3))
+    X, y = SQLCache(conn, 'yield_data', 'ts', root=str(tmp_path)).refresh(batch_size=3)
+    np.testing.assert_array_equal(np.sort(y), np.arange(len(TIED), dtype=np.float32))
+
+
+def test_mongo_refresh_appends_new_documents_only(tmp_path):
+    collection = mongo_collection(make_records(10))
+    X, y = MongoCache(collection, field='ts', root=str(tmp_path)).refresh(batch_size=4)
+    assert len(y) == 10
+    collection.insert_many(make_records(5, start=10))
+    X, y = MongoCache(collection, field='ts', root=str(tmp_path)).refresh(batch_size=4)
+    np.testing.assert_array_equal(y, np.arange(15, dtype=np.float32))
+
+
+def test_mongo_resume_with_equal_timestamps_on_a_batch_boundary(tmp_path):
+    collection = mongo_collection(make_records(len(TIED), ts=TIED))
+    with pytest.raises(_Interrupted):
+        MongoCache(collection, field='ts', root=str(tmp_path)).refresh(batch_size=3, on_batch=interrupt_at(3))
+    cache = MongoCache(collection, field='ts', root=str(tmp_path))
+    # no checkpoint inside the run of 4s: resumes after ts=3
+    assert cache.rows == 3 and cache.high_water == 3
+    X, y = cache.refresh(batch_size=3)
+    np.testing.assert_array_equal(np.sort(y), np.arange(len(TIED), dtype=np.float32))
+
+
+def write_csv(path, records, mode='w'):
+    pd.DataFrame(records).to_csv(path, mode=mode, header=mode == 'w', index=False)
+
+
+def test_csv_refresh_reads_appended_lines(tmp_path):
+    path = tmp_path / 'data.csv'
+    write_csv(path, make_records(6))
+    X, y = CSVCache(str(path), root=str(tmp_path / 'cache')).refresh(batch_size=4)
+    assert len(y) == 6
+    write_csv(path, make_records(4, start=6), mode='a')
+    with open(path, 'a') as f:
+        f.write('loamy,wheat,drip,3.0')  # partially written line
+    X, y = CSVCache(str(path), root=str(tmp_path / 'cache')).refresh(batch_size=4)
+    np.testing.assert_array_equal(y, np.arange(10, dtype=np.float32))
+    np.testing.assert_array_equal(X, ENCODER.encode(make_records(10)))
+    with open(path, 'a') as f:
+        f.write(',25.0,60.0,100.0,1.0,7.0,10.0,10\n')
+    X, y = CSVCache(str(path), root=str(tmp_path / 'cache')).refresh(batch_size=4)
+    np.testing.assert_array_equal(y, np.arange(11, dtype=np.float32))
+
+
+def test_csv_rewrite_starts_over(tmp_path):
+    path = tmp_path / 'data.csv'
+    write_csv(path, make_records(6))
+    CSVCache(str(path), root=str(tmp_path / 'cache')).refresh()
+    write_csv(path, make_records(3, start=100))
+    X, y = CSVCache(str(path), root=str(tmp_path / 'cache')).refresh()
+    np.testing.assert_array_equal(y, np.arange(100, 103, dtype=np.float32))
@@ -0,0 +1,56 @@
+# test_ml_yield_predictor.py
+# The prediction endpoints against the models shipped in the repository.
+#
+#   python -m pytest -q test_ml_yield_predictor.py
+
+import os
+
+import pytest
+
+# soil lookups fail fast and fall back to the defaults instead of calling SoilGrids
+os.environ.setdefault('SOILGRIDS_URL', 'http://127.0.0.1:9/query')
+
+import ml_yield_predictor  # noqa: E402
+from ml_yield_predictor import MODEL_TYPES  # noqa: E402
+
+FARM = {'soil_type': 'loamy', 'crop_type': 'rice', 'irrigation_type': 'drip', 'acres': 2.5,
+        'lat': 20.3, 'lon': 85.8}
+
+
+@pytest.fixture
+def client():
+    return ml_yield_predictor.app.test_client()
+
+
+@pytest.mark.parametrize('model', MODEL_TYPES)
+@pytest.mark.parametrize('engine', ['native', 'compiled'])
+def test_batch_serves_every_model(client, model, engine):
+    response = client.post('/predict/batch', json=[dict(FARM, model=model, engine=engine), dict(FARM, acres=5)])
+    assert response.status_code == 200, response.get_json()
+    results = response.get_json()['results']
+    assert 'error' not in results[0], results[0]
+    assert results[0]['total_yield'] == pytest.approx(results[0]['predicted_yield_per_acre'] * 2.5, abs=0.01)
+
+
+@pytest.mark.parametrize('model', ('csv',) + MODEL_TYPES)
+def test_recommend_serves_every_model(client, model):
+    response = client.post('/recommend', json={'soil_type': 'loamy', 'acres': 2, 'lat': 20.3, 'lon': 85.8,
+                                               'model': model, 'k': 3})
+    assert response.status_code == 200, response.get_json()
+    assert len(response.get_json()['recommendations']) == 3
+
+
+@pytest.mark.parametrize('model', ['csv', 'lgb', 'anything'])
+def test_predict_answers_from_the_csv_table(client, model):
+    response = client.post('/predict', json=dict(FARM, model=model))
+    assert response.status_code == 200, response.get_json()
+    # the baseline contract: /predict answers from the CSV table unless 'knn' is asked for
+    assert response.get_json()['message'].endswith('(CSV)')
+
+
+def test_predict_parse_stage_is_not_labelled_with_a_model(client):
+    client.post('/predict', json=dict(FARM, model='knn'))
+    text = client.get('/metrics').get_data(as_text=True)
+    parse = [line for line in text.splitlines() if 'stage="parse"' in line and '_count' in line]
+    assert any('model="predict"' in line for line in parse)
+    assert not any('model="csv"' in line for line in parse)
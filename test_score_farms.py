@@ -0,0 +1,90 @@
+# test_score_farms.py
+# score_farms.py end to end, with the models shipped in the repository.
+#
+#   python -m pytest -q test_score_farms.py
+
+import os
+import subprocess
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import score_farms
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+# soil lookups fail fast and fall back to the defaults instead of calling SoilGrids
+ENV = dict(os.environ, SOILGRIDS_URL='http://127.0.0.1:9/query')
+
+
+def farms(n=250):
+    k = np.arange(n)
+    return pd.DataFrame({'soil_type': np.array(['loamy', 'clay', 'sandy'])[k % 3],
+                         'crop_type': np.array(['rice', 'wheat', 'maize', 'cotton'])[k % 4],
+                         'irrigation_type': np.array(['drip', 'canal'])[k % 2],
+                         'acres': 1.0 + k % 7, 'lat': 20.0 + k % 10 * 0.1, 'lon': 85.5 + k % 5 * 0.1})
+
+
+def run_cli(*args):
+    # from the repository directory, where the model files are
+    return subprocess.run([sys.executable, os.path.join(HERE, 'score_farms.py'), *map(str, args)],
+                          cwd=HERE, env=ENV, capture_output=True, text=True, timeout=300)
+
+
+@pytest.mark.parametrize('model', score_farms.MODELS)
+@pytest.mark.parametrize('fmt', ['csv', 'parquet'])
+def test_cli_scores_every_model(tmp_path, model, fmt):
+    if fmt == 'parquet':
+        pytest.importorskip('pyarrow')
+    src = tmp_path / f'farms.{fmt}'
+    getattr(farms(), f'to_{fmt}')(src, index=False)
+    out = tmp_path / 'scored.csv'
+    result = run_cli(src, out, '--model', model, '--workers', 0, '--chunk-rows', 100)
+    assert result.returncode == 0, result.stderr
+    scored = pd.read_csv(out)
+    assert len(scored) == 250 and not scored['predicted_yield_per_acre'].isna().all()
+    np.testing.assert_allclose(scored['total_yield'], (scored['predicted_yield_per_acre'] * scored['acres']).round(2),
+                               atol=0.011)
+    assert sorted(os.listdir(tmp_path)) == sorted([src.name, out.name])
+
+
+def test_pool_matches_in_process_scoring(tmp_path):
+    src = tmp_path / 'farms.csv'
+    farms().to_csv(src, index=False)
+    assert run_cli(src, tmp_path / 'a.csv', '--model', 'lgb', '--workers', 0, '--chunk-rows', 60).returncode == 0
+    assert run_cli(src, tmp_path / 'b.csv', '--model', 'lgb', '--workers', 2, '--chunk-rows', 60).returncode == 0
+    assert (tmp_path / 'a.csv').read_bytes() == (tmp_path / 'b.csv').read_bytes()
+
+
+def test_failed_run_leaves_no_output(tmp_path):
+    src = tmp_path / 'farms.csv'
+    farms().to_csv(src, index=False)
+    # no prediction tensor is shipped
+    for workers in (0, 2):
+        result = run_cli(src, tmp_path / 'scored.csv', '--model', 'xgb', '--engine', 'tensor', '--workers', workers)
+        assert result.returncode == 1
+        assert os.listdir(tmp_path) == ['farms.csv']
+
+
+class _Stop(Exception):
+    pass
+
+
+def test_resume_after_an_interruption(tmp_path, monkeypatch):
+    monkeypatch.setenv('SOILGRIDS_URL', ENV['SOILGRIDS_URL'])
+    monkeypatch.chdir(HERE)
+    src, out = str(tmp_path / 'farms.csv'), str(tmp_path / 'scored.csv')
+    farms().to_csv(src, index=False)
+
+    def stop_after_two(stats):
+        if stats['rows'] >= 100:
+            raise _Stop
+    with pytest.raises(_Stop):
+        score_farms.score_file(src, out, 'csv', workers=0, chunk_rows=50, on_progress=stop_after_two)
+    assert not os.path.exists(out) and os.path.exists(out + '.partial')
+    stats = score_farms.score_file(src, out, 'csv', workers=0, chunk_rows=50, resume=True)
+    assert stats['resumed_at'] == 100 and stats['rows'] == 250
+    score_farms.score_file(src, str(tmp_path / 'straight.csv'), 'csv', workers=0, chunk_rows=50)
+    assert open(out, 'rb').read() == open(tmp_path / 'straight.csv', 'rb').read()
+    assert sorted(os.listdir(tmp_path)) == ['farms.csv', 'scored.csv', 'straight.csv']
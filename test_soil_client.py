@@ -0,0 +1,134 @@
+# test_soil_client.py
+# SoilClient against a local stub of the SoilGrids API.
+#
+#   python -m pytest -q test_soil_client.py
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from soil_client import DEFAULT_SOIL, SoilClient
+
+
+class _SoilGridsStub(BaseHTTPRequestHandler):
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests += 1
+        time.sleep(server.delay)
+        if server.status != 200:
+            self.send_error(server.status)
+            return
+        body = json.dumps({'properties': {'ocd': {'values': [{'value': 12.5}]},
+                                          'phh2o': {'values': [{'value': 6.4}]}}}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), _SoilGridsStub)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.delay = 0.0
+    server.status = 200
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    server.url = f'http://127.0.0.1:{server.server_address[1]}/query'
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_and_cache_hit(stub):
+    client = SoilClient(base_url=stub.url)
+    assert client.get(20.301, 85.802) == (12.5, 6.4)
+    # same 0.01 degree cell: served from memory
+    assert client.get(20.3012, 85.8018) == (12.5, 6.4)
+    assert stub.requests == 1
+    assert client.stats['hits'] == 1 and client.stats['misses'] == 1
+
+
+def test_disk_cache_survives_a_new_client(stub, tmp_path):
+    path = str(tmp_path / 'soil.db')
+    assert SoilClient(base_url=stub.url, disk_cache=path).get(20.3, 85.8) == (12.5, 6.4)
+    client = SoilClient(base_url=stub.url, disk_cache=path)
+    assert client.get(20.3, 85.8) == (12.5, 6.4)
+    assert stub.requests == 1
+    assert client.stats['disk_hits'] == 1
+
+
+def test_concurrent_lookups_are_coalesced(stub):
+    stub.delay = 0.3
+    client = SoilClient(base_url=stub.url)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.get(20.3, 85.8))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [(12.5, 6.4)] * 8
+    assert stub.requests == 1
+    assert client.stats['coalesced'] == 7
+
+
+def test_get_many_requests_each_cell_once(stub):
+    client = SoilClient(base_url=stub.url)
+    points = [(20.3, 85.8), (20.3001, 85.8001), (21.0, 86.0), (20.3, 85.8)]
+    assert client.get_many(points) == [(12.5, 6.4)] * 4
+    assert stub.requests == 2
+
+
+def test_timeout_returns_defaults_uncached(stub):
+    stub.delay = 1.0
+    client = SoilClient(base_url=stub.url, timeout=(1.0, 0.2))
+    assert client.get(20.3, 85.8) == DEFAULT_SOIL
+    assert client.stats['errors'] == 1
+    stub.delay = 0.0
+    # the failure was not cached
+    assert client.get(20.3, 85.8) == (12.5, 6.4)
+
+
+def test_http_error_returns_defaults(stub):
+    stub.status = 503
+    client = SoilClient(base_url=stub.url)
+    assert client.get(20.3, 85.8) == DEFAULT_SOIL
+    assert client.stats['errors'] == 1
+
+
+@pytest.mark.parametrize('lat, lon', [('abc', 85.8), (None, 85.8), (float('nan'), 85.8), (95.0, 85.8),
+                                      (20.3, -181.0)])
+def test_bad_coordinates_return_defaults(stub, lat, lon):
+    client = SoilClient(base_url=stub.url)
+    assert client.get(lat, lon) == DEFAULT_SOIL
+    assert client.get_many([(lat, lon), (20.3, 85.8)]) == [DEFAULT_SOIL, (12.5, 6.4)]
+    assert stub.requests == 1
+    assert client.stats['errors'] == 2
+
+
+def test_disk_cache_failure_gives_everyone_defaults(stub, tmp_path):
+    stub.delay = 0.3
+    client = SoilClient(base_url=stub.url, disk_cache=str(tmp_path / 'soil.db'))
+
+    def broken(key, now):
+        time.sleep(0.3)  # long enough for the other lookups to wait on this one
+        raise OSError('disk I/O error')
+    client._disk_get = broken
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(client.get(20.3, 85.8))) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [DEFAULT_SOIL] * 4
+    assert client.stats['coalesced'] == 3
@@ -0,0 +1,71 @@
+# test_soil_tiles.py
+# SoilTileStore lookups and sampling on a small synthetic tile store.
+#
+#   python -m pytest -q test_soil_tiles.py
+
+import numpy as np
+import pytest
+
+from soil_tiles import SoilTileStore, build_tiles, synthetic_grid
+
+RES = 0.1
+
+
+@pytest.fixture
+def grid():
+    # 21 x 31 grid points over 4 x 4 tiles of 8 points
+    return synthetic_grid(20.0, 22.0, 85.0, 88.0, resolution=RES)
+
+
+@pytest.fixture
+def store(grid, tmp_path):
+    build_tiles(*grid, str(tmp_path), resolution=RES, tile_size=8)
+    return SoilTileStore(str(tmp_path))
+
+
+def test_lookup_at_grid_points_returns_the_built_values(grid, store):
+    lat, lon, values = grid
+    assert len(store.tiles) == 12
+    for k in (0, 7, 8, 200, len(lat) - 1):
+        assert store.lookup(lat[k], lon[k]) == pytest.approx((values[0, k], values[1, k]), rel=1e-5)
+
+
+def test_bilinear_between_grid_points(grid, store):
+    lat, lon, values = grid
+    # halfway between four grid points on a tile corner (indices 7/8 on both axes)
+    corners = [np.flatnonzero(np.isclose(lat, a) & np.isclose(lon, b))[0]
+               for a in (20.7, 20.8) for b in (85.7, 85.8)]
+    expected = values[:, corners].mean(axis=1)
+    assert store.lookup(20.75, 85.75) == pytest.approx(tuple(expected), rel=1e-5)
+    nearest = store.lookup(20.75 - 0.01, 85.75 - 0.01, method='nearest')
+    assert nearest == pytest.approx((values[0, corners[0]], values[1, corners[0]]), rel=1e-5)
+
+
+def test_sample_matches_lookup(store):
+    rng = np.random.default_rng(0)
+    lat, lon = rng.uniform(20.0, 22.0, 200), rng.uniform(85.0, 88.0, 200)
+    sampled = store.sample(lat, lon)
+    assert sampled.shape == (2, 200)
+    for k in range(200):
+        assert tuple(sampled[:, k]) == pytest.approx(store.lookup(lat[k], lon[k]), rel=1e-5)
+    nearest = store.sample(lat, lon, method='nearest')
+    for k in range(0, 200, 20):
+        assert tuple(nearest[:, k]) == pytest.approx(store.lookup(lat[k], lon[k], method='nearest'), rel=1e-5)
+
+
+def test_outside_the_tiles(store):
+    for lat, lon in [(19.5, 86.0), (23.0, 86.0), (21.0, 84.5), (21.0, 89.0)]:
+        assert store.lookup(lat, lon) is None
+    sampled = store.sample([19.5, 21.0], [86.0, 86.0])
+    assert np.isnan(sampled[:, 0]).all() and not np.isnan(sampled[:, 1]).any()
+    # the last grid row has no upper neighbour: bilinear falls back to the nearest point
+    assert store.lookup(22.0, 86.0) is not None
+
+
+def test_rebuild_leaves_an_open_store_intact(grid, store, tmp_path):
+    lat, lon, values = grid
+    before = store.lookup(21.0, 86.0)
+    build_tiles(lat, lon, values + 1.0, str(tmp_path), resolution=RES, tile_size=8)
+    assert not list(tmp_path.glob('*.tmp'))
+    assert store.lookup(21.0, 86.0) == before
+    assert SoilTileStore(str(tmp_path)).lookup(21.0, 86.0) == pytest.approx((before[0] + 1, before[1] + 1), rel=1e-5)
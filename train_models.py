@@ -0,0 +1,303 @@
+# train_models.py
+# One entry point for retraining every model ml_yield_predictor serves.
+#
+#   python train_models.py --csv training_data.csv --target yield_per_acre
+#   python train_models.py --dataset dataset_cache/<dir> --families lgb xgb --workers 4
+#
+# The training data goes through the dataset cache (only new rows are
+# encoded) and every trial runs in its own process from a pool, reading the
+# cached arrays memory-mapped. Each trial gets --threads-per-trial threads so
+# workers x threads never oversubscribes the machine. Boosters use early
+# stopping on a fixed validation split. The best trial of each family is
+# scored against the model already installed on the same split and moved
+# into place atomically under the file names model_registry loads only if it
+# is better (or with --force), so a running predictor hot-reloads it; all
+# trials are written to --report.
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import pickle
+import random
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from feature_encoder import ENCODER, SVM_FEATURES
+from model_registry import DEFAULT_MODELS
+
+# hyperparameter grids; a family's trials are drawn from its grid
+SEARCH_SPACE = {
+    'lgb': {'num_leaves': [15, 31, 63], 'learning_rate': [0.05, 0.1], 'min_data_in_leaf': [5, 20]},
+    'xgb': {'max_depth': [4, 6, 8], 'learning_rate': [0.05, 0.1], 'min_child_weight': [1, 5]},
+    'svm': {'C': [1.0, 10.0], 'epsilon': [0.05, 0.1]},
+    'svm_approx': {'kernel': ['nystroem', 'rff'], 'n_components': [500, 1000], 'alpha': [1e-6, 1e-5]},
+}
+MAX_ROUNDS = 2000
+EARLY_STOPPING_ROUNDS = 50
+# binning parameters of the cached lightgbm.Dataset shared by all lgb trials
+LGB_DATASET_PARAMS = {'verbosity': -1, 'max_bin': 255}
+
+
+def split_indices(n, val_fraction, seed):
+    """Deterministic train/validation row split, recomputed in every worker.
+
+    Row k's side depends only on k and the seed, so rows appended to the
+    dataset cache since the installed models were trained never move the
+    old rows between train and validation.
+    """
+    if n <= 1:
+        return np.arange(n), np.arange(0)
+    u = np.random.default_rng(seed).random(n)  # the same first values for any n
+    val = u < val_fraction
+    if not val.any():
+        val[np.argmin(u)] = True
+    if val.all():
+        val[np.argmax(u)] = False
+    return np.flatnonzero(~val), np.flatnonzero(val)
+
+
+def _peak_rss_bytes():
+    import resource
+    # ru_maxrss is in kilobytes on Linux; each trial runs in a fresh process
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _rmse(pred, y):
+    return float(np.sqrt(np.mean((np.asarray(pred, dtype=np.float64) - y) ** 2)))
+
+
+def _train_lgb(trial, X, y, train_idx, val_idx):
+    import lightgbm as lgb
+    from dataset_cache import saved_lgb_binary
+    # the saved binary only if it was built from these rows; otherwise bin X here
+    binary = saved_lgb_binary(trial['dataset'], len(y), LGB_DATASET_PARAMS)
+    full = lgb.Dataset(binary, params=LGB_DATASET_PARAMS) if binary is not None else \
+        lgb.Dataset(X, label=y, params=LGB_DATASET_PARAMS)
+    train_set = full.subset(train_idx)
+    val_set = full.subset(val_idx)
+    params = dict(LGB_DATASET_PARAMS, objective='regression', metric='rmse', seed=trial['seed'],
+                  num_threads=trial['threads'], **trial['params'])
+    booster = lgb.train(params, train_set, num_boost_round=MAX_ROUNDS, valid_sets=[val_set],
+                        callbacks=[lgb.early_stopping(EARLY_STOPPING_ROUNDS, verbose=False)])
+    best = booster.best_iteration or booster.current_iteration()
+    booster.save_model(trial['out'], num_iteration=best)
+    return booster.predict(X[val_idx], num_iteration=best), best
+
+
+def _train_xgb(trial, X, y, train_idx, val_idx):
+    import xgboost as xgb
+    model = xgb.XGBRegressor(objective='reg:squarederror', n_estimators=MAX_ROUNDS,
+                             early_stopping_rounds=EARLY_STOPPING_ROUNDS, n_jobs=trial['threads'],
+                             random_state=trial['seed'], **trial['params'])
+    model.fit(X[train_idx], y[train_idx], eval_set=[(X[val_idx], y[val_idx])], verbose=False)
+    best = model.best_iteration + 1
+    # keep only the trees up to the best round, so every loader (including
+    # tree_engine) predicts exactly what was validated
+    booster = model.get_booster()[:best]
+    booster.save_model(trial['out'])
+    return booster.inplace_predict(X[val_idx]), best
+
+
+def _train_svm(trial, X, y, train_idx, val_idx):
+    from sklearn.svm import SVR
+    # kernel SVR cost grows quadratically with rows: fit on a sample
+    rng = np.random.default_rng(trial['seed'])
+    if len(train_idx) > trial['svm_max_rows']:
+        train_idx = np.sort(rng.choice(train_idx, trial['svm_max_rows'], replace=False))
+    columns = len(SVM_FEATURES)
+    model = SVR(kernel='rbf', **trial['params'])
+    model.fit(X[train_idx, :columns], y[train_idx])
+    with open(trial['out'], 'wb') as f:
+        pickle.dump(model, f)
+    return model.predict(X[val_idx, :columns]), None
+
+
+def _train_svm_approx(trial, X, y, train_idx, val_idx):
+    from kernel_approx import ApproxKernelRegressor
+    # streams over all training rows in mini-batches; no sampling needed
+    columns = len(SVM_FEATURES)
+    model = ApproxKernelRegressor(random_state=trial['seed'], **trial['params'])
+    model.fit(X[train_idx, :columns], y[train_idx])
+    with open(trial['out'], 'wb') as f:
+        pickle.dump(model, f)
+    return model.predict(X[val_idx, :columns]), None
+
+
+TRAINERS = {'lgb': _train_lgb, 'xgb': _train_xgb, 'svm': _train_svm, 'svm_approx': _train_svm_approx}
+
+
+def _limit_threads(threads):
+    # covers OpenMP/BLAS libraries loaded after this point (lightgbm, xgboost, sklearn's);
+    # numpy's BLAS is already running by now and is capped in run_trial
+    for var in ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS'):
+        os.environ[var] = str(threads)
+
+
+def run_trial(trial):
+    """Train one model configuration in this (worker) process and report on it."""
+    from threadpoolctl import threadpool_limits
+    from dataset_cache import load_dir
+    start = time.perf_counter()
+    X, y = load_dir(trial['dataset'])
+    train_idx, val_idx = split_indices(len(y), trial['val_fraction'], trial['seed'])
+    # the spawned worker imported numpy (this module) before _limit_threads ran,
+    # so its BLAS pool has to be resized at runtime
+    with threadpool_limits(limits=trial['threads']):
+        pred, rounds = TRAINERS[trial['family']](trial, X, y, train_idx, val_idx)
+    return {
+        'family': trial['family'],
+        'trial': trial['trial'],
+        'params': trial['params'],
+        'val_rmse': _rmse(pred, y[val_idx]),
+        'rounds': rounds,
+        'wall_seconds': round(time.perf_counter() - start, 3),
+        'peak_rss_bytes': _peak_rss_bytes(),
+        'threads': trial['threads'],
+        'artifact': trial['out'],
+    }
+
+
+def installed_rmse(family, path, dataset, val_fraction, seed):
+    """Validation RMSE of the model installed at `path` on the trials' split; None if there is none to compare."""
+    if not os.path.exists(path):
+        return None
+    from dataset_cache import load_dir
+    from feature_encoder import model_columns
+    X, y = load_dir(dataset)
+    _, val_idx = split_indices(len(y), val_fraction, seed)
+    try:
+        model = DEFAULT_MODELS[family][1](path)
+        return _rmse(model.predict(model_columns(model, X[val_idx])), y[val_idx])
+    except Exception as e:
+        # e.g. trained on a different feature schema
+        print(f"Could not score the installed {family} model {path}: {e}")
+        return None
+
+
+def make_trials(families, max_trials, seed):
+    trials = []
+    for family in families:
+        space = SEARCH_SPACE[family]
+        grid = [dict(zip(space, values)) for values in itertools.product(*space.values())]
+        random.Random(seed).shuffle(grid)
+        for k, params in enumerate(grid[:max_trials]):
+            trials.append({'family': family, 'trial': k, 'params': params})
+    return trials
+
+
+def install(src, dest):
+    """Move a finished artifact into place; readers see the old or the new file, never a partial one."""
+    tmp = dest + '.tmp'
+    shutil.copyfile(src, tmp)
+    with open(tmp, 'rb') as f:
+        os.fsync(f.fileno())
+    os.replace(tmp, dest)
+
+
+def load_dataset(args):
+    from dataset_cache import CSVCache, refresh_lgb_binary
+    if args.dataset:
+        if 'lgb' in args.families:
+            refresh_lgb_binary(args.dataset, LGB_DATASET_PARAMS)
+        return args.dataset
+    cache = CSVCache(args.csv, target=args.target)
+    X, _ = cache.refresh()
+    print(f"Dataset cache {cache.path}: {cache.rows} rows")
+    if 'lgb' in args.families and len(X):
+        cache.lgb_dataset(LGB_DATASET_PARAMS)
+    return cache.path
+
+
+def main():
+    cpus = multiprocessing.cpu_count()
+    parser = argparse.ArgumentParser(description='Train the yield models with a parallel hyperparameter search')
+    parser.add_argument('--csv', default='training_data.csv')
+    parser.add_argument('--target', default='yield_per_acre')
+    parser.add_argument('--dataset', help='existing dataset_cache directory to train on instead of --csv')
+    parser.add_argument('--families', nargs='+', choices=sorted(SEARCH_SPACE), default=sorted(SEARCH_SPACE))
+    parser.add_argument('--max-trials', type=int, default=4, help='trials per family')
+    parser.add_argument('--workers', type=int, default=0, help='parallel trials (default: all CPUs)')
+    parser.add_argument('--threads-per-trial', type=int, default=0,
+                        help='threads each trial may use (default: CPUs / workers)')
+    parser.add_argument('--val-fraction', type=float, default=0.2)
+    parser.add_argument('--svm-max-rows', type=int, default=20000)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out-dir', default='.', help='where the winning models are installed')
+    parser.add_argument('--report', default='training_report.json')
+    parser.add_argument('--force', action='store_true',
+                        help='install the best trials even if the installed models score better')
+    args = parser.parse_args()
+
+    dataset = load_dataset(args)
+    trials = make_trials(args.families, args.max_trials, args.seed)
+    workers = args.workers or min(cpus, len(trials))
+    threads = args.threads_per_trial or max(1, cpus // workers)
+    staging = os.path.join(args.out_dir, f'.training-{os.getpid()}')
+    os.makedirs(staging, exist_ok=True)
+    for trial in trials:
+        ext = os.path.splitext(DEFAULT_MODELS[trial['family']][0])[1]
+        trial.update(dataset=dataset, seed=args.seed, val_fraction=args.val_fraction, threads=threads,
+                     svm_max_rows=args.svm_max_rows,
+                     out=os.path.join(staging, f"{trial['family']}-{trial['trial']}{ext}"))
+
+    print(f"Running {len(trials)} trials on {workers} workers x {threads} threads ({dataset})")
+    results, failures = [], []
+    # fresh spawned process per trial: no inherited OpenMP state, and
+    # ru_maxrss measures that trial alone
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_limit_threads, initargs=(threads,), max_tasks_per_child=1) as pool:
+        futures = {pool.submit(run_trial, trial): trial for trial in trials}
+        for future in as_completed(futures):
+            trial = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                failures.append({'family': trial['family'], 'trial': trial['trial'],
+                                 'params': trial['params'], 'error': str(e)})
+                print(f"{trial['family']} trial {trial['trial']} failed: {e}")
+                continue
+            results.append(result)
+            print(f"{result['family']:<4} trial {result['trial']}: rmse={result['val_rmse']:.4f} "
+                  f"rounds={result['rounds']} {result['wall_seconds']:.1f}s "
+                  f"peak={result['peak_rss_bytes'] / 2**20:.0f}MiB {result['params']}")
+
+    winners = {}
+    for result in results:
+        best = winners.get(result['family'])
+        if best is None or result['val_rmse'] < best['val_rmse']:
+            winners[result['family']] = result
+    installed = 0
+    for family, result in sorted(winners.items()):
+        dest = os.path.join(args.out_dir, DEFAULT_MODELS[family][0])
+        baseline = installed_rmse(family, dest, dataset, args.val_fraction, args.seed)
+        result['installed_rmse'] = baseline
+        if baseline is not None and result['val_rmse'] >= baseline and not args.force:
+            print(f"Kept the installed {family} model: rmse {baseline:.4f} <= trial {result['trial']} "
+                  f"{result['val_rmse']:.4f} (--force installs it anyway)")
+            continue
+        install(result['artifact'], dest)
+        result['installed'] = dest
+        installed += 1
+        print(f"Installed {family} trial {result['trial']} (rmse {result['val_rmse']:.4f}"
+              f"{'' if baseline is None else f', was {baseline:.4f}'}) as {dest}")
+    for result in results:
+        del result['artifact']  # staging files are removed below
+    if installed:
+        ENCODER.save_schema(os.path.join(args.out_dir, 'feature_schema.json'))
+    shutil.rmtree(staging, ignore_errors=True)
+
+    with open(args.report, 'w') as f:
+        json.dump({'dataset': dataset, 'workers': workers, 'threads_per_trial': threads,
+                   'trials': sorted(results, key=lambda r: (r['family'], r['val_rmse'])),
+                   'failures': failures}, f, indent=2)
+    if failures and not winners:
+        raise SystemExit('all trials failed')
+
+
+if __name__ == '__main__':
+    main()
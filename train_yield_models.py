@@ -5,6 +5,8 @@ import pandas as pd
 import numpy as np
 import lightgbm as lgb
 import pickle
+from dataset_cache import CSVCache
+from feature_encoder import ENCODER, SVM_FEATURES
 
 # Example: Load your training data
 # Columns: soil_type, crop_type, irrigation_type, acres, temp, humidity, rainfall, oc, ph, yield
@@ -13,46 +15,22 @@ import pickle
 
 # For demo, create synthetic data
 
-df = pd.read_csv('training_data.csv')
-
-# Feature encoding maps
-soil_map = {'loamy':0,'sandy':1,'clay':2,'silt':3,'peat':4,'chalk':5,'red':6,'laterite':7,'black':8,'alluvial':9,'saline':10,'peaty':11,'mixed':12,
-    'vertisol':13,'luvisol':14,'gleysol':15,'regosol':16,'arenosol':17,'cambisol':18,'fluvisol':19,'podzol':20,'umbrisol':21,'unknown':0}
-crop_map = {
-    'wheat': 0, 'rice': 1, 'cotton': 2, 'vegetables': 3, 'pulses': 4,
-    'peanuts': 5, 'watermelon': 6, 'potatoes': 7, 'carrots': 8, 'cantaloupe': 9,
-    'soybean': 10, 'broccoli': 11, 'cabbage': 12, 'tomatoes': 13, 'onions': 14,
-    'garlic': 15, 'peppers': 16, 'lettuce': 17, 'celery': 18, 'barley': 19,
-    'beet': 20, 'spinach': 21, 'millets': 22, 'groundnut': 23, 'cashew': 24,
-    'pineapple': 25, 'tea': 26, 'coffee': 27, 'sunflower': 28, 'jute': 29,
-    'sugarcane': 30, 'sugar beet': 31
-}
-irrigation_map = {'drip':0,'sprinkler':1,'canal':2,'none':3}
-
-def encode_row(row):
-    return [
-        soil_map.get(str(row['soil_type']).lower(), 0),
-        crop_map.get(str(row['crop_type']).lower(), 0),
-        irrigation_map.get(str(row['irrigation_type']).lower(), 0),
-        float(row['acres']),
-        float(row.get('lat', 20.3)),
-        float(row.get('lon', 85.8)),
-        28.5, # temp
-        65.0, # humidity
-        150.0 # rainfall
-    ]
-
-X = np.array([encode_row(row) for _, row in df.iterrows()])
-y = df['yield_per_acre'].values
+# Encode with the shared FeatureEncoder so column order matches serving;
+# columns missing from the CSV (temp, humidity, rainfall, oc, ph) use its
+# defaults. The encoded rows are cached (memory-mapped) under DATASET_CACHE_DIR
+# and only lines appended to the CSV since the last run are re-encoded.
+cache = CSVCache('training_data.csv', target='yield_per_acre')
+X, y = cache.refresh()
+ENCODER.save_schema('feature_schema.json')
 
 # Train LightGBM model
-lgb_train = lgb.Dataset(X, label=y)
 params = {
     'objective': 'regression',
     'metric': 'rmse',
     'verbosity': -1,
     'seed': 42
 }
+lgb_train = cache.lgb_dataset(params)
 lgb_model = lgb.train(params, lgb_train, num_boost_round=100)
 lgb_model.save_model('lgb_yield_model.txt')
 
@@ -69,9 +47,16 @@ xgb_model.save_model('xgb_yield_model.json')
 
 # Train SVM model
 from sklearn.svm import SVR
+# ml_yield_predictor feeds the SVM the SVM_FEATURES columns only
 svm_model = SVR()
-svm_model.fit(X, y)
+svm_model.fit(X[:, :len(SVM_FEATURES)], y)
 with open('svm_yield_model.pkl', 'wb') as f:
     pickle.dump(svm_model, f)
 
+# Approximate-kernel alternative (served with SVM_BACKEND=approx)
+from kernel_approx import ApproxKernelRegressor
+svm_approx = ApproxKernelRegressor().fit(X[:, :len(SVM_FEATURES)], y)
+with open('svm_approx_model.pkl', 'wb') as f:
+    pickle.dump(svm_approx, f)
+
 print('Models retrained and saved with crop-specific yields.')
@@ -5,6 +5,8 @@ import pymysql
 import numpy as np
 import lightgbm as lgb
 from sklearn.model_selection import train_test_split
+from feature_encoder import ENCODER
+from dataset_cache import SQLCache
 
 # MySQL connection details (default)
 host = 'localhost'
@@ -13,44 +15,31 @@ db = 'agri_db'
 table = 'yield_data'
 user = 'root'
 password = ''  # Set your password if needed
+key_column = 'id'  # increasing key or timestamp column, used to fetch only new rows
 
 # Connect to MySQL
 conn = pymysql.connect(host=host, port=port, user=user, password=password, database=db)
-cursor = conn.cursor()
 
-# Query all training data
-query = f"SELECT soil_type, crop_type, irrigation_type, acres, temp, humidity, rainfall, oc, ph, yield FROM {table}"
-cursor.execute(query)
-data = cursor.fetchall()
+# Stream the training data through a server-side cursor and encode each batch
+# with the shared FeatureEncoder (accepts category names or stored integer
+# codes). Encoded rows are cached under DATASET_CACHE_DIR, so later runs only
+# fetch rows whose key_column is past the last one seen.
+cache = SQLCache(conn, table, key_column, source=f'mysql://{host}:{port}/{db}.{table}')
+X, y = cache.refresh()
+ENCODER.save_schema('feature_schema.json')
 
-# Convert to numpy arrays
-soil_type, crop_type, irrigation_type, acres, temp, humidity, rainfall, oc, ph, yield_ = zip(*data)
-soil_type = np.array(soil_type)
-crop_type = np.array(crop_type)
-irrigation_type = np.array(irrigation_type)
-acres = np.array(acres)
-temp = np.array(temp)
-humidity = np.array(humidity)
-rainfall = np.array(rainfall)
-oc = np.array(oc)
-ph = np.array(ph)
-yield_ = np.array(yield_)
-
-# Stack features
-X = np.column_stack([soil_type, crop_type, irrigation_type, acres, temp, humidity, rainfall, oc, ph])
-y = yield_
-
-# Train/test split (optional)
-X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.1, random_state=42)
+# Train/test split (optional); split row indices so X is never copied
+train_idx, test_idx = train_test_split(np.arange(len(y)), test_size=0.1, random_state=42)
 
 # Train LightGBM model
-lgb_train = lgb.Dataset(X_train, label=y_train)
 params = {
     'objective': 'regression',
     'metric': 'rmse',
     'verbosity': -1,
     'seed': 42
 }
+# binned LightGBM Dataset, saved next to the cache and reused while unchanged
+lgb_train = cache.lgb_dataset(params).subset(np.sort(train_idx))
 lgb_model = lgb.train(params, lgb_train, num_boost_round=100)
 lgb_model.save_model('lgb_yield_model.txt')
 
@@ -0,0 +1,233 @@
+# tree_engine.py
+# Minimal inference engine for the LightGBM / XGBoost regression models.
+# Parses lgb_yield_model.txt and xgb_yield_model.json into flat NumPy node
+# arrays and predicts by walking every tree for every row at once. It does
+# not import lightgbm or xgboost, and avoids their per-call overhead
+# (input validation, DMatrix construction, thread pools) on small batches.
+
+import json
+
+import numpy as np
+
+# LightGBM decision_type bit layout
+_LGB_CATEGORICAL = 1
+_LGB_DEFAULT_LEFT = 2
+_LGB_MISSING_SHIFT = 2  # bits 2-3: 0 = None, 1 = Zero, 2 = NaN
+_MISSING_NONE, _MISSING_ZERO, _MISSING_NAN = 0, 1, 2
+_ZERO_THRESHOLD = 1e-35
+# rows evaluated together; keeps the (rows x trees) work arrays small
+CHUNK_ROWS = 1024
+
+
+class TreeEnsemble:
+    """A sum of binary regression trees stored as flat node arrays.
+
+    Leaves point back to themselves, so after `depth` steps every row sits on
+    its leaf in every tree. Splits send a row left when x <= threshold
+    (LightGBM) or x < threshold (XGBoost); rows with missing values follow
+    default_left.
+    """
+
+    def __init__(self, feature, threshold, left, right, value, default_left, missing,
+                 roots, depth, num_features, base_score=0.0, strict=False, dtype=np.float64):
+        self.feature = np.asarray(feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=dtype)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.default_left = np.asarray(default_left, dtype=bool)
+        self.missing = np.asarray(missing, dtype=np.int8)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.depth = int(depth)
+        self.num_features = int(num_features)
+        self.base_score = float(base_score)
+        self.strict = strict
+        self.dtype = dtype
+        self._any_zero_missing = bool((self.missing == _MISSING_ZERO).any())
+        self.children = np.column_stack([self.left, self.right]).ravel()
+
+    @property
+    def num_trees(self):
+        return len(self.roots)
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=self.dtype)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.num_features:
+            raise ValueError(f'Feature shape mismatch, expected: {self.num_features}, got {X.shape[1]}')
+        if X.shape[0] <= CHUNK_ROWS:
+            return self._predict_chunk(X)
+        # (rows x trees) work arrays stay cache-sized when processed in blocks
+        return np.concatenate([self._predict_chunk(X[i:i + CHUNK_ROWS])
+                               for i in range(0, X.shape[0], CHUNK_ROWS)])
+
+    def _predict_chunk(self, X):
+        n = X.shape[0]
+        X = np.ascontiguousarray(X)
+        flat = X.ravel()
+        row_offset = (np.arange(n, dtype=np.int64) * X.shape[1])[:, None]
+        nodes = np.tile(self.roots, (n, 1))
+        has_nan = bool(np.isnan(flat).any())
+        for _ in range(self.depth):
+            x = flat.take(row_offset + self.feature.take(nodes))
+            thr = self.threshold.take(nodes)
+            go_right = x >= thr if self.strict else x > thr
+            if has_nan or self._any_zero_missing:
+                missing = self.missing.take(nodes)
+                is_nan = np.isnan(x)
+                if not self.strict:
+                    # LightGBM: NaN counts as 0.0 unless the split tracks NaN
+                    nan_as_zero = is_nan & (missing != _MISSING_NAN)
+                    go_right = np.where(nan_as_zero, 0.0 > thr, go_right)
+                    use_default = ((missing == _MISSING_ZERO) & ((np.abs(x) <= _ZERO_THRESHOLD) | nan_as_zero)) | \
+                                  ((missing == _MISSING_NAN) & is_nan)
+                else:
+                    use_default = is_nan
+                go_right = np.where(use_default, ~self.default_left.take(nodes), go_right)
+            # children[2 * node] is the left child, children[2 * node + 1] the right one
+            nodes = self.children.take(2 * nodes + go_right)
+        # accumulate tree outputs in order and in the library's precision
+        # (float32 for XGBoost), starting from the base score, like the native code
+        leaves = np.empty((n, self.num_trees + 1), dtype=self.dtype)
+        leaves[:, 0] = self.base_score
+        leaves[:, 1:] = self.value.take(nodes)
+        return np.cumsum(leaves, axis=1, dtype=self.dtype)[:, -1]
+
+
+class _Builder:
+    def __init__(self):
+        self.feature, self.threshold, self.left, self.right = [], [], [], []
+        self.value, self.default_left, self.missing, self.roots = [], [], [], []
+        self.depth = 0
+
+    def add_tree(self, internal, leaves, root):
+        """internal: list of (feature, threshold, left, right, default_left, missing) with
+        children as ('n', i) or ('l', j); leaves: list of leaf values; root likewise."""
+        offset = len(self.feature)
+        leaf_offset = offset + len(internal)
+
+        def resolve(child):
+            kind, k = child
+            return offset + k if kind == 'n' else leaf_offset + k
+
+        for feat, thr, l, r, dl, miss in internal:
+            self.feature.append(feat)
+            self.threshold.append(thr)
+            self.left.append(resolve(l))
+            self.right.append(resolve(r))
+            self.value.append(0.0)
+            self.default_left.append(dl)
+            self.missing.append(miss)
+        for k, v in enumerate(leaves):
+            idx = leaf_offset + k
+            self.feature.append(0)
+            self.threshold.append(0.0)
+            self.left.append(idx)
+            self.right.append(idx)
+            self.value.append(v)
+            self.default_left.append(False)
+            self.missing.append(_MISSING_NONE)
+        self.roots.append(resolve(root))
+        self.depth = max(self.depth, _tree_depth(internal, root))
+
+
+def _tree_depth(internal, root):
+    depth, stack = 0, [(root, 0)]
+    while stack:
+        (kind, k), d = stack.pop()
+        if kind == 'l':
+            depth = max(depth, d)
+        else:
+            stack.append((internal[k][2], d + 1))
+            stack.append((internal[k][3], d + 1))
+    return depth
+
+
+def load_lgb_model(path):
+    """Parse a LightGBM text model (numerical splits, single-output regression)."""
+    with open(path) as f:
+        text = f.read()
+    header, _, body = text.partition('\nTree=')
+    meta = dict(line.split('=', 1) for line in header.splitlines() if '=' in line)
+    if int(meta.get('num_class', 1)) != 1:
+        raise ValueError('Only single-output LightGBM models are supported')
+    objective = meta.get('objective', 'regression').split()[0]
+    if objective not in ('regression', 'regression_l1', 'huber', 'fair', 'quantile', 'mape'):
+        raise ValueError(f'Unsupported LightGBM objective: {objective}')
+    num_features = int(meta['max_feature_idx']) + 1
+    body = body.split('end of trees')[0]
+    builder = _Builder()
+    for block in body.split('\nTree='):
+        fields = dict(line.split('=', 1) for line in block.strip().splitlines() if '=' in line)
+        if 'num_leaves' not in fields:
+            continue
+        if int(fields.get('num_cat', 0)) > 0:
+            raise ValueError('Categorical splits are not supported by the compiled engine')
+        leaves = [float(v) for v in fields['leaf_value'].split()]
+        if int(fields['num_leaves']) == 1:
+            # single-leaf tree: a constant
+            builder.add_tree([], leaves, ('l', 0))
+            continue
+
+        def child(c):
+            c = int(c)
+            return ('l', ~c) if c < 0 else ('n', c)
+
+        internal = []
+        for feat, thr, dt, l, r in zip(fields['split_feature'].split(), fields['threshold'].split(),
+                                       fields['decision_type'].split(), fields['left_child'].split(),
+                                       fields['right_child'].split()):
+            dt = int(dt)
+            if dt & _LGB_CATEGORICAL:
+                raise ValueError('Categorical splits are not supported by the compiled engine')
+            internal.append((int(feat), float(thr), child(l), child(r),
+                             bool(dt & _LGB_DEFAULT_LEFT), (dt >> _LGB_MISSING_SHIFT) & 3))
+        builder.add_tree(internal, leaves, ('n', 0))
+    return TreeEnsemble(builder.feature, builder.threshold, builder.left, builder.right,
+                        builder.value, builder.default_left, builder.missing, builder.roots,
+                        builder.depth, num_features)
+
+
+def _parse_base_score(raw):
+    return float(str(raw).strip('[]').split(',')[0])
+
+
+def load_xgb_model(path):
+    """Parse an XGBoost JSON model (gbtree, reg:squarederror-style identity link)."""
+    with open(path) as f:
+        learner = json.load(f)['learner']
+    objective = learner['objective']['name']
+    if objective not in ('reg:squarederror', 'reg:linear', 'reg:absoluteerror', 'reg:pseudohubererror'):
+        raise ValueError(f'Unsupported XGBoost objective: {objective}')
+    booster = learner['gradient_booster']
+    if booster.get('name', 'gbtree') != 'gbtree':
+        raise ValueError('Only gbtree XGBoost models are supported')
+    params = learner['learner_model_param']
+    builder = _Builder()
+    for tree in booster['model']['trees']:
+        if any(tree.get('split_type', [])):
+            raise ValueError('Categorical splits are not supported by the compiled engine')
+        lc, rc = tree['left_children'], tree['right_children']
+        # renumber: internal nodes first, then leaves, preserving order
+        internal_ids, leaf_ids = {}, {}
+        for node in range(len(lc)):
+            if lc[node] == -1:
+                leaf_ids[node] = len(leaf_ids)
+            else:
+                internal_ids[node] = len(internal_ids)
+
+        def child(c):
+            return ('l', leaf_ids[c]) if c in leaf_ids else ('n', internal_ids[c])
+
+        internal = [(tree['split_indices'][node], tree['split_conditions'][node], child(lc[node]),
+                     child(rc[node]), bool(tree['default_left'][node]), _MISSING_NAN)
+                    for node in internal_ids]
+        leaves = [tree['split_conditions'][node] for node in leaf_ids]
+        builder.add_tree(internal, leaves, child(0))
+    # XGBoost compares in float32
+    return TreeEnsemble(builder.feature, np.float32(builder.threshold), builder.left, builder.right,
+                        builder.value, builder.default_left, builder.missing, builder.roots,
+                        builder.depth, int(params['num_feature']),
+                        base_score=_parse_base_score(params['base_score']), strict=True,
+                        dtype=np.float32)
@@ -1,18 +1,40 @@
+import hmac
+import json
+import logging
+import os
+import shutil
 import sqlite3
-from flask import Flask, request, jsonify, session
-from werkzeug.security import generate_password_hash, check_password_hash
+import tempfile
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, Response, request, jsonify, session
 from flask_cors import CORS
 from datetime import timedelta
+from auth_tokens import TokenSigner, UserCache
+from password_hasher import HasherBusy, hasher_from_env
+from sqlite_pool import SQLitePool
+from user_import import export_users, import_users, read_users
 
 app = Flask(__name__)
-app.secret_key = 'your_secret_key_here'  # Change this in production
+# Every instance must share the key: it signs cookie sessions and bearer tokens
+app.secret_key = os.environ.get('AUTH_SECRET_KEY', 'your_secret_key_here')  # Change this in production
 CORS(app)
 
-# SQLite DB setup (users.db)
+# SQLite DB setup (users.db): one WAL-mode connection per thread, reused
+# across requests
+pool = SQLitePool(os.environ.get('AUTH_DB_PATH', 'users.db'),
+                  busy_timeout=float(os.environ.get('AUTH_DB_BUSY_TIMEOUT', 5.0)))
+
+# statements are cached per connection by their SQL text
+SQL_INSERT_USER = 'INSERT INTO users (username, password_hash, email) VALUES (?, ?, ?)'
+SQL_USER_BY_NAME = 'SELECT id, username, email, created_at, password_hash FROM users WHERE username = ?'
+SQL_UPDATE_HASH = 'UPDATE users SET password_hash = ? WHERE id = ? AND password_hash = ?'
+SQL_USER_BY_ID = 'SELECT id, username, email, created_at FROM users WHERE id = ?'
+SQL_UPDATE_EMAIL = 'UPDATE users SET email = ? WHERE id = ?'
+
 def get_db():
-    conn = sqlite3.connect('users.db')
-    conn.row_factory = sqlite3.Row
-    return conn
+    # use as `with get_db() as db:` - commits or rolls back, never closes
+    return pool.connection()
 
 def init_db():
     with get_db() as db:
@@ -25,7 +47,78 @@ def init_db():
                 created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
-        db.commit()
+        # username and email lookups use the indexes of their UNIQUE constraints;
+        # exports and "since" queries scan by creation time
+        db.execute('CREATE INDEX IF NOT EXISTS idx_users_created_at ON users (created_at)')
+        # bulk imports run in the background; any worker can report on them
+        db.execute('''
+            CREATE TABLE IF NOT EXISTS import_jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                stats TEXT,
+                problems TEXT,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                finished_at TIMESTAMP
+            )
+        ''')
+    # serve.py runs this before forking workers: don't leave a connection to inherit
+    pool.close_all()
+
+# AUTH_HASH_ALGORITHM / AUTH_HASH_ITERATIONS set the policy for new hashes;
+# hashing runs on AUTH_HASH_WORKERS threads with AUTH_HASH_MAX_QUEUE waiting
+hasher = hasher_from_env()
+
+def _busy():
+    response = jsonify({'error': 'Server busy, retry later'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
+# /login returns a signed token carrying the profile, so /me with
+# "Authorization: Bearer <token>" needs no database access; cookie sessions
+# read the profile through user_cache
+tokens = TokenSigner(app.secret_key, max_age=int(os.environ.get('AUTH_TOKEN_MAX_AGE', 900)))
+user_cache = UserCache(max_entries=int(os.environ.get('AUTH_USER_CACHE_SIZE', 10000)),
+                       ttl=float(os.environ.get('AUTH_USER_CACHE_TTL', 60)))
+
+def load_user(user_id):
+    """Profile dict of a user id, from user_cache or the database; None if there is no such user."""
+    profile = user_cache.get(user_id)
+    if profile is None:
+        with get_db() as db:
+            user = db.execute(SQL_USER_BY_ID, (user_id,)).fetchone()
+        if user is None:
+            return None
+        profile = dict(user)
+        user_cache.put(user_id, profile)
+    return profile
+
+def invalidate_user(user_id):
+    # call after every change to a user row; other workers see it after their cache TTL
+    user_cache.invalidate(user_id)
+
+def _token_payload(profile):
+    return {'token': tokens.issue(profile), 'token_type': 'Bearer', 'expires_in': tokens.max_age}
+
+def _authenticated_user_id():
+    """(user id, profile from a fresh token or None); (None, None) when not logged in."""
+    header = request.headers.get('Authorization', '')
+    if header.startswith('Bearer '):
+        profile, issued_at = tokens.verify(header[7:].strip())
+        if profile is None:
+            return None, None
+        if user_cache.is_stale(profile['id'], issued_at):
+            return profile['id'], None
+        return profile['id'], profile
+    return session.get('user_id'), None
+
+# create the schema when the app is created, not only under __main__
+init_db()
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({'status': 'ok', 'db': pool.stats(), 'password_hashing': hasher.stats(),
+                    'user_cache': user_cache.stats()})
 
 @app.route('/register', methods=['POST'])
 def register():
@@ -35,12 +128,13 @@ def register():
     email = data.get('email')
     if not username or not password:
         return jsonify({'error': 'Username and password required'}), 400
-    pw_hash = generate_password_hash(password)
+    try:
+        pw_hash = hasher.hash(password)
+    except HasherBusy:
+        return _busy()
     try:
         with get_db() as db:
-            db.execute('INSERT INTO users (username, password_hash, email) VALUES (?, ?, ?)',
-                       (username, pw_hash, email))
-            db.commit()
+            db.execute(SQL_INSERT_USER, (username, pw_hash, email))
         return jsonify({'message': 'User registered successfully'})
     except sqlite3.IntegrityError:
         return jsonify({'error': 'Username or email already exists'}), 409
@@ -53,14 +147,24 @@ def login():
     if not username or not password:
         return jsonify({'error': 'Username and password required'}), 400
     with get_db() as db:
-        user = db.execute('SELECT * FROM users WHERE username = ?', (username,)).fetchone()
-        if user and check_password_hash(user['password_hash'], password):
-            session['user_id'] = user['id']
-            session.permanent = True
-            app.permanent_session_lifetime = timedelta(days=7)
-            return jsonify({'message': 'Login successful'})
-        else:
-            return jsonify({'error': 'Invalid username or password'}), 401
+        user = db.execute(SQL_USER_BY_NAME, (username,)).fetchone()
+    try:
+        ok, new_hash = hasher.verify(user['password_hash'] if user else None, password)
+    except HasherBusy:
+        return _busy()
+    if ok:
+        if new_hash is not None:
+            # hashed under an older policy; skipped if the password changed meanwhile
+            with get_db() as db:
+                db.execute(SQL_UPDATE_HASH, (new_hash, user['id'], user['password_hash']))
+        session['user_id'] = user['id']
+        session.permanent = True
+        app.permanent_session_lifetime = timedelta(days=7)
+        profile = {field: user[field] for field in ('id', 'username', 'email', 'created_at')}
+        user_cache.put(user['id'], profile)
+        return jsonify({'message': 'Login successful', **_token_payload(profile)})
+    else:
+        return jsonify({'error': 'Invalid username or password'}), 401
 
 @app.route('/logout', methods=['POST'])
 def logout():
@@ -69,16 +173,138 @@ def logout():
 
 @app.route('/me', methods=['GET'])
 def me():
-    user_id = session.get('user_id')
+    user_id, profile = _authenticated_user_id()
     if not user_id:
         return jsonify({'error': 'Not logged in'}), 401
-    with get_db() as db:
-        user = db.execute('SELECT id, username, email, created_at FROM users WHERE id = ?', (user_id,)).fetchone()
-        if user:
-            return jsonify(dict(user))
-        else:
+    if profile is None:
+        profile = load_user(user_id)
+        if profile is None:
             return jsonify({'error': 'User not found'}), 404
+    return jsonify(profile)
+
+@app.route('/me', methods=['PUT'])
+def update_me():
+    user_id, _ = _authenticated_user_id()
+    if not user_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    data = request.get_json()
+    if not isinstance(data, dict) or 'email' not in data:
+        return jsonify({'error': 'email required'}), 400
+    try:
+        with get_db() as db:
+            updated = db.execute(SQL_UPDATE_EMAIL, (data['email'], user_id)).rowcount
+    except sqlite3.IntegrityError:
+        return jsonify({'error': 'Email already exists'}), 409
+    invalidate_user(user_id)
+    profile = load_user(user_id) if updated else None
+    if profile is None:
+        return jsonify({'error': 'User not found'}), 404
+    # tokens issued before the update are stale; hand out a fresh one
+    return jsonify({**profile, **_token_payload(profile)})
+
+@app.route('/token', methods=['POST'])
+def refresh_token():
+    """A new token for the logged-in user (cookie session or a still valid token)."""
+    user_id, _ = _authenticated_user_id()
+    if not user_id:
+        return jsonify({'error': 'Not logged in'}), 401
+    profile = load_user(user_id)
+    if profile is None:
+        return jsonify({'error': 'User not found'}), 404
+    return jsonify(_token_payload(profile))
+
+def _is_admin():
+    # bulk endpoints are disabled unless AUTH_ADMIN_TOKEN is set
+    expected = os.environ.get('AUTH_ADMIN_TOKEN')
+    given = request.headers.get('X-Admin-Token', '')
+    return bool(expected) and hmac.compare_digest(given.encode(), expected.encode())
+
+IMPORT_FORMATS = {'text/csv': 'csv', 'application/json': 'json', 'application/x-ndjson': 'jsonl'}
+# at most this many rejected rows are kept per job; stats['rejected'] counts all
+IMPORT_MAX_PROBLEMS = int(os.environ.get('AUTH_IMPORT_MAX_PROBLEMS', 10000))
+
+# one import at a time per worker process, off the request threads; its
+# thread starts on the first submit, so forked workers don't inherit one.
+# A job whose worker is restarted mid-import stays 'running'.
+import_jobs = ThreadPoolExecutor(max_workers=1, thread_name_prefix='user-import')
+
+def _update_job(job_id, status, stats=None, problems=None, error=None):
+    with get_db() as db:
+        db.execute('UPDATE import_jobs SET status = ?, stats = COALESCE(?, stats), problems = COALESCE(?, problems), '
+                   "error = ?, finished_at = CASE WHEN ? IN ('done', 'failed') THEN CURRENT_TIMESTAMP END WHERE id = ?",
+                   (status, None if stats is None else json.dumps(stats),
+                    None if problems is None else json.dumps(problems), error, status, job_id))
+
+def _run_import(job_id, path, fmt):
+    problems = []
+    stats = None
+
+    def on_problem(problem):
+        if len(problems) < IMPORT_MAX_PROBLEMS:
+            problems.append(problem)
+
+    def on_batch(batch_stats):
+        _update_job(job_id, 'running', batch_stats)
+
+    try:
+        _update_job(job_id, 'running')
+        with open(path, encoding='utf-8', newline='') as body:
+            stats = import_users(get_db(), read_users(body, fmt), hasher.method,
+                                 workers=int(os.environ.get('AUTH_IMPORT_WORKERS', 0)) or None,
+                                 on_problem=on_problem, on_batch=on_batch)
+        _update_job(job_id, 'done', stats, problems)
+    except (ValueError, UnicodeDecodeError) as e:
+        _update_job(job_id, 'failed', stats, problems, f'Could not parse input: {e}')
+    except Exception as e:
+        logging.exception("User import %s failed", job_id)
+        _update_job(job_id, 'failed', stats, problems, str(e))
+    finally:
+        os.remove(path)
+
+@app.route('/users/import', methods=['POST'])
+def bulk_import():
+    """Queue an import of a CSV / JSON / JSON-lines body; poll GET /users/import/<job> for the result."""
+    if not _is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    fmt = request.args.get('format') or IMPORT_FORMATS.get(request.mimetype)
+    if fmt is not None and fmt not in IMPORT_FORMATS.values():
+        return jsonify({'error': 'format must be csv, json or jsonl'}), 400
+    # spooled to disk, so the request ends once the body is received
+    with tempfile.NamedTemporaryFile('wb', prefix='user-import-', dir=os.environ.get('AUTH_IMPORT_DIR'),
+                                     delete=False) as f:
+        shutil.copyfileobj(request.stream, f, 1 << 20)
+    job_id = uuid.uuid4().hex
+    with get_db() as db:
+        db.execute("INSERT INTO import_jobs (id, status) VALUES (?, 'queued')", (job_id,))
+    import_jobs.submit(_run_import, job_id, f.name, fmt)
+    response = jsonify({'job': job_id, 'status': 'queued'})
+    response.headers['Location'] = f'/users/import/{job_id}'
+    return response, 202
+
+@app.route('/users/import/<job_id>', methods=['GET'])
+def bulk_import_status(job_id):
+    """Status of an import: queued, running (with counts so far), done or failed; rejected rows once finished."""
+    if not _is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    with get_db() as db:
+        job = db.execute('SELECT id, status, stats, problems, error, created_at, finished_at FROM import_jobs '
+                         'WHERE id = ?', (job_id,)).fetchone()
+    if job is None:
+        return jsonify({'error': 'Import job not found'}), 404
+    return jsonify({'job': job['id'], 'status': job['status'], **(json.loads(job['stats']) if job['stats'] else {}),
+                    'problems': json.loads(job['problems'] or '[]'), 'error': job['error'],
+                    'created_at': job['created_at'], 'finished_at': job['finished_at']})
+
+@app.route('/users/export', methods=['GET'])
+def bulk_export():
+    if not _is_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    fmt = request.args.get('format', 'csv')
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({'error': 'format must be csv or jsonl'}), 400
+    chunks = export_users(get_db(), fmt, request.args.get('since'))
+    return Response(chunks, mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson')
 
 if __name__ == '__main__':
-    init_db()
+    # Development server; for production use: python serve.py auth
     app.run(port=5002, debug=True)
@@ -0,0 +1,362 @@
+# user_import.py
+# Bulk user import and export for the auth service's users table.
+#
+#   python user_import.py import coop.csv [--db users.db] [--workers 8] [--report conflicts.jsonl]
+#   python user_import.py export users.csv [--since "2024-01-01"]
+#
+# Input is CSV (header: username,password,email) or JSON - an array or one
+# object per line - and is read as a stream, batch by batch. Each batch is
+# validated and checked against existing usernames/emails before any
+# password is hashed; conflicting or invalid rows are reported per row and
+# skipped, the rest are hashed on a process pool and inserted with one
+# executemany in one transaction. Rows may carry a werkzeug `password_hash`
+# instead of a password (migrations); it is upgraded to the current policy
+# by rehash-on-login.
+#
+# Hashing dominates: at the default scrypt cost each password takes ~0.1 s of
+# CPU. It runs on one process pool per process, started by the first import
+# that needs it and reused by every later one (see hash_pool()). --hash-iterations lowers the cost for the import only; those hashes
+# are then rehashed under the full policy at each user's first login.
+
+import argparse
+import csv
+import io
+import json
+import multiprocessing
+import os
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+BATCH_SIZE = 5000
+HASH_CHUNK = 64  # passwords per process-pool task
+_IN_CHUNK = 500  # parameters per IN (...) query
+EXPORT_FIELDS = ('id', 'username', 'email', 'created_at')
+
+SQL_IMPORT_USER = 'INSERT INTO users (username, password_hash, email) VALUES (?, ?, ?)'
+
+
+def _iter_json_array(f, chunk_size=1 << 16):
+    # incremental decoding of a top-level JSON array, one element at a time
+    decoder = json.JSONDecoder()
+    buf, pos, started = '', 0, False
+    while True:
+        chunk = f.read(chunk_size)
+        buf = buf[pos:] + chunk
+        pos = 0
+        while True:
+            while pos < len(buf) and buf[pos] in ' \t\r\n,':
+                pos += 1
+            if not started:
+                if pos < len(buf):
+                    if buf[pos] != '[':
+                        raise ValueError('expected a JSON array')
+                    started = True
+                    pos += 1
+                continue
+            if pos < len(buf) and buf[pos] == ']':
+                return
+            try:
+                item, end = decoder.raw_decode(buf, pos)
+            except ValueError:
+                if not chunk:
+                    raise
+                break  # element continues in the next chunk
+            yield item
+            pos = end
+        if not chunk:
+            raise ValueError('unterminated JSON array')
+
+
+def read_users(f, fmt=None):
+    """Yield user dicts from a text stream of CSV, a JSON array or JSON lines."""
+    if fmt is None:
+        head = f.read(1)
+        while head and head.isspace():
+            head = f.read(1)
+        fmt = 'json' if head == '[' else 'jsonl' if head == '{' else 'csv'
+        f = _Prefixed(head, f)
+    if fmt == 'csv':
+        yield from csv.DictReader(f)
+    elif fmt == 'json':
+        yield from _iter_json_array(f)
+    else:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class _Prefixed:
+    # a text stream with already consumed characters put back in front
+    def __init__(self, prefix, f):
+        self.prefix, self.f = prefix, f
+
+    def read(self, size=-1):
+        prefix, self.prefix = self.prefix, ''
+        if size is None or size < 0:
+            return prefix + self.f.read()
+        return prefix + self.f.read(max(0, size - len(prefix))) if size > len(prefix) else prefix
+
+    def readline(self):
+        prefix, self.prefix = self.prefix, ''
+        return prefix + self.f.readline() if not prefix.endswith('\n') else prefix
+
+    def __iter__(self):
+        while True:
+            line = self.readline()
+            if not line:
+                return
+            yield line
+
+
+def _batches(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _is_werkzeug_hash(value):
+    return value.count('$') == 2 and value.split(':', 1)[0] in ('scrypt', 'pbkdf2')
+
+
+_hash_pool = None
+_hash_pool_lock = threading.Lock()
+
+
+def hash_pool(workers=None):
+    """The process pool passwords are hashed on, shared by all imports in this process.
+
+    Started on first use, so pre-hashed imports never pay for it; spawned,
+    since forking a threaded server is unsafe. `workers` only applies to the
+    call that starts it.
+    """
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is None:
+            _hash_pool = ProcessPoolExecutor(max_workers=workers or os.cpu_count(),
+                                             mp_context=multiprocessing.get_context('spawn'))
+        return _hash_pool
+
+
+def _drop_hash_pool(pool):
+    # a worker died: the next import starts a fresh pool
+    global _hash_pool
+    with _hash_pool_lock:
+        if _hash_pool is pool:
+            _hash_pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _hash_chunk(method, passwords):
+    from werkzeug.security import generate_password_hash
+    return [generate_password_hash(p, method) for p in passwords]
+
+
+def _existing(db, column, values):
+    found = set()
+    values = list(values)
+    for start in range(0, len(values), _IN_CHUNK):
+        part = values[start:start + _IN_CHUNK]
+        marks = ','.join('?' * len(part))
+        found.update(r[0] for r in db.execute(f'SELECT {column} FROM users WHERE {column} IN ({marks})', part))
+    return found
+
+
+def _validate(batch, first_row, seen_usernames, seen_emails):
+    """Split a batch into insertable rows and per-row problems."""
+    rows, problems = [], []
+    for k, item in enumerate(batch):
+        row = first_row + k
+        if not isinstance(item, dict):
+            problems.append({'row': row, 'error': 'not an object'})
+            continue
+        username = str(item.get('username') or '').strip()
+        password = item.get('password')
+        pw_hash = item.get('password_hash')
+        email = str(item.get('email') or '').strip() or None
+        if not username:
+            problems.append({'row': row, 'error': 'username required'})
+        elif not password and not (pw_hash and _is_werkzeug_hash(str(pw_hash))):
+            problems.append({'row': row, 'username': username, 'error': 'password or password_hash required'})
+        elif username in seen_usernames:
+            problems.append({'row': row, 'username': username, 'error': 'duplicate username in input'})
+        elif email is not None and email in seen_emails:
+            problems.append({'row': row, 'username': username, 'error': 'duplicate email in input'})
+        else:
+            seen_usernames.add(username)
+            if email is not None:
+                seen_emails.add(email)
+            rows.append({'row': row, 'username': username, 'email': email,
+                         'password': None if password is None else str(password),
+                         'password_hash': None if password else str(pw_hash)})
+    return rows, problems
+
+
+def _insert(db, rows):
+    """executemany in one transaction; on a conflict (a concurrent writer) retry row by row."""
+    params = [(r['username'], r['password_hash'], r['email']) for r in rows]
+    try:
+        with db:
+            db.executemany(SQL_IMPORT_USER, params)
+        return len(rows), []
+    except sqlite3.IntegrityError:
+        pass
+    inserted, problems = 0, []
+    with db:
+        db.execute('BEGIN IMMEDIATE')
+        for r, p in zip(rows, params):
+            try:
+                db.execute('SAVEPOINT import_row')
+                db.execute(SQL_IMPORT_USER, p)
+                db.execute('RELEASE import_row')
+                inserted += 1
+            except sqlite3.IntegrityError as e:
+                db.execute('ROLLBACK TO import_row')
+                db.execute('RELEASE import_row')
+                problems.append({'row': r['row'], 'username': r['username'], 'error': str(e)})
+    return inserted, problems
+
+
+def import_users(db, users, method, workers=None, batch_size=BATCH_SIZE, on_problem=None, on_batch=None):
+    """Insert users from an iterable of dicts; returns counts.
+
+    Each rejected row is passed to on_problem({'row', 'username', 'error'});
+    on_batch(stats) runs after every committed batch.
+    """
+    stats = {'read': 0, 'imported': 0, 'rejected': 0, 'hashed': 0}
+    seen_usernames, seen_emails = set(), set()
+    report = on_problem or (lambda problem: None)
+    for batch in _batches(users, batch_size):
+        rows, problems = _validate(batch, stats['read'] + 1, seen_usernames, seen_emails)
+        stats['read'] += len(batch)
+        taken_names = _existing(db, 'username', [r['username'] for r in rows])
+        taken_emails = _existing(db, 'email', [r['email'] for r in rows if r['email']])
+        fresh = []
+        for r in rows:
+            if r['username'] in taken_names:
+                problems.append({'row': r['row'], 'username': r['username'], 'error': 'username already exists'})
+            elif r['email'] in taken_emails:
+                problems.append({'row': r['row'], 'username': r['username'], 'error': 'email already exists'})
+            else:
+                fresh.append(r)
+        # only rows that will be inserted are hashed
+        plain = [r for r in fresh if r['password_hash'] is None]
+        if plain:
+            pool = hash_pool(workers)
+            chunks = [[r['password'] for r in plain[i:i + HASH_CHUNK]]
+                      for i in range(0, len(plain), HASH_CHUNK)]
+            try:
+                hashes = [h for part in pool.map(_hash_chunk, [method] * len(chunks), chunks) for h in part]
+            except BrokenProcessPool:
+                _drop_hash_pool(pool)
+                raise
+            for r, h in zip(plain, hashes):
+                r['password_hash'] = h
+            stats['hashed'] += len(plain)
+        inserted, conflicts = _insert(db, fresh)
+        problems.extend(conflicts)
+        stats['imported'] += inserted
+        stats['rejected'] += len(problems)
+        for problem in sorted(problems, key=lambda p: p['row']):
+            report(problem)
+        if on_batch is not None:
+            on_batch(stats)
+    return stats
+
+
+def export_users(db, fmt='csv', since=None, chunk_rows=1000):
+    """Yield the users table as CSV or JSON-lines text chunks, in created_at order."""
+    sql = f"SELECT {', '.join(EXPORT_FIELDS)} FROM users"
+    params = ()
+    if since:
+        sql += ' WHERE created_at >= ?'
+        params = (since,)
+    cursor = db.execute(sql + ' ORDER BY created_at, id', params)
+    if fmt == 'csv':
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(EXPORT_FIELDS)
+    while True:
+        rows = cursor.fetchmany(chunk_rows)
+        if not rows:
+            break
+        if fmt == 'csv':
+            writer.writerows(tuple(r) for r in rows)
+            yield out.getvalue()
+            out.seek(0)
+            out.truncate()
+        else:
+            yield ''.join(json.dumps(dict(zip(EXPORT_FIELDS, r))) + '\n' for r in rows)
+    if fmt == 'csv' and out.tell():
+        yield out.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Bulk import or export auth service users')
+    sub = parser.add_subparsers(dest='command', required=True)
+    imp = sub.add_parser('import', help='import users from CSV or JSON (- for stdin)')
+    imp.add_argument('path')
+    imp.add_argument('--format', choices=('csv', 'json', 'jsonl'), help='default: detected from the content')
+    imp.add_argument('--workers', type=int, default=0, help='hashing processes (default: all CPUs)')
+    imp.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+    imp.add_argument('--hash-iterations', type=int,
+                     help='cost for imported hashes, upgraded to the policy at first login')
+    imp.add_argument('--report', help='write rejected rows as JSON lines to this file')
+    exp = sub.add_parser('export', help='export users as CSV or JSON lines (- for stdout)')
+    exp.add_argument('path')
+    exp.add_argument('--format', choices=('csv', 'jsonl'), default='csv')
+    exp.add_argument('--since', help='only users created at or after this timestamp')
+    for p in (imp, exp):
+        p.add_argument('--db', help='database file (default: AUTH_DB_PATH or users.db)')
+    args = parser.parse_args()
+
+    if args.db:
+        os.environ['AUTH_DB_PATH'] = args.db
+    # the app module owns the schema, connection settings and hash policy
+    import user_auth_backend as auth
+    from password_hasher import policy_method
+    db = auth.get_db()
+
+    if args.command == 'export':
+        out = sys.stdout if args.path == '-' else open(args.path, 'w', newline='')
+        with out:
+            for chunk in export_users(db, args.format, args.since):
+                out.write(chunk)
+        return
+
+    method = auth.hasher.method
+    if args.hash_iterations:
+        method = policy_method(method.split(':', 1)[0], args.hash_iterations)
+    report = open(args.report, 'w') if args.report else None
+    start = time.perf_counter()
+
+    def on_problem(problem):
+        if report is not None:
+            report.write(json.dumps(problem) + '\n')
+
+    def on_batch(stats):
+        elapsed = time.perf_counter() - start
+        print(f"{stats['read']} read, {stats['imported']} imported, {stats['rejected']} rejected "
+              f"({stats['read'] / elapsed:.0f} rows/s)", file=sys.stderr)
+
+    src = sys.stdin if args.path == '-' else open(args.path, newline='', encoding='utf-8')
+    try:
+        stats = import_users(db, read_users(src, args.format), method, args.workers or None,
+                             args.batch_size, on_problem, on_batch)
+    finally:
+        src.close()
+        if report is not None:
+            report.close()
+    print(json.dumps(dict(stats, seconds=round(time.perf_counter() - start, 2))))
+
+
+if __name__ == '__main__':
+    main()